@@ -1,80 +1,636 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Dict, List, Optional, Any
-from core.preprocessing import DataPreprocessor
-from core.diagnosis import HybridDiagnosisEngine
-from core.clustering import UserClustering
-from core.prescription import PrescriptionEngine
-from core.feedback import OptimizationLoop
+import time
+_IMPORT_START = time.perf_counter()
 
-app = FastAPI(title="Nori Care AI Engine", version="1.0.0")
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, conint
+from typing import Dict, List, Literal, Optional, Any, Tuple
+# Only light modules here: the engines (numpy, sklearn, joblib, model
+# pickles, exercises.json) are imported by their LazyComponent factories below
+from core.executor import InferenceExecutor, ExecutorSaturatedError
+from core.batching import DiagnosisBatcher
+from core.cache import ResultCache, canonical_hash
+from core.lazy import LazyComponent, component_name, is_loaded, resolve
+from core.metrics import MetricsMiddleware, metrics
+from core.persistence import WriteBehindWriter
 
 # --- DTO Models ---
 class PHRData(BaseModel):
     age: int
     gender: str
     sppb: float
-    tug: float
+    tug: Optional[float] = None         # missing: imputed from the other features
     conditions: List[str] = []
-    history: List[float] = []
+    history: List[float] = []           # legacy: full series, re-sent every time
+    new_point: Optional[float] = None   # latest assessment, folded into the stored trend
+    measured_at: Optional[datetime] = None  # when new_point was measured; applied once per time
 
 class FeedbackData(BaseModel):
     prescription_id: str
     rpe: int
     has_pain: bool
     satisfaction: int
+    group: Optional[str] = None         # user group (e.g. "Frail"), refines the optimizer
 
 class PrescriptionRequest(BaseModel):
     user_id: str
     phr_data: PHRData
+    # Prescription mode (default NORICARE_PRESCRIPTION_MODE); the budgets apply to "optimized"
+    mode: Optional[Literal["ranked", "optimized"]] = None
+    session_minutes: Optional[conint(ge=1, le=240)] = None
+    max_total_intensity: Optional[conint(ge=1, le=100)] = None
 
-# --- Dependency Injection (Mock) ---
-preprocessor = DataPreprocessor()
-diagnosis_engine = HybridDiagnosisEngine()
-clustering = UserClustering()
-rx_engine = PrescriptionEngine()
-optimizer = OptimizationLoop()
+class FeedbackLogEvent(BaseModel):
+    """One FeedbackLog row (packages/database/schema.prisma)."""
+    id: Optional[str] = None
+    seniorId: str
+    prescriptionId: Optional[str] = None
+    loggedAt: datetime
+    hasPain: bool = False
+    painRegion: Optional[str] = None
+    rpeScore: int
+    satisfaction: int
+    completed: bool = True
+
+class FeedbackBatch(BaseModel):
+    events: List[FeedbackLogEvent]
+    intensities: Dict[str, int] = {}   # prescriptionId -> current intensity, for exercises not seen yet
+    groups: Dict[str, str] = {}        # seniorId -> user group (e.g. "Frail")
+
+# --- Dependency Injection ---
+# Built on first use, or by the warm-up at startup (NORICARE_WARMUP)
+def _make_preprocessor():
+    from core.preprocessing import DataPreprocessor
+    return DataPreprocessor()
+
+def _make_diagnosis_engine():
+    from core.diagnosis import HybridDiagnosisEngine
+    return HybridDiagnosisEngine()
+
+def _make_clustering():
+    from core.clustering import UserClustering
+    return UserClustering()
+
+def _make_rx_engine():
+    from core.prescription import PrescriptionEngine
+    return PrescriptionEngine()
+
+def _make_optimizer():
+    from core.feedback import OptimizationLoop
+    return OptimizationLoop()
+
+def _make_feedback_store():
+    from core.feedback import FeedbackStateStore
+    return FeedbackStateStore.from_env(resolve(optimizer))
+
+def _make_trend_store():
+    from core.trends import TrendStore
+    return TrendStore.from_env()
+
+def _make_cohort_analytics():
+    from core.analytics import CohortAnalytics
+    return CohortAnalytics.from_env()
+
+preprocessor = LazyComponent("preprocessor", _make_preprocessor)
+diagnosis_engine = LazyComponent("diagnosis_engine", _make_diagnosis_engine)
+clustering = LazyComponent("clustering", _make_clustering)
+rx_engine = LazyComponent("rx_engine", _make_rx_engine)
+optimizer = LazyComponent("optimizer", _make_optimizer)
+
+# Per-senior, per-exercise intensity state fed by FeedbackLog syncs (NORICARE_FEEDBACK_SNAPSHOT)
+feedback_store = LazyComponent("feedback_store", _make_feedback_store)
+
+# Deterministic pipeline results keyed by normalized PHR payload + model/catalog version
+result_cache = ResultCache.from_env()
+
+# Per-senior rolling trend statistics, persisted in SQLite (NORICARE_TREND_DB)
+trend_store = LazyComponent("trend_store", _make_trend_store)
+
+# HealthAssessment history for population analytics (NORICARE_ANALYTICS_DB);
+# not part of the warm-up, the table is read on the first analytics call
+cohort_analytics = LazyComponent("cohort_analytics", _make_cohort_analytics)
+
+# Write-behind persistence of prescriptions and feedback (NORICARE_DB_URL); None when disabled
+persistence = WriteBehindWriter.from_env()
+
+COMPONENTS = (preprocessor, diagnosis_engine, clustering, rx_engine, optimizer, feedback_store, trend_store)
+
+# Model inference runs here, not on the event loop or FastAPI's shared threadpool
+inference_pool = InferenceExecutor.from_env()
+
+def _analyze_batch(profiles: List[Dict], health_metrics: List[Dict], model_version: str) -> List[Dict[str, Any]]:
+    """
+    Inference job (module-level so it can also run in a process pool).
+    Pool worker processes pick up a hot reload the first time they see a new version.
+    """
+    diagnosis_engine.refresh_models(model_version)
+    return diagnosis_engine.analyze_risk_factors_batch(profiles, health_metrics)
+
+async def _run_analysis_batch(profiles: List[Dict], health_metrics: List[Dict]) -> List[Dict[str, Any]]:
+    # Includes queueing for a pool worker; the model stages are timed inside the engine
+    with metrics.timer("api.inference"):
+        return await inference_pool.run(
+            _analyze_batch, profiles, health_metrics, diagnosis_engine.model_version
+        )
+
+def _fine_tune(current_prescription: Dict[str, Any], feedback: Dict[str, Any], model_version: str) -> Dict[str, Any]:
+    """
+    Inference job for /optimize/feedback (MLP forward pass). Like
+    _analyze_batch, a pool worker process reloads first if the parent
+    serves another version (mlp_optimizer.pkl is part of it).
+    """
+    diagnosis_engine.refresh_models(model_version)
+    optimized = optimizer.fine_tune_prescription(current_prescription, feedback)
+    return {**optimized, "model_version": diagnosis_engine.model_version}
+
+# Optional micro-batching of concurrent single-user requests (NORICARE_BATCH_WINDOW_MS)
+diagnosis_batcher = DiagnosisBatcher.from_env(_run_analysis_batch)
+
+async def _analyze(profile: Dict, clean_data: Dict) -> Dict[str, Any]:
+    """Diagnose one user, coalesced with concurrent requests when batching is on."""
+    if diagnosis_batcher is not None:
+        return await diagnosis_batcher.analyze(profile, clean_data)
+    return (await _run_analysis_batch([profile], [clean_data]))[0]
+
+async def _ensure_loaded(*components):
+    """
+    Build components that are not loaded yet off the event loop. During the
+    background warm-up resolve() blocks until the warm-up thread built them;
+    on the loop that would stall every request, /ready included.
+    """
+    for component in components:
+        if not is_loaded(component):
+            await asyncio.to_thread(resolve, component)
+
+def _saturated(e: ExecutorSaturatedError) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+def _profile(req: PrescriptionRequest, trend: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    profile = {"conditions": req.phr_data.conditions, "history": req.phr_data.history}
+    if trend is not None:
+        profile["trend"] = trend
+    return profile
+
+def _prepare(req: PrescriptionRequest, trend: Optional[Dict[str, Any]]):
+    """Preprocessing step: (user_profile, clean health metrics)."""
+    with metrics.timer("preprocessing.normalize"):
+        clean_data = preprocessor.normalize(req.phr_data.model_dump())
+    return _profile(req, trend), clean_data
+
+def _prepare_batch(reqs: List[PrescriptionRequest], trends: List[Optional[Dict[str, Any]]]):
+    """Columnar preprocessing for many requests: (user_profiles, clean health metrics)."""
+    with metrics.timer("preprocessing.normalize_batch"):
+        records = [req.phr_data.model_dump() for req in reqs]
+        columns = preprocessor.records_to_columns(records, ("age", "sppb", "tug"))
+        clean_batch = preprocessor.split_batch(preprocessor.normalize_batch(columns), records)
+    profiles = [_profile(req, trend) for req, trend in zip(reqs, trends)]
+    return profiles, clean_batch
+
+def _utc_iso(moment: datetime) -> str:
+    """Naive UTC ISO string (sortable as text)."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.isoformat()
+
+def _trend_points(reqs: List[PrescriptionRequest]) -> List[Tuple[str, float, Optional[str]]]:
+    """(user_id, new_point, measured_at) of the requests that send a new point."""
+    return [
+        (req.user_id, req.phr_data.new_point,
+         _utc_iso(req.phr_data.measured_at) if req.phr_data.measured_at else None)
+        for req in reqs if req.phr_data.new_point is not None
+    ]
+
+def _preview_trends(reqs: List[PrescriptionRequest]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Trend summaries with each request's new_point folded in, without
+    storing it yet (see _record_trends). Requests that still send a full
+    `history` get None: the engine derives the trend from the list.
+    Blocks on SQLite: handlers run it with asyncio.to_thread.
+    """
+    with metrics.timer("trends.preview"):
+        points = _trend_points(reqs)
+        previewed = iter(trend_store.preview_many(points) if points else ())
+        trends = []
+        for req in reqs:
+            if req.phr_data.new_point is not None:
+                state = next(previewed)
+            elif req.phr_data.history:
+                state = None
+            else:
+                state = trend_store.get(req.user_id)
+            trends.append(state.summary() if state is not None else None)
+    return trends
+
+def _record_trends(reqs: List[PrescriptionRequest]):
+    """
+    Store the requests' new points (one transaction) once their response
+    is ready: a request that failed leaves the trend unchanged, so its
+    retry is not counted twice even without measured_at.
+    """
+    points = _trend_points(reqs)
+    if points:
+        with metrics.timer("trends.update"):
+            trend_store.update_many(points)
+
+def _cache_key(req: PrescriptionRequest, trend: Optional[Dict[str, Any]]) -> str:
+    """
+    Canonical key for a PHR payload plus the senior's current trend.
+    Condition order does not change the output, so it is normalized;
+    new_point and measured_at are already reflected in the trend.
+    Versions are tracked by result_cache itself. Optimized prescriptions
+    vary per user, so they are keyed by user_id and the budgets as well.
+    """
+    payload = req.phr_data.model_dump()
+    payload["conditions"] = sorted(payload["conditions"])
+    payload.pop("new_point", None)
+    payload.pop("measured_at", None)
+    payload["trend"] = trend
+    if _is_optimized(req):
+        payload["optimized"] = [req.user_id, req.session_minutes, req.max_total_intensity]
+    return canonical_hash(payload)
+
+def _is_optimized(req: PrescriptionRequest) -> bool:
+    return (req.mode or rx_engine.mode) == "optimized"
+
+def _sync_cache_versions() -> int:
+    """Drop cached results when models or exercises.json were reloaded; returns the catalog version."""
+    rx_engine.check_catalog()
+    catalog_version = rx_engine.catalog_version
+    result_cache.bind_versions((diagnosis_engine.model_version, catalog_version))
+    return catalog_version
+
+def _build_result(req: PrescriptionRequest, analysis: Dict[str, Any], user_group: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Segmentation + prescription for one analyzed user (cacheable, no user_id;
+    the optimized mode uses it only as variety key, see _cache_key).
+    Batch callers pass the user_group computed for the whole batch.
+    """
+    if user_group is None:
+        with metrics.timer("clustering.segment_user"):
+            user_group = clustering.segment_user(analysis)
+    with metrics.timer("prescription.generate_prescription"):
+        exercises = rx_engine.generate_prescription(
+            user_group, req.phr_data.conditions,
+            mode=req.mode,
+            session_minutes=req.session_minutes,
+            max_total_intensity=req.max_total_intensity,
+            variety_key=req.user_id
+        )
+    return {
+        "group": user_group,
+        "analysis": analysis,
+        "prescription": exercises,
+        "model_version": analysis["model_version"]
+    }
+
+def _build_results(
+    reqs: List[PrescriptionRequest],
+    analyses: List[Dict[str, Any]],
+    user_groups: List[Optional[str]]
+) -> List[Dict[str, Any]]:
+    """_build_result for several users (inference job, module-level like _analyze_batch)."""
+    return [_build_result(req, analysis, user_group) for req, analysis, user_group in zip(reqs, analyses, user_groups)]
+
+async def _build(
+    reqs: List[PrescriptionRequest],
+    analyses: List[Dict[str, Any]],
+    user_groups: List[Optional[str]]
+) -> List[Dict[str, Any]]:
+    """
+    Build results on the event loop, except optimized prescriptions: their
+    knapsack DP is CPU-bound, so those go to the inference pool as one job.
+    """
+    results = [None] * len(reqs)
+    optimized = [i for i, req in enumerate(reqs) if _is_optimized(req)]
+    if optimized:
+        built = await inference_pool.run(
+            _build_results,
+            [reqs[i] for i in optimized], [analyses[i] for i in optimized], [user_groups[i] for i in optimized]
+        )
+        for i, result in zip(optimized, built):
+            results[i] = result
+    for i, req in enumerate(reqs):
+        if results[i] is None:
+            results[i] = _build_result(req, analyses[i], user_groups[i])
+    return results
+
+def _persist_prescription(user_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Queue the prescription rows and tag each exercise with its prescriptionId.
+    Works on copies: result may be shared through the cache.
+    """
+    if persistence is None:
+        return {"user_id": user_id, **result}
+    ids = persistence.record_prescriptions(user_id, result["prescription"])
+    exercises = [{**exercise, "prescriptionId": row_id} for exercise, row_id in zip(result["prescription"], ids)]
+    return {"user_id": user_id, **result, "prescription": exercises}
+
+def _observe_parse(request: Request):
+    """Routing + body read + pydantic validation: middleware entry to handler entry."""
+    start = getattr(request.state, "request_start", None)
+    if start is not None:
+        metrics.observe_stage("api.request_parse", time.perf_counter() - start)
+
+def _collect_component_stats():
+    """Cache / batcher / inference pool / model stats, read at scrape time."""
+    cache = result_cache.stats()
+    yield ("noricare_cache_requests_total", "counter", "Result cache lookups by outcome", [
+        ("noricare_cache_requests_total", {"result": "hit"}, cache["hits"]),
+        ("noricare_cache_requests_total", {"result": "miss"}, cache["misses"]),
+    ])
+    yield ("noricare_cache_entries", "gauge", "Entries in the result cache", [
+        ("noricare_cache_entries", {}, cache["entries"]),
+    ])
+    yield ("noricare_cache_evictions_total", "counter", "LRU evictions from the result cache", [
+        ("noricare_cache_evictions_total", {}, cache["evictions"]),
+    ])
+    yield ("noricare_cache_invalidations_total", "counter", "Result cache flushes (model/catalog reloads)", [
+        ("noricare_cache_invalidations_total", {}, cache["invalidations"]),
+    ])
+
+    pool = inference_pool.stats()
+    yield ("noricare_inference_in_flight", "gauge", "Inference jobs running or queued", [
+        ("noricare_inference_in_flight", {}, pool["in_flight"]),
+    ])
+    yield ("noricare_inference_jobs_total", "counter", "Inference jobs by outcome", [
+        ("noricare_inference_jobs_total", {"outcome": "completed"}, pool["completed"]),
+        ("noricare_inference_jobs_total", {"outcome": "rejected"}, pool["rejected"]),
+    ])
+
+    if diagnosis_batcher is not None:
+        batch = diagnosis_batcher.stats()
+        yield ("noricare_batcher_batches_total", "counter", "Micro-batches flushed", [
+            ("noricare_batcher_batches_total", {}, batch["batches"]),
+        ])
+        yield ("noricare_batcher_items_total", "counter", "Requests coalesced into micro-batches", [
+            ("noricare_batcher_items_total", {}, batch["items"]),
+        ])
+        yield ("noricare_batcher_max_batch_size", "gauge", "Largest micro-batch so far", [
+            ("noricare_batcher_max_batch_size", {}, batch["max_batch_seen"]),
+        ])
+
+    if persistence is not None:
+        writes = persistence.stats()
+        yield ("noricare_db_queued_rows", "gauge", "Rows waiting in the write-behind queue", [
+            ("noricare_db_queued_rows", {}, writes["queued"]),
+        ])
+        yield ("noricare_db_rows_total", "counter", "Rows handed to the write-behind queue by outcome", [
+            ("noricare_db_rows_total", {"outcome": "written"}, writes["written"]),
+            ("noricare_db_rows_total", {"outcome": "dropped"}, writes["dropped"]),
+            ("noricare_db_rows_total", {"outcome": "failed"}, writes["failed"]),
+        ])
+        yield ("noricare_db_flushes_total", "counter", "Write-behind transactions committed", [
+            ("noricare_db_flushes_total", {}, writes["flushes"]),
+        ])
+
+    if is_loaded(diagnosis_engine):   # a scrape must not trigger model loading
+        yield ("noricare_model_info", "gauge", "Model version being served", [
+            ("noricare_model_info", {"version": diagnosis_engine.model_version}, 1),
+        ])
+
+metrics.register_collector(_collect_component_stats)
+
+# --- Startup ---
+# NORICARE_WARMUP: "background" (default) builds the components in a thread
+# once the server is up, so liveness answers at once and /ready turns 200
+# when warm; "startup" warms up before the server accepts requests; "lazy"
+# skips the warm-up and the first requests pay the loading cost.
+WARMUP_MODES = ("background", "startup", "lazy")
+
+_warmup_done = threading.Event()
+_warmup_error: Optional[str] = None
+_ready_after_s: Optional[float] = None   # module import -> warm, in seconds
+
+def _mark_ready(error: Optional[str] = None):
+    global _warmup_error, _ready_after_s
+    _warmup_error = error
+    _ready_after_s = time.perf_counter() - _IMPORT_START
+    _warmup_done.set()
+
+def warm_up():
+    """Build every component and run one diagnosis, so no request pays a cold start."""
+    try:
+        for component in COMPONENTS:
+            resolve(component)
+        engine = resolve(diagnosis_engine)
+        engine.analyze_risk_factors_batch([dict(engine.SMOKE_PROFILE)], [dict(engine.SMOKE_METRICS)])
+    except Exception as e:
+        print(f"[AI Engine] Warm-up failed: {e}")
+        _mark_ready(error=str(e))
+        return
+    _mark_ready()
+    print(f"[AI Engine] Ready {_ready_after_s:.2f}s after import")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    mode = os.environ.get("NORICARE_WARMUP", "background")
+    if mode not in WARMUP_MODES:
+        raise ValueError(f"NORICARE_WARMUP must be one of {', '.join(WARMUP_MODES)}, got {mode!r}")
+    if mode == "startup":
+        await asyncio.to_thread(warm_up)
+    elif mode == "background":
+        threading.Thread(target=warm_up, name="noricare-warmup", daemon=True).start()
+    else:
+        _mark_ready()
+
+    yield
+
+    inference_pool.shutdown(wait=False)
+    if persistence is not None:
+        persistence.close()   # writes out what is still queued
+    # Close only what was actually opened
+    for store in (trend_store, feedback_store):
+        if is_loaded(store):
+            store.close()
+
+app = FastAPI(title="Nori Care AI Engine", version="1.0.0", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+
+_reload_lock = asyncio.Lock()
+
+def _check_admin_token(token: Optional[str]):
+    """Admin routes require X-Admin-Token when NORICARE_ADMIN_TOKEN is set."""
+    expected = os.environ.get("NORICARE_ADMIN_TOKEN")
+    if expected and token != expected:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
 
 @app.get("/")
 def health_check():
-    return {"status": "healthy", "service": "Nori Care AI"}
+    """Liveness: answers without loading anything (model_version is null until loaded)."""
+    model_version = diagnosis_engine.model_version if is_loaded(diagnosis_engine) else None
+    return {"status": "healthy", "service": "Nori Care AI", "model_version": model_version}
+
+@app.get("/ready")
+def readiness():
+    """Readiness: 200 once the warm-up finished (models, catalog and stores loaded), 503 before."""
+    ready = _warmup_done.is_set() and _warmup_error is None
+    body = {
+        "ready": ready,
+        "components": {component_name(c): is_loaded(c) for c in COMPONENTS},
+        "startup_s": _ready_after_s
+    }
+    if _warmup_error is not None:
+        body["error"] = _warmup_error
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus-style metrics: stage histograms, model paths, cache/batch/pool stats."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/admin/models/reload")
+async def reload_models(x_admin_token: Optional[str] = Header(None)):
+    """
+    Hot-swap models retrained with train_models.py: load in the background,
+    validate on a smoke input, then swap atomically. In-flight requests
+    finish on the previous version; the old models stay live if validation fails.
+    """
+    _check_admin_token(x_admin_token)
+    await _ensure_loaded(diagnosis_engine)
+    async with _reload_lock:
+        previous = diagnosis_engine.model_version
+        try:
+            version = await asyncio.to_thread(diagnosis_engine.reload_models)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Model reload failed, still serving {previous}: {e}")
+    return {"previous_version": previous, "model_version": version, "reloaded": version != previous}
 
 @app.post("/diagnose/prescription")
-def generate_prescription(req: PrescriptionRequest):
+async def generate_prescription(req: PrescriptionRequest, request: Request):
     """
     Main pipeline: Ingestion -> Diagnosis -> Segmentation -> Prescription
     """
+    _observe_parse(request)
     try:
-        # 1. Preprocessing
-        raw_data = req.phr_data.dict()
-        clean_data = preprocessor.normalize(raw_data)
-        
-        # 2. Diagnosis & Clustering
-        analysis = diagnosis_engine.analyze_risk_factors(
-            user_profile={"conditions": req.phr_data.conditions, "history": req.phr_data.history}, 
-            health_metrics=clean_data
-        )
-        user_group = clustering.segment_user(analysis)
-        
-        # 3. Prescription
-        exercises = rx_engine.generate_prescription(user_group, req.phr_data.conditions)
-        
-        return {
-            "user_id": req.user_id,
-            "group": user_group,
-            "analysis": analysis,
-            "prescription": exercises
-        }
+        await _ensure_loaded(preprocessor, diagnosis_engine, clustering, rx_engine)
+        catalog_version = _sync_cache_versions()
+        trend = (await asyncio.to_thread(_preview_trends, [req]))[0]
+        key = _cache_key(req, trend)
+        result = result_cache.get(key)
+
+        if result is None:
+            # 1. Preprocessing
+            profile, clean_data = _prepare(req, trend)
+
+            # 2. Diagnosis (inference pool) & Clustering
+            analysis = await _analyze(profile, clean_data)
+
+            # 3. Prescription
+            result = (await _build([req], [analysis], [None]))[0]
+            result_cache.put(key, result, (result["model_version"], catalog_version))
+
+        await asyncio.to_thread(_record_trends, [req])
+        return _persist_prescription(req.user_id, result)
+    except ExecutorSaturatedError as e:
+        raise _saturated(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/diagnose/prescription/batch")
+async def generate_prescription_batch(reqs: List[PrescriptionRequest], request: Request):
+    """
+    Batch pipeline for many seniors (e.g. nightly roster re-assessment).
+    Diagnosis runs once over a single feature matrix for the whole batch.
+    """
+    _observe_parse(request)
+    try:
+        await _ensure_loaded(preprocessor, diagnosis_engine, clustering, rx_engine)
+        catalog_version = _sync_cache_versions()
+        trends = await asyncio.to_thread(_preview_trends, reqs)
+        keys = [_cache_key(req, trend) for req, trend in zip(reqs, trends)]
+        results = [result_cache.get(key) for key in keys]
+        misses = [i for i, result in enumerate(results) if result is None]
+
+        if misses:
+            # 1. Preprocessing (columnar, one pass for the whole batch)
+            profiles, clean_batch = _prepare_batch([reqs[i] for i in misses], [trends[i] for i in misses])
+
+            # 2. Diagnosis (vectorized, inference pool)
+            analyses = await _run_analysis_batch(profiles, clean_batch)
+
+            # 3. Clustering (one vectorized pass) & Prescription
+            with metrics.timer("clustering.segment_users"):
+                groups = clustering.segment_analyses(analyses)
+            built = await _build([reqs[i] for i in misses], analyses, groups)
+            for i, result in zip(misses, built):
+                results[i] = result
+                result_cache.put(keys[i], result, (result["model_version"], catalog_version))
+
+        await asyncio.to_thread(_record_trends, reqs)
+        return [_persist_prescription(req.user_id, result) for req, result in zip(reqs, results)]
+    except ExecutorSaturatedError as e:
+        raise _saturated(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/optimize/feedback")
-def optimize_routine(current_prescription: Dict[str, Any], feedback: FeedbackData):
+async def optimize_routine(current_prescription: Dict[str, Any], feedback: FeedbackData):
     """
     Optimization Loop: Adjusts intensity based on feedback
     """
     try:
-        new_rx = optimizer.fine_tune_prescription(current_prescription, feedback.dict())
-        return new_rx
+        await _ensure_loaded(diagnosis_engine, optimizer)
+        return await inference_pool.run(
+            _fine_tune, current_prescription, feedback.model_dump(), diagnosis_engine.model_version
+        )
+    except ExecutorSaturatedError as e:
+        raise _saturated(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _event_dict(event: FeedbackLogEvent) -> Dict[str, Any]:
+    """FeedbackLog event as a dict, loggedAt as a sortable UTC ISO string."""
+    return {**event.model_dump(), "loggedAt": _utc_iso(event.loggedAt)}
+
+@app.post("/optimize/feedback/batch")
+async def ingest_feedback(batch: FeedbackBatch, request: Request):
+    """
+    Bulk feedback ingestion (e.g. end-of-day tablet sync): FeedbackLog events
+    update each senior's per-exercise intensity in one pass. Re-sent events
+    are skipped (by id); late ones are still applied. Returns the updated
+    exercise states.
+    """
+    _observe_parse(request)
+    try:
+        await _ensure_loaded(feedback_store)
+        events = [_event_dict(event) for event in batch.events]
+        if persistence is not None:
+            persistence.record_feedback(events)
+        with metrics.timer("feedback.ingest"):
+            return await asyncio.to_thread(feedback_store.ingest, events, batch.intensities, batch.groups)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/optimize/state/{senior_id}")
+def feedback_state(senior_id: str):
+    """Current per-exercise intensity state of one senior."""
+    return {"seniorId": senior_id, "exercises": feedback_store.senior_state(senior_id)}
+
+def _assessment_store():
+    try:
+        return cohort_analytics.store()
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/analytics/cohort")
+def cohort_report():
+    """
+    Population analytics over HealthAssessment history: cohort percentiles of
+    the latest SPPB/TUG/gait, trend directions and group transitions.
+    """
+    store = _assessment_store()
+    with metrics.timer("analytics.cohort_summary"):
+        return store.cohort_summary()
+
+@app.get("/analytics/senior/{senior_id}")
+def senior_analytics(senior_id: str):
+    """One senior's assessment series, per-metric trends and groups over time."""
+    report = _assessment_store().senior_report(senior_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"No assessments for senior {senior_id}")
+    return report
@@ -0,0 +1,516 @@
+"""
+Noricare AI Engine - Latency / Throughput Benchmark
+
+Measures per-stage latency distributions (p50/p95/p99) and rows/sec for
+the pipeline stages at several batch sizes, plus an in-process HTTP load
+test of api.py and the service's cold start (import -> ready). Inputs
+are synthetic seniors resampled from senior_walking_data.csv.
+
+Usage:
+    python benchmark.py                          # full run, prints a table
+    python benchmark.py --quick                  # fewer iterations
+    python benchmark.py --output results.json    # write JSON results
+    python benchmark.py --baseline results.json  # compare, exit 1 on regression
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'senior_walking_data.csv')
+
+BATCH_SIZES = (1, 64, 4096)
+CONDITIONS = ["Hypertension", "Diabetes", "Arthritis", "Osteoporosis", "Heart Disease", "Back Pain"]
+
+
+# ---------------------------------------------------------------------------
+# Synthetic inputs
+# ---------------------------------------------------------------------------
+
+def load_source_rows():
+    """Read the numeric columns we resample from."""
+    with open(DATA_PATH, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def make_seniors(n, rows, rng):
+    """
+    Synthetic seniors: each field is drawn from a random source row, so the
+    marginals follow the CSV while rows are not copies of real records.
+    """
+    def pick(column):
+        value = rng.choice(rows)[column]
+        return float(value) if value not in ("", None) else None
+
+    seniors = []
+    for i in range(n):
+        tug = pick('TUG_Time_s') or 15.0
+        phr = {
+            "age": rng.randint(60, 95),
+            "gender": rng.choice(["M", "F"]),
+            "sppb": float(rng.randint(0, 12)),
+            "tug": round(tug, 2),
+            "conditions": rng.sample(CONDITIONS, rng.randint(0, 2)),
+            "history": [round(rng.random(), 3) for _ in range(rng.randint(0, 6))],
+        }
+        metrics = {
+            "grip_strength": pick('Grip_Strength_kg'),
+            "gait_speed": pick('Gait_Speed_mps'),
+            "sppb_walk": pick('SPPB_Walk_Time_s'),
+            "sppb_chair": pick('SPPB_Chair_Stand_Time_s'),
+        }
+        profile = {
+            "gds_score": pick('GDS_Score'),
+            "eq_vas": pick('EQ_VAS_Score'),
+            "eq5d_mobility": pick('EQ5D_Mobility'),
+            "eq5d_selfcare": pick('EQ5D_Self_Care'),
+            "eq5d_activities": pick('EQ5D_Usual_Activities'),
+            "eq5d_pain": pick('EQ5D_Pain_Discomfort'),
+            "eq5d_anxiety": pick('EQ5D_Anxiety_Depression'),
+        }
+        seniors.append({
+            "user_id": f"bench-{i}",
+            "phr": phr,
+            "metrics": {k: v for k, v in metrics.items() if v is not None},
+            "profile": {k: v for k, v in profile.items() if v is not None},
+        })
+    return seniors
+
+
+# ---------------------------------------------------------------------------
+# Measurement helpers
+# ---------------------------------------------------------------------------
+
+def summarize(samples_s, rows_per_call):
+    """Latency percentiles (ms per call) and throughput (rows/sec)."""
+    samples = np.asarray(samples_s) * 1000.0
+    return {
+        "calls": int(len(samples)),
+        "rows_per_call": rows_per_call,
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "mean_ms": float(samples.mean()),
+        "rows_per_sec": float(rows_per_call * len(samples) / (samples.sum() / 1000.0)),
+    }
+
+
+def time_calls(fn, batches, warmup=3):
+    """Time fn(batch) for every batch (after a short warm-up)."""
+    for batch in batches[:warmup]:
+        fn(batch)
+    samples = []
+    for batch in batches:
+        start = time.perf_counter()
+        fn(batch)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def chunk(items, size, n_calls):
+    """n_calls batches of `size` items, cycling through items."""
+    batches = []
+    pos = 0
+    for _ in range(n_calls):
+        if pos + size > len(items):
+            pos = 0
+        batches.append(items[pos:pos + size])
+        pos += size
+    return batches
+
+
+def calls_for(batch_size, quick):
+    budget = 4096 * (2 if quick else 8)   # rows per stage/batch size
+    return max(10 if quick else 30, min(2000 if not quick else 300, budget // batch_size))
+
+
+# ---------------------------------------------------------------------------
+# Stage benchmarks
+# ---------------------------------------------------------------------------
+
+def bench_stages(seniors, quick):
+    from core.preprocessing import DataPreprocessor
+    from core.diagnosis import HybridDiagnosisEngine
+    from core.clustering import UserClustering
+    from core.prescription import PrescriptionEngine
+
+    preprocessor = DataPreprocessor()
+    diagnosis_engine = HybridDiagnosisEngine()
+    clustering = UserClustering()
+    rx_engine = PrescriptionEngine()
+
+    # Precompute stage inputs so each stage is timed in isolation
+    analyses = diagnosis_engine.analyze_risk_factors_batch(
+        [s["profile"] for s in seniors], [s["metrics"] for s in seniors]
+    )
+    groups = [clustering.segment_user(a) for a in analyses]
+    for s in seniors:
+        s["profile"]["conditions"] = s["phr"]["conditions"]
+        s["profile"]["history"] = s["phr"]["history"]
+
+    stages = {
+        "preprocessing.normalize": lambda batch: [
+            preprocessor.normalize(dict(s["phr"])) for s in batch
+        ],
+        "diagnosis.analyze_risk_factors": lambda batch: (
+            diagnosis_engine.analyze_risk_factors(batch[0]["profile"], batch[0]["metrics"])
+            if len(batch) == 1 else
+            diagnosis_engine.analyze_risk_factors_batch(
+                [s["profile"] for s in batch], [s["metrics"] for s in batch]
+            )
+        ),
+        "clustering.segment_user": lambda batch: (
+            clustering.segment_user(batch[0])
+            if len(batch) == 1 else
+            clustering.segment_analyses(batch)
+        ),
+        "prescription.generate_prescription": lambda batch: [
+            rx_engine.generate_prescription(group, conditions) for group, conditions in batch
+        ],
+        "prescription.optimize_prescription": lambda batch: [
+            rx_engine.optimize_prescription(group, conditions, variety_key=key) for group, conditions, key in batch
+        ],
+    }
+    inputs = {
+        "preprocessing.normalize": seniors,
+        "diagnosis.analyze_risk_factors": seniors,
+        "clustering.segment_user": analyses,
+        "prescription.generate_prescription": [
+            (group, s["phr"]["conditions"]) for group, s in zip(groups, seniors)
+        ],
+        "prescription.optimize_prescription": [
+            (group, s["phr"]["conditions"], f"senior-{i}") for i, (group, s) in enumerate(zip(groups, seniors))
+        ],
+    }
+
+    results = {}
+    for stage, fn in stages.items():
+        for size in BATCH_SIZES:
+            batches = chunk(inputs[stage], size, calls_for(size, quick))
+            results[f"{stage}[{size}]"] = summarize(time_calls(fn, batches), size)
+            print(f"  {stage:<38} batch={size:<5} "
+                  f"p50={results[f'{stage}[{size}]']['p50_ms']:.3f}ms "
+                  f"rows/s={results[f'{stage}[{size}]']['rows_per_sec']:.0f}")
+    return results
+
+
+CATALOG_SIZE = 10000
+
+def bench_large_catalog(seniors, quick, rng):
+    """Optimized prescription mode on a catalog resampled to CATALOG_SIZE exercises."""
+    from core.catalog import ExerciseCatalog
+    from core.clustering import UserClustering
+    from core.knapsack import RoutineOptimizer
+    from core.prescription import PrescriptionEngine
+
+    with open(PrescriptionEngine().exercises_path, encoding="utf-8") as f:
+        source = json.load(f)
+    exercises = []
+    for i in range(CATALOG_SIZE):
+        ex = dict(rng.choice(source))
+        ex["id"] = i + 1
+        ex["intensity"] = min(10, max(1, ex["intensity"] + rng.randint(-1, 1)))
+        ex["sets"] = rng.randint(1, 3)
+        exercises.append(ex)
+    optimizer = RoutineOptimizer(ExerciseCatalog.compile(exercises, PrescriptionEngine.CONTRAINDICATED))
+
+    def optimize(batch):
+        group, conditions, key = batch[0]
+        low, high = PrescriptionEngine.GROUP_INTENSITY_RANGES[group]
+        return optimizer.optimize(
+            (low, high), PrescriptionEngine.GROUP_TYPE_PREFERENCES[group], 8,
+            PrescriptionEngine.GROUP_SESSION_MINUTES[group], int(8 * (low + high) / 2),
+            conditions, key
+        )
+
+    stage = f"prescription.optimize[catalog={CATALOG_SIZE}]"
+    requests = [
+        (rng.choice(UserClustering.GROUPS), s["phr"]["conditions"], f"senior-{i}")
+        for i, s in enumerate(seniors)
+    ]
+    batches = chunk(requests, 1, calls_for(1, quick))
+    results = {f"{stage}[1]": summarize(time_calls(optimize, batches), 1)}
+    print(f"  {stage:<38} batch=1     p50={results[f'{stage}[1]']['p50_ms']:.3f}ms "
+          f"p99={results[f'{stage}[1]']['p99_ms']:.3f}ms")
+    return results
+
+
+# ---------------------------------------------------------------------------
+# In-process HTTP load test
+# ---------------------------------------------------------------------------
+
+class ASGIClient:
+    """Minimal in-process ASGI client (no network, no extra dependencies)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._lifespan_queue = None
+        self._lifespan_task = None
+
+    async def startup(self):
+        self._lifespan_queue = asyncio.Queue()
+        started = asyncio.get_running_loop().create_future()
+
+        async def receive():
+            return await self._lifespan_queue.get()
+
+        async def send(message):
+            if message["type"].startswith("lifespan.startup") and not started.done():
+                started.set_result(message)
+
+        await self._lifespan_queue.put({"type": "lifespan.startup"})
+        self._lifespan_task = asyncio.ensure_future(
+            self.app({"type": "lifespan", "asgi": {"version": "3.0"}}, receive, send)
+        )
+        message = await started
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"ASGI startup failed: {message}")
+
+    async def shutdown(self):
+        if self._lifespan_task is not None:
+            await self._lifespan_queue.put({"type": "lifespan.shutdown"})
+            await self._lifespan_task
+
+    async def request(self, method, path, body=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+            "query_string": b"", "root_path": "",
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(payload)).encode())],
+            "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 8000),
+        }
+        sent = False
+        status = None
+        chunks = []
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": payload, "more_body": False}
+            await asyncio.sleep(3600)   # no disconnect while the app is working
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return status, b"".join(chunks)
+
+
+def bench_http(seniors, quick, concurrency):
+    import api
+
+    # Unique payloads so the result cache does not hide the pipeline cost
+    requests = [{"user_id": s["user_id"], "phr_data": s["phr"]} for s in seniors]
+    n_requests = 300 if quick else 2000
+    batch_size = 64
+
+    async def run():
+        client = ASGIClient(api.app)
+        await client.startup()
+        try:
+            api.result_cache.clear()
+            # Warm-up
+            for req in requests[:5]:
+                await client.request("POST", "/diagnose/prescription", req)
+            api.result_cache.clear()
+
+            latencies, statuses = [], {}
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one(req):
+                async with semaphore:
+                    start = time.perf_counter()
+                    status, _ = await client.request("POST", "/diagnose/prescription", req)
+                    latencies.append(time.perf_counter() - start)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(requests[i % len(requests)]) for i in range(n_requests)))
+            wall = time.perf_counter() - start
+
+            single = summarize(latencies, 1)
+            single["wall_rows_per_sec"] = n_requests / wall
+            single["concurrency"] = concurrency
+            single["status_counts"] = {str(k): v for k, v in statuses.items()}
+
+            api.result_cache.clear()
+            batch_latencies = []
+            for batch in chunk(requests, batch_size, max(5, n_requests // batch_size)):
+                start = time.perf_counter()
+                status, _ = await client.request("POST", "/diagnose/prescription/batch", batch)
+                batch_latencies.append(time.perf_counter() - start)
+            batch = summarize(batch_latencies, batch_size)
+            return single, batch
+        finally:
+            await client.shutdown()
+
+    single, batch = asyncio.run(run())
+    print(f"  POST /diagnose/prescription        c={concurrency:<4} "
+          f"p50={single['p50_ms']:.2f}ms p99={single['p99_ms']:.2f}ms "
+          f"req/s={single['wall_rows_per_sec']:.0f} status={single['status_counts']}")
+    print(f"  POST /diagnose/prescription/batch  n={batch_size:<4} "
+          f"p50={batch['p50_ms']:.2f}ms rows/s={batch['rows_per_sec']:.0f}")
+    return {
+        "http.diagnose_prescription": single,
+        f"http.diagnose_prescription_batch[{batch_size}]": batch,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Cold start
+# ---------------------------------------------------------------------------
+
+# Runs in a fresh interpreter: time `import api`, then the lifespan startup
+# with the warm-up until /ready would answer 200. Prints one JSON line.
+COLD_START_PROBE = r"""
+import asyncio, json, time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+
+async def main():
+    async with api.app.router.lifespan_context(api.app):
+        while not api._warmup_done.is_set():
+            await asyncio.sleep(0.005)
+    return time.perf_counter()
+
+ready = asyncio.run(main())
+print(json.dumps({"import_s": imported - start, "ready_s": ready - start}))
+"""
+
+
+def bench_cold_start(quick):
+    """Import and import-to-ready time of api.py, each run in a new process."""
+    runs = 2 if quick else 5
+    import_s, ready_s = [], []
+    env = dict(os.environ, NORICARE_WARMUP="background", PYTHONWARNINGS="ignore")
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", COLD_START_PROBE], cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        import_s.append(sample["import_s"])
+        ready_s.append(sample["ready_s"])
+
+    results = {
+        "startup.import_api": summarize(import_s, 1),
+        "startup.import_to_ready": summarize(ready_s, 1),
+    }
+    print(f"  import api                         runs={runs:<3} "
+          f"p50={results['startup.import_api']['p50_ms']:.0f}ms")
+    print(f"  import -> ready (warm-up)          runs={runs:<3} "
+          f"p50={results['startup.import_to_ready']['p50_ms']:.0f}ms")
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Baseline comparison
+# ---------------------------------------------------------------------------
+
+def compare(results, baseline, tolerance):
+    """
+    Flag a regression when p50 latency grows, or rows/sec drops, by more
+    than `tolerance` (fraction) relative to the baseline.
+    """
+    regressions = []
+    for name, current in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if previous is None:
+            continue
+        if current["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {previous['p50_ms']:.3f}ms -> {current['p50_ms']:.3f}ms")
+        if current["rows_per_sec"] < previous["rows_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: rows/s {previous['rows_per_sec']:.0f} -> {current['rows_per_sec']:.0f}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Noricare AI engine")
+    parser.add_argument('--quick', action='store_true', help="Fewer iterations (smoke run)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--population', type=int, default=8192, help="Synthetic seniors to generate")
+    parser.add_argument('--concurrency', type=int, default=32, help="Concurrent HTTP requests")
+    parser.add_argument('--skip-http', action='store_true', help="Only run the stage benchmarks")
+    parser.add_argument('--skip-startup', action='store_true', help="Skip the cold-start measurement")
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    parser.add_argument('--baseline', help="Compare against a previous --output file")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed relative slowdown before flagging a regression (default 0.2)")
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+    rng = random.Random(args.seed)
+    np.random.seed(args.seed)
+
+    print("=" * 60)
+    print("  Noricare AI Engine - Benchmark")
+    print("=" * 60)
+
+    seniors = make_seniors(args.population, load_source_rows(), rng)
+
+    print("\n[Stages]")
+    benchmarks = bench_stages(seniors, args.quick)
+    benchmarks.update(bench_large_catalog(seniors, args.quick, rng))
+
+    if not args.skip_http:
+        print("\n[HTTP, in-process]")
+        benchmarks.update(bench_http(seniors, args.quick, args.concurrency))
+
+    if not args.skip_startup:
+        print("\n[Cold start]")
+        benchmarks.update(bench_cold_start(args.quick))
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": args.seed,
+            "quick": args.quick,
+        },
+        "benchmarks": benchmarks,
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n[OK] Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n[FAIL] {len(regressions)} regression(s) vs {args.baseline}:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print(f"\n[OK] No regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Noricare AI Engine - Cohort Analytics
+
+Population-level analysis of HealthAssessment history
+(packages/database/schema.prisma) read from a SQLite database: cohort
+percentiles of each senior's latest SPPB/TUG/gait speed, per-senior trends
+(least-squares slope per year) and Normal -> Pre-frail -> Frail group
+transitions. All analyses are vectorized over the whole population
+(core/analytics.py); the API serves the same reports under /analytics/*.
+
+Usage:
+    python cohort_analytics.py dev.db                         # cohort report
+    python cohort_analytics.py dev.db --json                  # same, as JSON
+    python cohort_analytics.py dev.db --senior <seniorId>     # one senior
+    python cohort_analytics.py dev.db --export trends.csv     # per-senior trends
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from core.analytics import AssessmentStore, METRIC_COLUMNS
+
+
+def print_report(report):
+    print(f"Seniors: {report['seniors']}   Assessments: {report['assessments']}")
+
+    print("\nLatest value percentiles")
+    for metric, percentiles in report["percentiles"].items():
+        cells = "  ".join(
+            f"{name}={value:.2f}" if value is not None else f"{name}=-" for name, value in percentiles.items()
+        )
+        print(f"  {metric:<5} {cells}")
+
+    print("\nTrends (slope per year)")
+    for metric, trend in report["trends"].items():
+        median = trend["median_slope_per_year"]
+        print(f"  {metric:<5} seniors={trend['seniors']:<7} "
+              f"median={median if median is None else round(median, 3)}  "
+              f"increasing={trend['increasing']}  decreasing={trend['decreasing']}")
+
+    print("\nGroup transitions (from -> to, consecutive assessments)")
+    groups = list(report["transitions"])
+    print("  " + " " * 10 + "".join(f"{g:>11}" for g in groups))
+    for source, row in report["transitions"].items():
+        print(f"  {source:<10}" + "".join(f"{row[g]:>11}" for g in groups))
+    print(f"\n  Latest groups: {report['latest_groups']}")
+    print(f"  Worsened since first assessment: {report['worsened']}   Improved: {report['improved']}")
+
+
+def export_trends(store, path):
+    """One row per senior: points / first / last / slope per metric, first and latest group."""
+    trends = {metric: store.trends(metric) for metric in METRIC_COLUMNS}
+    transitions = store.transitions()
+    columns = ["seniorId"] + [
+        f"{metric}_{key}" for metric in METRIC_COLUMNS for key in ("points", "first", "last", "slope_per_year")
+    ] + ["first_group", "latest_group"]
+
+    def group_name(index):
+        return store.GROUPS[index] if index >= 0 else ""
+
+    with open(path, "w", newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        lists = {
+            (metric, key): trends[metric][key].tolist()
+            for metric in METRIC_COLUMNS for key in ("points", "first", "last", "slope_per_year")
+        }
+        first, latest = transitions["first"].tolist(), transitions["latest"].tolist()
+        for i, senior_id in enumerate(store.senior_ids.tolist()):
+            writer.writerow(
+                [senior_id]
+                + ["" if lists[k][i] != lists[k][i] else lists[k][i] for k in lists]
+                + [group_name(first[i]), group_name(latest[i])]
+            )
+    print(f"[OK] {store.n_seniors} seniors -> {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cohort analytics over HealthAssessment history")
+    parser.add_argument('database', nargs='?', default=os.environ.get("NORICARE_ANALYTICS_DB"),
+                        help="SQLite database with a HealthAssessment table (default: $NORICARE_ANALYTICS_DB)")
+    parser.add_argument('--table', default="HealthAssessment")
+    parser.add_argument('--senior', metavar='SENIOR_ID', help="Report for one senior")
+    parser.add_argument('--json', action='store_true', help="Print JSON instead of a table")
+    parser.add_argument('--export', metavar='CSV', help="Write per-senior trends to a CSV file")
+    args = parser.parse_args()
+
+    if not args.database:
+        parser.error("no database given (argument or NORICARE_ANALYTICS_DB)")
+    if not os.path.exists(args.database):
+        raise SystemExit(f"Error: {args.database} not found")
+
+    start = time.perf_counter()
+    store = AssessmentStore.from_sqlite(args.database, args.table)
+    print(f"[Analytics] Loaded {len(store)} assessments of {store.n_seniors} seniors "
+          f"in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+    if args.export:
+        export_trends(store, args.export)
+        return
+
+    if args.senior:
+        report = store.senior_report(args.senior)
+        if report is None:
+            raise SystemExit(f"Error: no assessments for senior {args.senior}")
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    report = store.cohort_summary()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
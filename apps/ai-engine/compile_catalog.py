@@ -0,0 +1,48 @@
+"""
+Noricare AI Engine - Exercise Catalog Compiler
+
+Compiles data/exercises.json into models/exercise_catalog.npy: one
+fixed-width numpy record per exercise, with its contraindications
+(PrescriptionEngine.CONTRAINDICATED) precomputed as a bitmask. The
+prescription engine memory-maps this file instead of parsing the JSON, as
+long as it matches exercises.json and the contraindication table; re-run
+after editing either.
+
+Usage:
+    python compile_catalog.py
+    python compile_catalog.py --source ../../data/exercises.json --output models/exercise_catalog.npy
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from core.catalog import CATALOG_PATH, ExerciseCatalog
+from core.prescription import EXERCISES_PATH, PrescriptionEngine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile exercises.json into a memory-mappable catalog")
+    parser.add_argument("--source", default=EXERCISES_PATH, help="exercises.json to compile")
+    parser.add_argument("--output", default=CATALOG_PATH, help="Compiled catalog (.npy; a .json sidecar is written next to it)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with open(args.source, encoding="utf-8") as f:
+        exercises = json.load(f)
+    catalog = ExerciseCatalog.compile(exercises, PrescriptionEngine.CONTRAINDICATED)
+    catalog.save(args.output, source_path=args.source, contraindicated=PrescriptionEngine.CONTRAINDICATED)
+    elapsed = time.perf_counter() - start
+
+    blocked = int((catalog.rows["contraindicated"] != 0).sum())
+    print(f"[OK] {len(catalog)} exercises -> {args.output} "
+          f"({os.path.getsize(args.output) / 1024:.1f} KB, {catalog.rows.dtype.itemsize} B/row)")
+    print(f"     {blocked} exercises contraindicated for at least one of {len(catalog.conditions)} conditions; "
+          f"compiled in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Sequence
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+# HealthAssessment columns (packages/database/schema.prisma) -> metric name
+METRIC_COLUMNS = {
+    'sppb': 'sppbScore',     # 0-12
+    'tug': 'tugSeconds',     # Time Up and Go, seconds
+    'gait': 'gaitSpeed'      # m/s
+}
+
+SECONDS_PER_YEAR = 365.25 * 24 * 3600
+
+
+def _epoch_seconds(values: Sequence[Any]) -> np.ndarray:
+    """
+    measuredAt values as float Unix seconds. Numbers are Unix milliseconds
+    (Prisma's SQLite encoding); strings are ISO-8601.
+    """
+    values = list(values)
+    result = np.empty(len(values))
+    is_number = np.array([isinstance(v, (int, float)) for v in values], dtype=bool)
+    if is_number.any():
+        result[is_number] = np.array([v for v, n in zip(values, is_number) if n], dtype=float) / 1000.0
+    if not is_number.all():
+        strings = [str(v).replace(' ', 'T') for v, n in zip(values, is_number) if not n]
+        try:
+            # Fast path: naive or UTC ('Z') timestamps
+            parsed = np.array([s[:-1] if s.endswith('Z') else s for s in strings], dtype='datetime64[ms]')
+            seconds = parsed.astype(np.int64) / 1000.0
+        except ValueError:
+            seconds = [_parse_iso(s) for s in strings]
+        result[~is_number] = seconds
+    return result
+
+
+def _parse_iso(value: str) -> float:
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class AssessmentStore:
+    """
+    Columnar, in-memory copy of HealthAssessment history.
+    Rows are sorted by (senior, measuredAt); senior i owns rows
+    offsets[i]:offsets[i + 1]. Metrics are float arrays with NaN for
+    missing values. Analyses run over all seniors in vectorized passes.
+    """
+
+    # Group per assessment from SPPB (<=6 Frail, 7-9 Pre-frail, >=10 Normal);
+    # without SPPB, from TUG (>=20s Frail, >=12s Pre-frail)
+    GROUPS = ["Normal", "Pre-frail", "Frail"]
+    SPPB_CUTOFFS = (6.0, 9.0)
+    TUG_CUTOFFS = (12.0, 20.0)
+
+    def __init__(self, senior_codes: np.ndarray, senior_ids: np.ndarray,
+                 measured_at: np.ndarray, metrics: Dict[str, np.ndarray]):
+        """Use from_columns() / from_sqlite(); arguments must already be sorted."""
+        self.senior_ids = senior_ids
+        self.senior_codes = senior_codes
+        self.measured_at = measured_at
+        self.metrics = metrics
+        self.offsets = np.searchsorted(senior_codes, np.arange(len(senior_ids) + 1))
+        self.loaded_at = time.time()
+        self._summaries: Dict[tuple, Dict[str, Any]] = {}   # the store is immutable
+
+    @classmethod
+    def from_columns(cls, senior_id: Sequence[str], measured_at: Sequence[Any],
+                     **metrics: Sequence[Optional[float]]) -> "AssessmentStore":
+        """
+        Build from parallel columns in any order.
+
+        Args:
+            senior_id: Senior of each assessment
+            measured_at: Unix ms, ISO-8601 strings, or float seconds as np.ndarray
+            **metrics: sppb=..., tug=..., gait=... (None -> NaN)
+        """
+        senior_ids, codes = np.unique(np.asarray(senior_id, dtype=str), return_inverse=True)
+        if isinstance(measured_at, np.ndarray) and measured_at.dtype.kind == 'f':
+            seconds = measured_at
+        else:
+            seconds = _epoch_seconds(measured_at)
+        order = np.lexsort((seconds, codes))
+        columns = {}
+        for name in METRIC_COLUMNS:
+            values = metrics.get(name)
+            if values is None:
+                columns[name] = np.full(len(order), np.nan)
+            else:
+                columns[name] = np.array([np.nan if v is None else v for v in values], dtype=float)[order]
+        return cls(codes[order], senior_ids, seconds[order], columns)
+
+    @classmethod
+    def from_sqlite(cls, conn: Any, table: str = "HealthAssessment") -> "AssessmentStore":
+        """Load every assessment from a SQLite connection or database path."""
+        close = isinstance(conn, str)
+        if close:
+            conn = sqlite3.connect(f"file:{conn}?mode=ro", uri=True)
+        try:
+            # No ORDER BY: rows are sorted in numpy (measuredAt may mix integer and text encodings)
+            columns = ", ".join(f'"{column}"' for column in METRIC_COLUMNS.values())
+            rows = conn.execute(f'SELECT "seniorId", "measuredAt", {columns} FROM "{table}"').fetchall()
+        finally:
+            if close:
+                conn.close()
+        if not rows:
+            return cls.from_columns([], [])
+        senior_id, measured_at, *values = zip(*rows)
+        return cls.from_columns(senior_id, measured_at, **dict(zip(METRIC_COLUMNS, values)))
+
+    def __len__(self) -> int:
+        return len(self.measured_at)
+
+    @property
+    def n_seniors(self) -> int:
+        return len(self.senior_ids)
+
+    def senior_index(self, senior_id: str) -> Optional[int]:
+        i = int(np.searchsorted(self.senior_ids, senior_id))
+        if i < self.n_seniors and self.senior_ids[i] == senior_id:
+            return i
+        return None
+
+    # --- Vectorized analyses ---
+
+    def trends(self, metric: str) -> Dict[str, np.ndarray]:
+        """
+        Per-senior series statistics of one metric (missing values skipped):
+        points, first, last, change (last - first) and the least-squares
+        slope per year (NaN with fewer than two points or a single date).
+        """
+        values = self.metrics[metric]
+        valid = ~np.isnan(values)
+        codes = self.senior_codes[valid]
+        y = values[valid]
+        n_seniors = self.n_seniors
+
+        # Time in years since each senior's first assessment (keeps the sums well conditioned)
+        t = (self.measured_at - self.measured_at[np.minimum(self.offsets[self.senior_codes], len(self) - 1)])
+        t = t[valid] / SECONDS_PER_YEAR
+
+        n = np.bincount(codes, minlength=n_seniors).astype(float)
+        sum_t = np.bincount(codes, t, n_seniors)
+        sum_y = np.bincount(codes, y, n_seniors)
+        sum_tt = np.bincount(codes, t * t, n_seniors)
+        sum_ty = np.bincount(codes, t * y, n_seniors)
+        denominator = n * sum_tt - sum_t * sum_t
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = np.where((n >= 2) & (denominator > 1e-12),
+                             (n * sum_ty - sum_t * sum_y) / denominator, np.nan)
+
+        # First / last valid value: rows are time-sorted within each senior
+        first, last = self._ends(codes, y, np.nan)
+        return {
+            "points": n.astype(int),
+            "first": first,
+            "last": last,
+            "change": last - first,
+            "slope_per_year": slope
+        }
+
+    def groups(self) -> np.ndarray:
+        """Group index per assessment (GROUPS order), -1 without SPPB and TUG."""
+        sppb, tug = self.metrics['sppb'], self.metrics['tug']
+        frail_sppb, prefrail_sppb = self.SPPB_CUTOFFS
+        prefrail_tug, frail_tug = self.TUG_CUTOFFS
+        with np.errstate(invalid='ignore'):
+            return np.select(
+                [~np.isnan(sppb) & (sppb <= frail_sppb),
+                 ~np.isnan(sppb) & (sppb <= prefrail_sppb),
+                 ~np.isnan(sppb),
+                 tug >= frail_tug,
+                 tug >= prefrail_tug,
+                 ~np.isnan(tug)],
+                [2, 1, 0, 2, 1, 0],
+                default=-1
+            )
+
+    def transitions(self) -> Dict[str, Any]:
+        """
+        Group changes between consecutive classified assessments of the
+        same senior: a 3x3 count matrix (from row, to column), and per
+        senior the first and latest group.
+        """
+        groups = self.groups()
+        known = groups >= 0
+        codes, groups = self.senior_codes[known], groups[known]
+
+        same_senior = codes[1:] == codes[:-1]
+        pairs = groups[:-1][same_senior] * 3 + groups[1:][same_senior]
+        matrix = np.bincount(pairs, minlength=9).reshape(3, 3)
+
+        first, latest = self._ends(codes, groups, -1)
+        return {"matrix": matrix, "first": first, "latest": latest}
+
+    def _ends(self, codes: np.ndarray, values: np.ndarray, fill: Any):
+        """(first, last) of `values` per senior, given their sorted senior codes; `fill` if none."""
+        seniors = np.arange(self.n_seniors)
+        start = np.searchsorted(codes, seniors, side='left')
+        stop = np.searchsorted(codes, seniors, side='right')
+        has = stop > start
+        first = np.full(self.n_seniors, fill, dtype=values.dtype)
+        last = np.full(self.n_seniors, fill, dtype=values.dtype)
+        first[has] = values[start[has]]
+        last[has] = values[stop[has] - 1]
+        return first, last
+
+    def latest(self, metric: str) -> np.ndarray:
+        """Latest non-missing value per senior (NaN if none)."""
+        return self.trends(metric)["last"]
+
+    def percentiles(self, metric: str, q: Sequence[float] = (10, 25, 50, 75, 90)) -> Dict[str, float]:
+        """Cohort percentiles of each senior's latest value of `metric`."""
+        latest = self.latest(metric)
+        latest = latest[~np.isnan(latest)]
+        if not len(latest):
+            return {f"p{int(p)}": None for p in q}
+        return {f"p{int(p)}": float(v) for p, v in zip(q, np.percentile(latest, q))}
+
+    # --- Reports ---
+
+    def cohort_summary(self, q: Sequence[float] = (10, 25, 50, 75, 90)) -> Dict[str, Any]:
+        """Population report: percentiles, trend direction counts and group transitions."""
+        key = tuple(q)
+        if key not in self._summaries:
+            self._summaries[key] = self._cohort_summary(q)
+        return self._summaries[key]
+
+    def _cohort_summary(self, q: Sequence[float]) -> Dict[str, Any]:
+        transitions = self.transitions()
+        matrix = transitions["matrix"]
+        first, latest = transitions["first"], transitions["latest"]
+        tracked = (first >= 0) & (latest >= 0)
+
+        report = {
+            "seniors": self.n_seniors,
+            "assessments": len(self),
+            "percentiles": {metric: self.percentiles(metric, q) for metric in METRIC_COLUMNS},
+            "trends": {},
+            "transitions": {
+                src: {dst: int(matrix[i, j]) for j, dst in enumerate(self.GROUPS)}
+                for i, src in enumerate(self.GROUPS)
+            },
+            "latest_groups": {
+                group: int(np.count_nonzero(latest == i)) for i, group in enumerate(self.GROUPS)
+            },
+            "worsened": int(np.count_nonzero(tracked & (latest > first))),
+            "improved": int(np.count_nonzero(tracked & (latest < first)))
+        }
+        for metric in METRIC_COLUMNS:
+            slope = self.trends(metric)["slope_per_year"]
+            slope = slope[~np.isnan(slope)]
+            report["trends"][metric] = {
+                "seniors": int(len(slope)),
+                "median_slope_per_year": float(np.median(slope)) if len(slope) else None,
+                "increasing": int(np.count_nonzero(slope > 0)),
+                "decreasing": int(np.count_nonzero(slope < 0))
+            }
+        return report
+
+    def senior_report(self, senior_id: str) -> Optional[Dict[str, Any]]:
+        """Series, trends and groups of one senior (None if unknown)."""
+        i = self.senior_index(senior_id)
+        if i is None:
+            return None
+        rows = slice(self.offsets[i], self.offsets[i + 1])
+        # Analyses on this senior's rows only
+        single = AssessmentStore(
+            np.zeros(rows.stop - rows.start, dtype=self.senior_codes.dtype), self.senior_ids[i:i + 1],
+            self.measured_at[rows], {metric: values[rows] for metric, values in self.metrics.items()}
+        )
+        groups = single.groups()
+
+        def as_list(values):
+            return [None if v != v else v for v in values.tolist()]
+
+        report = {
+            "seniorId": senior_id,
+            "assessments": int(rows.stop - rows.start),
+            "measuredAt": [
+                datetime.fromtimestamp(s, timezone.utc).isoformat() for s in self.measured_at[rows].tolist()
+            ],
+            "series": {metric: as_list(self.metrics[metric][rows]) for metric in METRIC_COLUMNS},
+            "groups": [self.GROUPS[g] if g >= 0 else None for g in groups.tolist()],
+            "trends": {}
+        }
+        for metric in METRIC_COLUMNS:
+            trend = single.trends(metric)
+            report["trends"][metric] = {
+                key: (None if values[0] != values[0] else values[0].item()) for key, values in trend.items()
+            }
+        return report
+
+
+class CohortAnalytics:
+    """
+    AssessmentStore loaded from the HealthAssessment table of a SQLite
+    database (a local stand-in or a replica export). At most every
+    max_age seconds the file is checked and reloaded if it changed.
+    """
+
+    def __init__(self, db_path: Optional[str], max_age: float = 300.0, table: str = "HealthAssessment"):
+        self.db_path = db_path
+        self.max_age = max_age
+        self.table = table
+        self._store: Optional[AssessmentStore] = None
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "CohortAnalytics":
+        """Configured by NORICARE_ANALYTICS_DB and NORICARE_ANALYTICS_MAX_AGE_S."""
+        return cls(
+            db_path=os.environ.get("NORICARE_ANALYTICS_DB") or None,
+            max_age=float(os.environ.get("NORICARE_ANALYTICS_MAX_AGE_S", 300))
+        )
+
+    @property
+    def configured(self) -> bool:
+        return self.db_path is not None
+
+    def store(self) -> AssessmentStore:
+        """The current store, (re)loading it if needed. Raises FileNotFoundError without a database."""
+        if not self.db_path or not os.path.exists(self.db_path):
+            raise FileNotFoundError(f"Assessment database not found: {self.db_path or '(NORICARE_ANALYTICS_DB unset)'}")
+        store = self._store
+        if store is not None and time.monotonic() - self._checked_at < self.max_age:
+            return store
+
+        with self._lock:
+            fingerprint = self._file_fingerprint()
+            if self._store is None or fingerprint != self._fingerprint:
+                start = time.perf_counter()
+                self._store = AssessmentStore.from_sqlite(self.db_path, self.table)
+                self._fingerprint = fingerprint
+                print(f"[Analytics] Loaded {len(self._store)} assessments of {self._store.n_seniors} seniors "
+                      f"in {time.perf_counter() - start:.2f}s")
+            self._checked_at = time.monotonic()
+            return self._store
+
+    def _file_fingerprint(self):
+        # Writes may sit in the WAL file until a checkpoint
+        stamps = []
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                stat = os.stat(path)
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
@@ -0,0 +1,108 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import os
+
+BatchRunner = Callable[[List[Dict], List[Dict]], Awaitable[List[Dict[str, Any]]]]
+
+
+class DiagnosisBatcher:
+    """
+    Dynamic micro-batching in front of HybridDiagnosisEngine.
+    Concurrent single-user diagnosis calls are collected for up to
+    max_wait_ms (or until max_batch calls are waiting), diagnosed in one
+    vectorized pass, and the results are fanned back out to the callers.
+    Clients keep using the single-user API.
+    """
+
+    def __init__(self, run_batch: BatchRunner, max_batch: int = 64, max_wait_ms: float = 2.0):
+        """
+        Args:
+            run_batch: Coroutine function (profiles, metrics) -> list of analyses,
+                e.g. the inference pool running analyze_risk_factors_batch
+            max_batch: Flush as soon as this many calls are waiting
+            max_wait_ms: Longest time the first call of a batch waits for company
+        """
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending: List[Tuple[Dict, Dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+        # Stats
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+
+    @classmethod
+    def from_env(cls, run_batch: BatchRunner) -> Optional["DiagnosisBatcher"]:
+        """
+        Enabled when NORICARE_BATCH_WINDOW_MS > 0; NORICARE_BATCH_MAX_ITEMS
+        caps the batch size. Returns None when batching is disabled.
+        """
+        window_ms = float(os.environ.get("NORICARE_BATCH_WINDOW_MS", 0))
+        if window_ms <= 0:
+            return None
+        return cls(
+            run_batch,
+            max_batch=int(os.environ.get("NORICARE_BATCH_MAX_ITEMS", 64)),
+            max_wait_ms=window_ms
+        )
+
+    async def analyze(self, user_profile: Dict, health_metrics: Dict) -> Dict[str, Any]:
+        """Same contract as HybridDiagnosisEngine.analyze_risk_factors, but awaitable."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((user_profile, health_metrics, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        self.batches += 1
+        self.items += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+
+        # Keep a reference so the task is not garbage-collected mid-flight
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Dict, Dict, asyncio.Future]]):
+        try:
+            results = await self.run_batch(
+                [profile for profile, _, _ in batch],
+                [metrics for _, metrics, _ in batch]
+            )
+        except Exception as e:
+            # Every waiter sees the failure (e.g. pool saturated -> 503)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "items": self.items,
+            "max_batch_seen": self.max_batch_seen,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
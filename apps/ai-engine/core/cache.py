@@ -0,0 +1,119 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def canonical_hash(payload: Any) -> str:
+    """Stable hash of a JSON-like payload (key order does not matter)."""
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with per-entry TTL for pipeline results.
+    Entries are tagged with the versions they were computed under
+    (model artifacts, exercise catalog); when those change the whole
+    cache is dropped, and results computed under other versions are not
+    stored.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300.0):
+        """
+        Args:
+            max_entries: LRU bound (0 disables caching)
+            ttl_seconds: Entry lifetime; <= 0 means entries never expire
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._versions: Optional[Hashable] = None
+        self._lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        """Configured by NORICARE_CACHE_MAX_ENTRIES and NORICARE_CACHE_TTL_S."""
+        return cls(
+            max_entries=int(os.environ.get("NORICARE_CACHE_MAX_ENTRIES", 10000)),
+            ttl_seconds=float(os.environ.get("NORICARE_CACHE_TTL_S", 300))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def bind_versions(self, versions: Hashable):
+        """Record the current model/catalog versions; a change clears the cache."""
+        if versions == self._versions:
+            return
+        with self._lock:
+            if versions != self._versions:
+                if self._versions is not None:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._versions = versions
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if self.ttl > 0 and time.monotonic() > expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, versions: Optional[Hashable] = None):
+        """
+        Store value. versions: what it was computed under; if the cache
+        has since been bound to other versions (a reload finished while
+        the value was being computed), it is not stored.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if versions is not None and versions != self._versions:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,162 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import hashlib
+import json
+import os
+import numpy as np
+
+# Compiled catalog, built from data/exercises.json by compile_catalog.py
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models', 'exercise_catalog.npy')
+
+CATALOG_FORMAT = 1
+
+# Text fields of an exercises.json entry; their widths are sized to the catalog at compile time
+TEXT_FIELDS = ("name", "type", "reps")
+
+
+def catalog_dtype(exercises: Sequence[Dict[str, Any]]) -> np.dtype:
+    """Fixed-width little-endian record layout, one record per exercise."""
+    width = {
+        field: max([len(str(ex[field])) for ex in exercises] + [1])
+        for field in TEXT_FIELDS
+    }
+    return np.dtype([
+        ("id", "<i4"),
+        ("name", f"<U{width['name']}"),
+        ("type", f"<U{width['type']}"),
+        ("sets", "<i2"),
+        ("reps", f"<U{width['reps']}"),
+        ("intensity", "<i2"),
+        ("contraindicated", "<u8"),   # bit i set: contraindicated for conditions[i]
+    ])
+
+
+def contraindication_masks(
+    names: Iterable[str],
+    contraindicated: Dict[str, List[str]],
+    conditions: Sequence[str]
+) -> np.ndarray:
+    """
+    Bitmask per exercise name: bit i is set when any contraindicated name
+    of conditions[i] occurs in it (substring match).
+    """
+    masks = []
+    for name in names:
+        mask = 0
+        for bit, condition in enumerate(conditions):
+            if any(contra in name for contra in contraindicated.get(condition, ())):
+                mask |= 1 << bit
+        masks.append(mask)
+    return np.array(masks, dtype=np.uint64)
+
+
+def rules_digest(contraindicated: Dict[str, List[str]]) -> str:
+    """Fingerprint of the contraindication table the bitmasks were computed from."""
+    payload = json.dumps(contraindicated, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def source_digest(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _meta_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".json"
+
+
+class ExerciseCatalog:
+    """
+    The exercise DB as one structured numpy array (catalog_dtype), with
+    the contraindications of each exercise precomputed as a bitmask over
+    `conditions`. Filtering for any combination of conditions is a single
+    AND over the contraindicated column.
+
+    Compiled catalogs are written as .npy (rows) plus a .json sidecar
+    (condition order, source fingerprints) and loaded with mmap, so
+    workers share the pages and nothing is parsed at startup.
+    """
+
+    def __init__(self, rows: np.ndarray, conditions: Sequence[str]):
+        if len(conditions) > 64:
+            raise ValueError(f"At most 64 conditions fit the bitmask, got {len(conditions)}")
+        self.rows = rows
+        self.conditions = tuple(conditions)
+        self.bits = {condition: 1 << i for i, condition in enumerate(self.conditions)}
+
+    @classmethod
+    def compile(
+        cls,
+        exercises: Sequence[Dict[str, Any]],
+        contraindicated: Dict[str, List[str]]
+    ) -> "ExerciseCatalog":
+        """From exercises.json entries and a condition -> contraindicated names table."""
+        conditions = sorted(contraindicated)
+        rows = np.empty(len(exercises), dtype=catalog_dtype(exercises))
+        for field in ("id", "name", "type", "sets", "reps", "intensity"):
+            rows[field] = [ex[field] for ex in exercises]
+        rows["contraindicated"] = contraindication_masks(
+            (ex["name"] for ex in exercises), contraindicated, conditions
+        )
+        return cls(rows, conditions)
+
+    def save(self, path: str, source_path: Optional[str] = None,
+             contraindicated: Optional[Dict[str, List[str]]] = None):
+        """Write <path>.npy and its .json sidecar."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.save(path, self.rows, allow_pickle=False)
+        meta = {
+            "format": CATALOG_FORMAT,
+            "rows": int(len(self.rows)),
+            "conditions": list(self.conditions),
+            "source_sha256": source_digest(source_path) if source_path else None,
+            "rules_sha256": rules_digest(contraindicated) if contraindicated is not None else None,
+        }
+        with open(_meta_path(path), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        source_path: Optional[str] = None,
+        contraindicated: Optional[Dict[str, List[str]]] = None
+    ) -> Optional["ExerciseCatalog"]:
+        """
+        Memory-map a compiled catalog. Returns None if it is missing, or stale:
+        compiled from a different exercises.json (when that file exists) or a
+        different contraindication table.
+        """
+        try:
+            with open(_meta_path(path), encoding="utf-8") as f:
+                meta = json.load(f)
+            rows = np.load(path, mmap_mode="r", allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+
+        if meta.get("format") != CATALOG_FORMAT or len(rows) != meta.get("rows"):
+            return None
+        if contraindicated is not None and meta.get("rules_sha256") != rules_digest(contraindicated):
+            return None
+        if source_path is not None:
+            digest = source_digest(source_path)
+            # Without the JSON source, the compiled catalog is the catalog
+            if digest is not None and digest != meta.get("source_sha256"):
+                return None
+        return cls(rows, meta["conditions"])
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def condition_mask(self, conditions: Iterable[str]) -> int:
+        """Bitmask of the known conditions in `conditions` (unknown ones are ignored)."""
+        mask = 0
+        for condition in conditions:
+            mask |= self.bits.get(condition, 0)
+        return mask
+
+    def safe(self, conditions: Iterable[str]) -> np.ndarray:
+        """Boolean array over the rows: True where no condition contraindicates the exercise."""
+        return (self.rows["contraindicated"] & np.uint64(self.condition_mask(conditions))) == 0
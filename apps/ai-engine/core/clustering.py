@@ -1,6 +1,4 @@
-from typing import Dict, List, Any
-import os
-import joblib
+from typing import Dict, List, Any, Optional
 import numpy as np
 
 class UserClustering:
@@ -17,18 +15,6 @@ class UserClustering:
         2: "Frail"        # FRAIL score 3+
     }
     
-    def __init__(self):
-        """Initialize with trained model reference."""
-        # Models are in ai-engine/models, not core/models
-        models_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models')
-        
-        try:
-            self.frail_model = joblib.load(os.path.join(models_dir, 'frail_classifier.pkl'))
-            self.frail_scaler = joblib.load(os.path.join(models_dir, 'frail_scaler.pkl'))
-            self.models_loaded = True
-        except FileNotFoundError:
-            self.models_loaded = False
-    
     def segment_user(self, analysis_result: Dict[str, Any]) -> str:
         """
         Classifies user into one of the defined groups based on ML analysis.
@@ -63,6 +49,49 @@ class UserClustering:
         else:
             return "Pre-frail"
     
+    def segment_users(
+        self,
+        functional_score: np.ndarray,
+        disease_risk_score: np.ndarray,
+        frail_category: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Array version of segment_user for N users in one pass.
+        With frail_category (ML diagnosis) it applies the category mapping and
+        the Sarcopenic override; without it, the heuristic fallback.
+        Returns an object array of group names, identical to segment_user.
+        """
+        f_score = np.asarray(functional_score, dtype=np.float64)
+        d_score = np.asarray(disease_risk_score, dtype=np.float64)
+        labels = np.array(self.GROUPS, dtype=object)
+        normal, pre_frail, frail, sarcopenic = range(len(self.GROUPS))
+        
+        if frail_category is not None:
+            category = np.asarray(frail_category)
+            group = np.full(len(category), pre_frail)
+            for code, name in self.GROUP_MAPPING.items():
+                group[category == code] = self.GROUPS.index(name)
+            override = (f_score < 0.5) & (d_score < 0.3) & (group != frail)
+            return labels[np.where(override, sarcopenic, group)]
+        
+        # Fallback: first matching branch of the heuristic
+        group = np.select(
+            [f_score > 0.8, (f_score < 0.4) & (d_score > 0.5), f_score < 0.5],
+            [normal, frail, sarcopenic],
+            default=pre_frail
+        )
+        return labels[group]
+    
+    def segment_analyses(self, analyses: List[Dict[str, Any]]) -> List[str]:
+        """segment_user for a list of analysis dicts (vectorized when all have ML output)."""
+        if not analyses or not all('frail_category' in a for a in analyses):
+            return [self.segment_user(a) for a in analyses]
+        return self.segment_users(
+            [a.get('functional_score', 0.5) for a in analyses],
+            [a.get('disease_risk_score', 0.5) for a in analyses],
+            [a['frail_category'] for a in analyses]
+        ).tolist()
+    
     def get_group_details(self, group: str) -> Dict[str, Any]:
         """Get detailed information about a user group."""
         details = {
@@ -126,3 +155,35 @@ class UserClustering:
             "Frail": (1 - f_score) * d_score,
             "Sarcopenic": (1 - f_score) * (1 - d_score)
         }
+    
+    def membership_matrix(
+        self,
+        functional_score: np.ndarray,
+        disease_risk_score: np.ndarray,
+        frail_proba: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Array version of get_membership_scores: (N, 4) matrix, columns in
+        GROUPS order. frail_proba is the (N, 3) Normal/Pre-frail/Frail
+        probability matrix; without it, the heuristic fallback.
+        Same operations in the same order as the scalar path, so the
+        values are identical.
+        """
+        f_score = np.asarray(functional_score, dtype=np.float64)
+        d_score = np.asarray(disease_risk_score, dtype=np.float64)
+        scores = np.empty((len(f_score), len(self.GROUPS)))
+        
+        if frail_proba is not None:
+            proba = np.asarray(frail_proba, dtype=np.float64)
+            sarco = (1 - f_score) * (1 - d_score) * 0.5
+            sarco = np.where(sarco > 0, sarco, 0.0)    # max(0, x), NaN -> 0 as well
+            total = proba[:, 0] + proba[:, 1] + proba[:, 2] + sarco
+            scores[:, :3] = proba[:, :3] / total[:, np.newaxis]
+            scores[:, 3] = sarco / total
+            return scores
+        
+        scores[:, 0] = f_score * (1 - d_score)
+        scores[:, 1] = 0.5
+        scores[:, 2] = (1 - f_score) * d_score
+        scores[:, 3] = (1 - f_score) * (1 - d_score)
+        return scores
@@ -1,7 +1,8 @@
-from typing import Dict, Any, List
-import os
-import joblib
+from typing import Dict, Any, List, Optional
 import numpy as np
+from core.metrics import metrics
+from core.model_registry import ModelBundle, ModelRegistry, get_model_registry
+from core.trends import DEFAULT_ALPHA, TrendState
 
 class HybridDiagnosisEngine:
     """
@@ -9,109 +10,317 @@ class HybridDiagnosisEngine:
     Uses RandomForest for FRAIL classification and LogisticRegression for fall risk.
     """
     
-    def __init__(self):
-        """Load trained models from disk."""
-        # Models are in ai-engine/models, not core/models
-        models_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models')
+    DEFAULT_FEATURE_NAMES = [
+        'Grip_Strength_kg', 'Gait_Speed_mps', 'TUG_Time_s',
+        'SPPB_Walk_Time_s', 'SPPB_Chair_Stand_Time_s',
+        'GDS_Score', 'EQ_VAS_Score', 'EQ5D_Mobility',
+        'EQ5D_Self_Care', 'EQ5D_Usual_Activities',
+        'EQ5D_Pain_Discomfort', 'EQ5D_Anxiety_Depression'
+    ]
+    
+    # Where each feature comes from: (health_metrics | user_profile, key)
+    FEATURE_SOURCES = {
+        'Grip_Strength_kg': ('metrics', 'grip_strength'),
+        'Gait_Speed_mps': ('metrics', 'gait_speed'),
+        'TUG_Time_s': ('metrics', 'tug'),
+        'SPPB_Walk_Time_s': ('metrics', 'sppb_walk'),
+        'SPPB_Chair_Stand_Time_s': ('metrics', 'sppb_chair'),
+        'GDS_Score': ('profile', 'gds_score'),
+        'EQ_VAS_Score': ('profile', 'eq_vas'),
+        'EQ5D_Mobility': ('profile', 'eq5d_mobility'),
+        'EQ5D_Self_Care': ('profile', 'eq5d_selfcare'),
+        'EQ5D_Usual_Activities': ('profile', 'eq5d_activities'),
+        'EQ5D_Pain_Discomfort': ('profile', 'eq5d_pain'),
+        'EQ5D_Anxiety_Depression': ('profile', 'eq5d_anxiety')
+    }
+    
+    # Values assumed for features the caller did not provide when no
+    # imputer was trained (models/imputer.pkl)
+    FEATURE_DEFAULTS = {
+        'Grip_Strength_kg': 20.0,
+        'Gait_Speed_mps': 0.8,
+        'TUG_Time_s': 15.0,
+        'SPPB_Walk_Time_s': 5.0,
+        'SPPB_Chair_Stand_Time_s': 18.0,
+        'GDS_Score': 5,
+        'EQ_VAS_Score': 60,
+        'EQ5D_Mobility': 2,
+        'EQ5D_Self_Care': 2,
+        'EQ5D_Usual_Activities': 2,
+        'EQ5D_Pain_Discomfort': 3,
+        'EQ5D_Anxiety_Depression': 2
+    }
+    
+    # Fixed input used to validate freshly loaded models before they are served
+    SMOKE_PROFILE = {"conditions": [], "gds_score": 5, "eq_vas": 60}
+    SMOKE_METRICS = {"grip_strength": 20.0, "gait_speed": 0.8, "tug": 15.0, "sppb": 6}
+    
+    def __init__(self, registry: Optional[ModelRegistry] = None):
+        """Load trained models from the shared model registry."""
+        self.registry = registry or get_model_registry()
+        self._requested_version: Optional[str] = None
         
         # Try to load trained models
         try:
-            self.frail_model = joblib.load(os.path.join(models_dir, 'frail_classifier.pkl'))
-            self.frail_scaler = joblib.load(os.path.join(models_dir, 'frail_scaler.pkl'))
-            self.fall_model = joblib.load(os.path.join(models_dir, 'fall_risk_model.pkl'))
-            self.fall_scaler = joblib.load(os.path.join(models_dir, 'fall_scaler.pkl'))
-            self.feature_names = joblib.load(os.path.join(models_dir, 'feature_names.pkl'))
-            self.models_loaded = True
+            self.models: Optional[ModelBundle] = self.registry.load_bundle()
             print("[AI Engine] Trained models loaded successfully")
         except FileNotFoundError:
             print("[AI Engine] Models not found, using fallback heuristics")
-            self.models_loaded = False
-            self.feature_names = [
-                'Grip_Strength_kg', 'Gait_Speed_mps', 'TUG_Time_s',
-                'SPPB_Walk_Time_s', 'SPPB_Chair_Stand_Time_s',
-                'GDS_Score', 'EQ_VAS_Score', 'EQ5D_Mobility',
-                'EQ5D_Self_Care', 'EQ5D_Usual_Activities',
-                'EQ5D_Pain_Discomfort', 'EQ5D_Anxiety_Depression'
-            ]
+            self.models = None
+    
+    @property
+    def models_loaded(self) -> bool:
+        return self.models is not None
+    
+    @property
+    def model_version(self) -> str:
+        models = self.models
+        return models.version if models is not None else "heuristic"
+    
+    @property
+    def feature_names(self) -> List[str]:
+        models = self.models
+        return models.feature_names if models is not None else self.DEFAULT_FEATURE_NAMES
+    
+    def reload_models(self) -> str:
+        """
+        Load the artifacts currently on disk, validate them on a smoke input
+        and swap them in. Calls already running keep the bundle they started
+        with. Raises (and keeps serving the old models) if validation fails.
+        Returns the new model version.
+        """
+        bundle = self.registry.load_bundle(fresh=True)
+        self.smoke_test(bundle)
+        self.registry.swap(bundle)
+        self.models = bundle
+        print(f"[AI Engine] Models reloaded (version {bundle.version})")
+        return bundle.version
+    
+    def refresh_models(self, version: str) -> bool:
+        """
+        Reload once when asked to serve a version other than ours
+        (e.g. in pool worker processes after the parent hot-reloaded).
+        """
+        if version == self._requested_version:
+            return False
+        self._requested_version = version
+        if version == self.model_version or version == "heuristic":
+            return False
+        self.reload_models()
+        return True
+    
+    def smoke_test(self, models: ModelBundle):
+        """Sanity-check a bundle on a fixed input; raises ValueError on failure."""
+        features = self.prepare_feature_matrix(
+            [self.SMOKE_PROFILE], [self.SMOKE_METRICS], models
+        )
+        frail_scaled = models.frail_scaler.transform(features)
+        fall_scaled = models.fall_scaler.transform(features)
+        frail_proba = models.frail_forest.predict_proba(frail_scaled)
+        fall_proba = models.fall_model.predict_proba(fall_scaled)
+        
+        if frail_proba.shape != (1, 3) or fall_proba.shape != (1, 2):
+            raise ValueError(
+                f"Unexpected output shapes: frail {frail_proba.shape}, fall {fall_proba.shape}"
+            )
+        for name, proba in (("frail", frail_proba), ("fall", fall_proba)):
+            if not np.all(np.isfinite(proba)) or not np.allclose(proba.sum(axis=1), 1.0):
+                raise ValueError(f"{name} model returned invalid probabilities: {proba}")
+        
+        # Parity against the sklearn forest, read for this check only
+        try:
+            frail_model = self.registry.read("frail_model")
+        except FileNotFoundError:
+            return
+        reference = frail_model.predict_proba(frail_scaled)
+        del frail_model
+        if not models.frail_forest.matches(frail_proba, reference):
+            raise ValueError("frail_forest.pkl does not match frail_classifier.pkl")
 
     def prepare_features(self, user_profile: Dict, health_metrics: Dict) -> np.ndarray:
         """Convert user input to feature vector matching training data format."""
-        features = []
-        
-        # Map input data to feature vector
-        feature_mapping = {
-            'Grip_Strength_kg': health_metrics.get('grip_strength', 20.0),
-            'Gait_Speed_mps': health_metrics.get('gait_speed', 0.8),
-            'TUG_Time_s': health_metrics.get('tug', 15.0),
-            'SPPB_Walk_Time_s': health_metrics.get('sppb_walk', 5.0),
-            'SPPB_Chair_Stand_Time_s': health_metrics.get('sppb_chair', 18.0),
-            'GDS_Score': user_profile.get('gds_score', 5),
-            'EQ_VAS_Score': user_profile.get('eq_vas', 60),
-            'EQ5D_Mobility': user_profile.get('eq5d_mobility', 2),
-            'EQ5D_Self_Care': user_profile.get('eq5d_selfcare', 2),
-            'EQ5D_Usual_Activities': user_profile.get('eq5d_activities', 2),
-            'EQ5D_Pain_Discomfort': user_profile.get('eq5d_pain', 3),
-            'EQ5D_Anxiety_Depression': user_profile.get('eq5d_anxiety', 2)
-        }
+        return self.prepare_feature_matrix([user_profile], [health_metrics])
+
+    def prepare_feature_matrix(
+        self,
+        user_profiles: List[Dict],
+        health_metrics_list: List[Dict],
+        models: Optional[ModelBundle] = None
+    ) -> np.ndarray:
+        """
+        Stack the feature vectors of many users into one (N, n_features) matrix.
+        Values the caller did not provide are imputed (fill_missing_features).
+        """
+        models = models or self.models
+        feature_names = models.feature_names if models is not None else self.DEFAULT_FEATURE_NAMES
+        sources = [self.FEATURE_SOURCES.get(name, ('metrics', None)) for name in feature_names]
+        rows = []
         
-        for name in self.feature_names:
-            features.append(feature_mapping.get(name, 0))
+        for user_profile, health_metrics in zip(user_profiles, health_metrics_list):
+            # Map input data to feature vector (None -> NaN, imputed below)
+            inputs = {'metrics': health_metrics, 'profile': user_profile}
+            row = []
+            for source, key in sources:
+                value = inputs[source].get(key) if key else None
+                row.append(np.nan if value is None else value)
+            rows.append(row)
         
-        return np.array(features).reshape(1, -1)
+        features = np.array(rows, dtype=float).reshape(len(rows), len(feature_names))
+        return self.fill_missing_features(features, models)
+
+    def fill_missing_features(
+        self,
+        features: np.ndarray,
+        models: Optional[ModelBundle] = None
+    ) -> np.ndarray:
+        """
+        Fill the NaN cells of a raw feature matrix in place: k-NN on the
+        observed columns with the trained imputer, else FEATURE_DEFAULTS.
+        """
+        missing = np.isnan(features)
+        if not missing.any():
+            return features
+        
+        models = models or self.models
+        if models is not None and models.imputer is not None:
+            with metrics.timer("diagnosis.impute"):
+                return models.imputer.transform(features)
+        
+        feature_names = models.feature_names if models is not None else self.DEFAULT_FEATURE_NAMES
+        defaults = np.array([self.FEATURE_DEFAULTS.get(name, 0) for name in feature_names], dtype=float)
+        features[missing] = np.broadcast_to(defaults, features.shape)[missing]
+        return features
+
+    def predict_feature_matrix(
+        self,
+        features: np.ndarray,
+        models: Optional[ModelBundle] = None
+    ) -> Dict[str, Any]:
+        """
+        Vectorized trained-model scoring of a raw (N, n_features) matrix
+        whose columns follow the bundle's feature_names.
+        Returns arrays: frail_proba (N, 3), frail_category, fall_proba (N, 2),
+        fall_risk, functional_score, disease_risk_score, plus model_version.
+        """
+        models = models or self.models
+        if models is None:
+            raise RuntimeError("Trained models are not loaded")
+        
+        # One transform + one predict_proba per model. predict() is argmax over
+        # predict_proba, so derive it instead of paying a second pass.
+        with metrics.timer("diagnosis.frail_scaler"):
+            features_scaled_frail = models.frail_scaler.transform(features)
+        with metrics.timer("diagnosis.fall_scaler"):
+            features_scaled_fall = models.fall_scaler.transform(features)
+        
+        # FRAIL prediction (0=Normal, 1=Pre-frail, 2=Frail)
+        with metrics.timer("diagnosis.frail_forest"):
+            frail_proba = models.frail_forest.predict_proba(features_scaled_frail)
+            frail_category = models.frail_forest.classes_.take(np.argmax(frail_proba, axis=1))
+        
+        # Fall risk prediction
+        with metrics.timer("diagnosis.fall_model"):
+            fall_proba = models.fall_model.predict_proba(features_scaled_fall)
+            fall_risk = models.fall_model.classes_.take(np.argmax(fall_proba, axis=1))
+        
+        return {
+            "frail_proba": frail_proba,
+            "frail_category": frail_category,
+            "fall_proba": fall_proba,
+            "fall_risk": fall_risk,
+            # Functional score is the inverse of frailty level
+            "functional_score": 1.0 - (frail_category / 2.0),
+            # Disease risk based on fall prediction probability
+            "disease_risk_score": fall_proba[:, 1],
+            "model_version": models.version
+        }
 
     def analyze_risk_factors(self, user_profile: Dict, health_metrics: Dict) -> Dict[str, Any]:
         """
         Analyze risk factors using trained ML models.
         Returns risk scores and predictions.
         """
-        # Prepare feature vector
-        features = self.prepare_features(user_profile, health_metrics)
+        return self.analyze_risk_factors_batch([user_profile], [health_metrics])[0]
+
+    def analyze_risk_factors_batch(
+        self,
+        user_profiles: List[Dict],
+        health_metrics_list: List[Dict]
+    ) -> List[Dict[str, Any]]:
+        """
+        Analyze risk factors for many users at once.
         
-        if self.models_loaded:
-            # Use trained models
-            features_scaled_frail = self.frail_scaler.transform(features)
-            features_scaled_fall = self.fall_scaler.transform(features)
-            
-            # FRAIL prediction (0=Normal, 1=Pre-frail, 2=Frail)
-            frail_pred = int(self.frail_model.predict(features_scaled_frail)[0])
-            frail_proba = self.frail_model.predict_proba(features_scaled_frail)[0]
-            
-            # Fall risk prediction
-            fall_pred = int(self.fall_model.predict(features_scaled_fall)[0])
-            fall_proba = self.fall_model.predict_proba(features_scaled_fall)[0]
-            
-            # Calculate functional score (inverse of frailty level)
-            functional_score = 1.0 - (frail_pred / 2.0)
+        Builds a single feature matrix so each scaler and model is invoked
+        once per batch instead of once per user. Results are returned in
+        the same order as the inputs.
+        """
+        if len(user_profiles) != len(health_metrics_list):
+            raise ValueError("user_profiles and health_metrics_list must have the same length")
+        if not user_profiles:
+            return []
+        
+        # One snapshot for the whole call; a concurrent reload does not affect it
+        models = self.models
+        model_version = models.version if models is not None else "heuristic"
+        
+        if models is not None:
+            # Use trained models on a single feature matrix
+            with metrics.timer("diagnosis.prepare_features"):
+                features = self.prepare_feature_matrix(
+                    user_profiles, health_metrics_list, models
+                )
+            scores = self.predict_feature_matrix(features, models)
+            frail_probas, frail_preds = scores["frail_proba"], scores["frail_category"]
+            fall_probas, fall_preds = scores["fall_proba"], scores["fall_risk"]
+        
+        results = []
+        for i, (user_profile, health_metrics) in enumerate(zip(user_profiles, health_metrics_list)):
+            if models is not None:
+                frail_pred = int(frail_preds[i])
+                frail_proba = frail_probas[i]
+                fall_pred = int(fall_preds[i])
+                fall_proba = fall_probas[i]
+                
+                # Calculate functional score (inverse of frailty level)
+                functional_score = 1.0 - (frail_pred / 2.0)
+                
+                # Disease risk based on fall prediction probability
+                disease_risk = float(fall_proba[1])
+                
+            else:
+                # Fallback to heuristic calculation
+                disease_risk = self._predict_logistic_risk(user_profile.get('conditions', []))
+                functional_score = self._predict_rf_capacity(health_metrics)
+                frail_pred = 1 if functional_score < 0.5 else 0
+                frail_proba = [0.0, 1.0, 0.0] if functional_score < 0.5 else [1.0, 0.0, 0.0]
+                fall_pred = 1 if disease_risk > 0.5 else 0
+                fall_proba = [1.0 - disease_risk, disease_risk]
             
-            # Disease risk based on fall prediction probability
-            disease_risk = float(fall_proba[1])
+            # Trend: rolling state from the trend store, else the legacy history list
+            trend = self._trend_summary(user_profile)
             
-        else:
-            # Fallback to heuristic calculation
-            disease_risk = self._predict_logistic_risk(user_profile.get('conditions', []))
-            functional_score = self._predict_rf_capacity(health_metrics)
-            frail_pred = 1 if functional_score < 0.5 else 0
-            frail_proba = [0.0, 1.0, 0.0] if functional_score < 0.5 else [1.0, 0.0, 0.0]
-            fall_pred = 1 if disease_risk > 0.5 else 0
-            fall_proba = [1.0 - disease_risk, disease_risk]
-        
-        # Calculate trend from history
-        trend_score = self._predict_arima_trend(user_profile.get('history', []))
+            results.append({
+                "disease_risk_score": disease_risk,
+                "functional_score": functional_score,
+                "trend_score": trend["score"] if trend else 0.5,
+                "trend": trend,
+                "frail_category": frail_pred,
+                "frail_probabilities": {
+                    "Normal": float(frail_proba[0]),
+                    "Pre-frail": float(frail_proba[1]),
+                    "Frail": float(frail_proba[2])
+                },
+                "fall_risk": fall_pred,
+                "fall_probability": float(fall_proba[1]) if len(fall_proba) > 1 else 0.0,
+                "models_used": "trained_ml" if models is not None else "heuristic",
+                "model_version": model_version
+            })
         
-        return {
-            "disease_risk_score": disease_risk,
-            "functional_score": functional_score,
-            "trend_score": trend_score,
-            "frail_category": frail_pred,
-            "frail_probabilities": {
-                "Normal": float(frail_proba[0]),
-                "Pre-frail": float(frail_proba[1]),
-                "Frail": float(frail_proba[2])
-            },
-            "fall_risk": fall_pred,
-            "fall_probability": float(fall_proba[1]) if len(fall_proba) > 1 else 0.0,
-            "models_used": "trained_ml" if self.models_loaded else "heuristic"
-        }
+        metrics.inc(
+            "noricare_diagnosis_total", len(results),
+            models_used="trained_ml" if models is not None else "heuristic"
+        )
+        return results
 
     def _predict_logistic_risk(self, conditions: List[str]) -> float:
         """Fallback: Simulates Logistic Regression output for disease risk."""
@@ -124,13 +333,23 @@ class HybridDiagnosisEngine:
     def _predict_rf_capacity(self, metrics: Dict) -> float:
         """Fallback: Simulates Random Forest output for functional capacity."""
         sppb = metrics.get('sppb', 0)
-        tug = metrics.get('tug', 30)
+        tug = metrics.get('tug')
+        if tug is None or tug != tug:   # left for the k-NN imputer, which is not loaded here
+            tug = 30
         score = (sppb / 12.0) * 0.6 + (max(0, 30 - tug) / 30.0) * 0.4
         return score
 
-    def _predict_arima_trend(self, history: List[float]) -> float:
-        """Analyze trend from historical data."""
+    def _trend_summary(self, user_profile: Dict) -> Optional[Dict[str, Any]]:
+        """
+        Trend of the senior's assessments: score (mean of the last 3 points),
+        EWMA, least-squares slope and point count. api.py passes the state
+        kept by core.trends.TrendStore as profile['trend']; clients that still
+        send the full `history` get the same statistics folded from the list.
+        """
+        trend = user_profile.get('trend')
+        if trend is not None:
+            return trend
+        history = user_profile.get('history') or []
         if not history:
-            return 0.5
-        # Return simple average of last 3 points
-        return sum(history[-3:]) / len(history[-3:])
+            return None
+        return TrendState.from_values(history, DEFAULT_ALPHA).summary()
@@ -0,0 +1,114 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import os
+import threading
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when the inference pool and its queue are full (mapped to HTTP 503)."""
+
+
+class InferenceExecutor:
+    """
+    Bounded pool for CPU-bound model inference.
+    Keeps sklearn/numpy work off the event loop and off FastAPI's shared
+    threadpool. At most max_workers jobs run and max_queue more may wait;
+    anything beyond that is rejected immediately instead of queueing forever.
+    """
+
+    MODES = ("thread", "process")
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: int = 64, mode: str = "thread"):
+        """
+        Args:
+            max_workers: Pool size (default: min(4, CPU count))
+            max_queue: Jobs allowed to wait for a free worker
+            mode: 'thread' or 'process' (process jobs must be picklable module-level functions)
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {self.MODES}, got {mode!r}")
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_queue = max_queue
+        self.mode = mode
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+        # Stats
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls) -> "InferenceExecutor":
+        """
+        Build from NORICARE_INFERENCE_WORKERS, NORICARE_INFERENCE_QUEUE
+        and NORICARE_INFERENCE_MODE.
+        """
+        workers = os.environ.get("NORICARE_INFERENCE_WORKERS")
+        return cls(
+            max_workers=int(workers) if workers else None,
+            max_queue=int(os.environ.get("NORICARE_INFERENCE_QUEUE", 64)),
+            mode=os.environ.get("NORICARE_INFERENCE_MODE", "thread")
+        )
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _get_pool(self) -> Executor:
+        # Created lazily so importing the API in a spawned worker does not start a pool
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    if self.mode == "process":
+                        self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                    else:
+                        self._pool = ThreadPoolExecutor(
+                            max_workers=self.max_workers, thread_name_prefix="inference"
+                        )
+        return self._pool
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        """
+        Run fn(*args) in the pool and await its result.
+        Raises ExecutorSaturatedError if capacity is exhausted.
+        """
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise ExecutorSaturatedError(
+                    f"Inference pool saturated ({self.in_flight} jobs in flight)"
+                )
+            self.in_flight += 1
+
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        # The slot is freed when the job actually finishes, even if the caller
+        # stops waiting (e.g. client disconnect)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
@@ -1,14 +1,93 @@
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional
+import json
+import os
+import threading
+import time
 import numpy as np
+from core.clustering import UserClustering
+from core.mlp import NumpyMLP
+from core.model_registry import ModelRegistry, get_model_registry
+
+# Snapshots live next to the trend store, outside of models/
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.state', 'feedback_state.json')
 
 class OptimizationLoop:
     """
     Step 4: Real-time Optimization Loop (MLP based).
     """
     
-    def __init__(self):
-        # self.mlp_model = load_model('models/mlp_optimizer.h5')
-        pass
+    MIN_INTENSITY = 1
+    MAX_INTENSITY = 10
+    
+    # MLP inputs: rpe, pain, satisfaction, current intensity, one-hot user group
+    FEATURES = ["rpe", "has_pain", "satisfaction", "intensity"] + [f"group_{g}" for g in UserClustering.GROUPS]
+    
+    def __init__(self, registry: Optional[ModelRegistry] = None):
+        """Uses the trained MLP (models/mlp_optimizer.pkl) when present, otherwise rule_deltas()."""
+        self.registry = registry or get_model_registry()
+        self._mlp_for = None
+        self._mlp = None
+
+    @property
+    def mlp(self) -> Optional[NumpyMLP]:
+        # Looked up on access so a retrained optimizer is picked up after a registry reload
+        arrays = self.registry.get_optional('mlp_optimizer')
+        if arrays is not self._mlp_for:
+            self._mlp = NumpyMLP.from_arrays(arrays) if arrays is not None else None
+            self._mlp_for = arrays
+        return self._mlp
+
+    @classmethod
+    def feature_matrix(cls, rpe, has_pain, satisfaction, intensity, group=None) -> np.ndarray:
+        """
+        MLP input matrix (n_events, len(FEATURES)). Scalars are broadcast;
+        group may be one name, an array of names, or None (unknown: all zeros).
+        """
+        rpe = np.asarray(rpe, dtype=np.float64)
+        X = np.zeros((rpe.size, len(cls.FEATURES)))
+        X[:, 0] = rpe
+        X[:, 1] = has_pain
+        X[:, 2] = satisfaction
+        X[:, 3] = intensity
+        if group is not None:
+            group = np.broadcast_to(np.asarray(group, dtype=object), (rpe.size,))
+            for j, name in enumerate(UserClustering.GROUPS):
+                X[:, 4 + j] = group == name
+        return X
+
+    @staticmethod
+    def rule_deltas(rpe: np.ndarray, has_pain: np.ndarray, satisfaction: np.ndarray) -> np.ndarray:
+        """
+        Hand-written intensity rule (fallback without a trained MLP, and the
+        bootstrap target train_models.py distills when there is no feedback history).
+        Logic: If Pain -> Reduce Intensity sharply
+        Logic: If RPE high (>7) -> Reduce slightly
+        Logic: If RPE low (<4) and Satisfaction high -> Increase
+        """
+        rpe, satisfaction = np.asarray(rpe), np.asarray(satisfaction)
+        return np.select(
+            [np.asarray(has_pain, dtype=bool), rpe > 7, (rpe < 4) & (satisfaction >= 4)],
+            [-2, -1, 1],
+            default=0
+        )
+
+    def intensity_deltas(
+        self,
+        rpe: np.ndarray,
+        has_pain: np.ndarray,
+        satisfaction: np.ndarray,
+        intensity: Any = 5,
+        group: Any = None
+    ) -> np.ndarray:
+        """
+        Vectorized intensity adjustment for many feedback events
+        (one MLP forward pass for the whole batch).
+        """
+        mlp = self.mlp
+        if mlp is None:
+            return self.rule_deltas(rpe, has_pain, satisfaction)
+        X = self.feature_matrix(rpe, has_pain, satisfaction, intensity, group)
+        return mlp.predict(X).astype(int)
 
     def fine_tune_prescription(self, current_prescription: Dict[str, Any], feedback_log: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -17,6 +96,7 @@ class OptimizationLoop:
         Args:
             current_prescription: The dict of the exercise just performed.
             feedback_log: { 'rpe': 1-10, 'has_pain': bool, 'satisfaction': 1-5 }
+                ('group' from either dict, e.g. "Frail", refines the MLP's adjustment)
         """
         
         # 1. Extract Feedback Features
@@ -24,22 +104,16 @@ class OptimizationLoop:
         has_pain = feedback_log.get('has_pain', False)
         satisfaction = feedback_log.get('satisfaction', 3)
         current_intensity = current_prescription.get('intensity', 5)
+        group = current_prescription.get('group') or feedback_log.get('group')
         
-        # 2. MLP Inference Simulation
-        # Logic: If Pain -> Reduce Intensity sharply
-        # Logic: If RPE high (>7) -> Reduce slightly
-        # Logic: If RPE low (<4) and Satisfaction high -> Increase
-        
-        delta = 0
-        if has_pain:
-            delta = -2
-        elif rpe > 7:
-            delta = -1
-        elif rpe < 4 and satisfaction >= 4:
-            delta = +1
+        # 2. MLP Inference (same model as the batched path)
+        delta = int(self.intensity_deltas(
+            np.array([rpe]), np.array([bool(has_pain)]), np.array([satisfaction]),
+            current_intensity, group
+        )[0])
             
         # 3. Apply Adjustment
-        new_intensity = max(1, min(10, current_intensity + delta))
+        new_intensity = max(self.MIN_INTENSITY, min(self.MAX_INTENSITY, current_intensity + delta))
         
         optimized = current_prescription.copy()
         optimized['intensity'] = new_intensity
@@ -49,3 +123,259 @@ class OptimizationLoop:
             optimized['needs_review'] = True
             
         return optimized
+
+
+class FeedbackStateStore:
+    """
+    Per-senior, per-exercise intensity state driven by FeedbackLog events
+    (packages/database/schema.prisma), so tablets only sync their logs
+    instead of posting the whole prescription with every feedback.
+
+    State is keyed by (seniorId, prescriptionId) -- one ExercisePrescription
+    row is one exercise for one senior -- and kept in memory. It is written
+    to a JSON snapshot at most every `snapshot_interval` seconds (and on
+    close) and reloaded at startup. Each exercise remembers the ids of its
+    last APPLIED_ID_WINDOW applied events: re-sending a day's sync is
+    harmless, while events that arrive late (a second tablet, a delayed
+    upload) are still applied.
+    """
+
+    DEFAULT_INTENSITY = 5
+    # Applied FeedbackLog ids remembered per exercise for de-duplication
+    APPLIED_ID_WINDOW = 512
+
+    def __init__(
+        self,
+        optimizer: Optional[OptimizationLoop] = None,
+        snapshot_path: Optional[str] = None,
+        snapshot_interval: float = 30.0
+    ):
+        """
+        Args:
+            optimizer: Provides the intensity rule (default: OptimizationLoop())
+            snapshot_path: JSON file for snapshots; None keeps state in memory only
+            snapshot_interval: Minimum seconds between snapshots written by ingest()
+        """
+        self.optimizer = optimizer or OptimizationLoop()
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        # seniorId -> prescriptionId -> state
+        self._state: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._dirty = False
+        self._last_snapshot = time.monotonic()
+
+        if snapshot_path and os.path.exists(snapshot_path):
+            self._load_snapshot()
+
+    @classmethod
+    def from_env(cls, optimizer: Optional[OptimizationLoop] = None) -> "FeedbackStateStore":
+        """Configured by NORICARE_FEEDBACK_SNAPSHOT and NORICARE_FEEDBACK_SNAPSHOT_S."""
+        return cls(
+            optimizer=optimizer,
+            snapshot_path=os.environ.get("NORICARE_FEEDBACK_SNAPSHOT") or DEFAULT_SNAPSHOT_PATH,
+            snapshot_interval=float(os.environ.get("NORICARE_FEEDBACK_SNAPSHOT_S", 30))
+        )
+
+    def ingest(
+        self,
+        events: Iterable[Dict[str, Any]],
+        intensities: Optional[Dict[str, int]] = None,
+        groups: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Apply a batch of FeedbackLog events.
+
+        Args:
+            events: Dicts with FeedbackLog fields (id, seniorId, prescriptionId,
+                loggedAt, hasPain, rpeScore, satisfaction, ...), in any order
+            intensities: Current intensity per prescriptionId, used for
+                exercises without state yet (default DEFAULT_INTENSITY)
+            groups: User group per seniorId (e.g. "Frail"); remembered in the
+                state and passed to the optimizer
+
+        Returns:
+            {"applied", "late", "skipped", "updated": [state per touched exercise]}
+            (late: applied, but logged before an event applied earlier;
+            skipped: no prescriptionId, or already applied)
+        """
+        events = list(events)
+        intensities = intensities or {}
+        groups = groups or {}
+
+        # 1. Only events tied to a prescription can adjust an exercise;
+        #    sort so each exercise sees its events in the order they were logged
+        usable = [e for e in events if e.get('prescriptionId')]
+        usable.sort(key=lambda e: (str(e['loggedAt']), str(e.get('id') or '')))
+        skipped = len(events) - len(usable)
+        if not usable:
+            return {"applied": 0, "late": 0, "skipped": skipped, "updated": []}
+
+        low, high = self.optimizer.MIN_INTENSITY, self.optimizer.MAX_INTENSITY
+        touched = {}    # (seniorId, prescriptionId) -> new events in this batch
+        with self._lock:
+            # 2. Drop events already applied (by id); the k-th new event of
+            #    every exercise goes into round k. Late events are folded
+            #    into the current intensity like any other.
+            rounds: List[List[Any]] = []
+            seen: Dict[Any, set] = {}
+            late = 0
+            for event in usable:
+                key = (event['seniorId'], event['prescriptionId'])
+                state = self._state_for(key, intensities, groups)
+                applied_ids = seen.get(key)
+                if applied_ids is None:
+                    applied_ids = seen[key] = set(state["appliedIds"])
+                event_id = self.event_id(event)
+                if event_id in applied_ids:
+                    skipped += 1
+                    continue
+                applied_ids.add(event_id)
+                position = (str(event['loggedAt']), str(event.get('id') or ''))
+                if state["lastLoggedAt"] is not None and position < (state["lastLoggedAt"], state["lastEventId"] or ''):
+                    late += 1
+                rank = touched.get(key, 0)
+                touched[key] = rank + 1
+                if rank == len(rounds):
+                    rounds.append([])
+                rounds[rank].append((state, event, position))
+
+            # 3. One vectorized optimizer call per round: the intensity an
+            #    event is judged against includes the earlier events' adjustments
+            applied = 0
+            for batch in rounds:
+                states = [state for state, _, _ in batch]
+                deltas = self.optimizer.intensity_deltas(
+                    np.array([e.get('rpeScore', 5) for _, e, _ in batch]),
+                    np.array([bool(e.get('hasPain', False)) for _, e, _ in batch]),
+                    np.array([e.get('satisfaction', 3) for _, e, _ in batch]),
+                    np.array([state["intensity"] for state in states]),
+                    np.array([state.get("group") for state in states], dtype=object)
+                ).tolist()
+                for (state, event, position), delta in zip(batch, deltas):
+                    state["intensity"] = max(low, min(high, state["intensity"] + delta))
+                    if event.get('hasPain'):
+                        state["needsReview"] = True
+                    state["events"] += 1
+                    state["appliedIds"].append(self.event_id(event))
+                    if state["lastLoggedAt"] is None or position > (state["lastLoggedAt"], state["lastEventId"] or ''):
+                        state["lastLoggedAt"], state["lastEventId"] = position
+                applied += len(batch)
+
+            for senior, exercise in touched:
+                state = self._state[senior][exercise]
+                del state["appliedIds"][:-self.APPLIED_ID_WINDOW]
+
+            updated = [self._public(self._state[senior][exercise]) for senior, exercise in touched]
+            if touched:
+                self._dirty = True
+
+        self.maybe_snapshot()
+        return {"applied": applied, "late": late, "skipped": skipped, "updated": updated}
+
+    @staticmethod
+    def event_id(event: Dict[str, Any]) -> str:
+        """FeedbackLog id, or the loggedAt of an event sent without one."""
+        return str(event.get('id') or f"@{event['loggedAt']}")
+
+    def _state_for(self, key, intensities: Dict[str, int], groups: Dict[str, str]) -> Dict[str, Any]:
+        """State of (seniorId, prescriptionId), created on first sight (call with _lock held)."""
+        senior_id, prescription_id = key
+        exercises = self._state.setdefault(senior_id, {})
+        state = exercises.get(prescription_id)
+        if state is None:
+            state = exercises[prescription_id] = {
+                "seniorId": senior_id,
+                "prescriptionId": prescription_id,
+                "intensity": int(intensities.get(prescription_id, self.DEFAULT_INTENSITY)),
+                "group": None,
+                "needsReview": False,
+                "events": 0,
+                "lastLoggedAt": None,
+                "lastEventId": None,
+                "appliedIds": []
+            }
+        if senior_id in groups:
+            state["group"] = groups[senior_id]
+        return state
+
+    @staticmethod
+    def _public(state: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of a state for callers, without the de-duplication window."""
+        return {k: v for k, v in state.items() if k != "appliedIds"}
+
+    def get(self, senior_id: str, prescription_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._state.get(senior_id, {}).get(prescription_id)
+            return self._public(state) if state is not None else None
+
+    def senior_state(self, senior_id: str) -> List[Dict[str, Any]]:
+        """Current intensity state of every exercise of one senior."""
+        with self._lock:
+            return [self._public(state) for state in self._state.get(senior_id, {}).values()]
+
+    def __len__(self) -> int:
+        return sum(len(exercises) for exercises in self._state.values())
+
+    def maybe_snapshot(self):
+        """Write a snapshot if state changed and the interval has passed."""
+        if self._dirty and time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+            self.snapshot()
+
+    def snapshot(self):
+        """Write all state to snapshot_path atomically (no-op without a path)."""
+        if not self.snapshot_path:
+            return
+        with self._snapshot_lock:
+            with self._lock:
+                states = [state for exercises in self._state.values() for state in exercises.values()]
+                encoded = json.dumps({"version": 1, "states": states})
+                self._dirty = False
+                self._last_snapshot = time.monotonic()
+
+            # Encoded under the lock, written outside it: ingest() is not blocked on disk I/O
+            os.makedirs(os.path.dirname(os.path.abspath(self.snapshot_path)), exist_ok=True)
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(encoded)
+            os.replace(tmp_path, self.snapshot_path)
+
+    def _load_snapshot(self):
+        """
+        Restore state from snapshot_path. An unreadable file (e.g. truncated
+        by a crash) is moved aside to *.corrupt and the store starts empty;
+        malformed entries are skipped.
+        """
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                states = json.load(f)["states"]
+            if not isinstance(states, list):
+                raise ValueError("'states' is not a list")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[Feedback] Ignoring unreadable snapshot {self.snapshot_path}: {e}")
+            try:
+                os.replace(self.snapshot_path, self.snapshot_path + ".corrupt")
+            except OSError:
+                pass
+            return
+
+        dropped = 0
+        for state in states:
+            try:
+                state["intensity"] = int(state["intensity"])
+                if "appliedIds" not in state:
+                    # Snapshots before id de-duplication only kept the last event
+                    last = state.get("lastEventId") or (
+                        f"@{state['lastLoggedAt']}" if state.get("lastLoggedAt") else None
+                    )
+                    state["appliedIds"] = [last] if last else []
+                self._state.setdefault(state["seniorId"], {})[state["prescriptionId"]] = state
+            except (KeyError, TypeError, ValueError):
+                dropped += 1
+        print(f"[Feedback] Restored intensity state for {len(self)} exercises"
+              + (f" ({dropped} malformed entries skipped)" if dropped else ""))
+
+    def close(self):
+        if self._dirty:
+            self.snapshot()
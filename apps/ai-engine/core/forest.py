@@ -0,0 +1,172 @@
+from typing import Any, Dict, Optional
+import numpy as np
+
+
+class FlatForest:
+    """
+    Array-based evaluator for a trained RandomForestClassifier.
+    All trees are flattened into contiguous node arrays
+    (feature, threshold, left, right, value) so a whole batch is routed
+    through every tree with a handful of vectorized numpy steps,
+    without sklearn's per-call validation and joblib dispatch.
+
+    Probabilities match RandomForestClassifier.predict_proba to the last
+    bit or two, depending on the sklearn version (quantized forests:
+    routing is identical, probabilities agree to ~1e-7); see matches().
+    """
+
+    ARRAYS = ("feature", "threshold", "left", "right", "value", "roots", "classes")
+
+    # Largest allowed difference to predict_proba (matches())
+    ATOL = 1e-12
+    QUANTIZED_ATOL = 1e-6
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        classes: np.ndarray,
+        max_depth: int,
+        n_features: Optional[int] = None
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = int(max_depth)
+        if n_features is None:
+            # Exports without n_features: at least every feature used in a split
+            n_features = int(feature.max()) + 1 if len(feature) else 0
+        self.n_features_in_ = int(n_features)
+
+    @classmethod
+    def from_sklearn(cls, model) -> "FlatForest":
+        """Flatten a fitted (single-output) RandomForestClassifier."""
+        import sklearn
+        # sklearn < 1.4 stores class counts in tree_.value and normalizes in
+        # predict_proba; newer versions store the fractions directly.
+        normalize = tuple(int(v) for v in sklearn.__version__.split('.')[:2]) < (1, 4)
+        n_classes = len(model.classes_)
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(n_nodes)
+            is_leaf = tree.children_left == -1
+
+            # Leaves point at themselves, so extra traversal steps are no-ops
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+
+            # Same per-node output as DecisionTreeClassifier.predict_proba
+            proba = np.array(tree.value[:, 0, :n_classes], dtype=np.float64)
+            if normalize:
+                normalizer = proba.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                proba /= normalizer
+            values.append(proba)
+
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.int32),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.int32),
+            right=np.ascontiguousarray(np.concatenate(rights), dtype=np.int32),
+            value=np.ascontiguousarray(np.concatenate(values)),
+            roots=np.asarray(roots, dtype=np.int32),
+            classes=np.asarray(model.classes_),
+            max_depth=max_depth,
+            n_features=model.n_features_in_
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, Any]) -> "FlatForest":
+        """Rebuild from the dict written by to_arrays() (see train_models.py)."""
+        return cls(
+            **{name: arrays[name] for name in cls.ARRAYS},
+            max_depth=int(arrays["max_depth"]),
+            n_features=arrays.get("n_features")
+        )
+
+    def to_arrays(self) -> Dict[str, Any]:
+        """Plain dict of numpy arrays, suitable for joblib.dump (and mmap on load)."""
+        arrays = {name: getattr(self, name) for name in self.ARRAYS if name != "classes"}
+        arrays["classes"] = self.classes_
+        arrays["max_depth"] = self.max_depth
+        arrays["n_features"] = self.n_features_in_
+        return arrays
+
+    @property
+    def quantized(self) -> bool:
+        return self.value.dtype == np.float32
+
+    def quantize(self) -> "FlatForest":
+        """
+        Smaller copy: float32 thresholds and leaf values, and the narrowest
+        integer types for the node arrays.
+        Inputs are compared as float32, so rounding each threshold down to
+        the largest float32 <= threshold sends every sample the same way.
+        """
+        threshold = self.threshold.astype(np.float32)
+        too_high = threshold.astype(np.float64) > self.threshold
+        threshold[too_high] = np.nextafter(threshold[too_high], np.float32(-np.inf))
+
+        index_dtype = np.int16 if len(self.feature) <= np.iinfo(np.int16).max else np.int32
+        feature_dtype = np.int8 if self.n_features_in_ <= np.iinfo(np.int8).max else np.int16
+        return FlatForest(
+            feature=self.feature.astype(feature_dtype),
+            threshold=threshold,
+            left=self.left.astype(index_dtype),
+            right=self.right.astype(index_dtype),
+            value=self.value.astype(np.float32),
+            roots=self.roots.astype(index_dtype),
+            classes=self.classes_,
+            max_depth=self.max_depth,
+            n_features=self.n_features_in_
+        )
+
+    def matches(self, proba: np.ndarray, reference: np.ndarray) -> bool:
+        """
+        Whether our predict_proba output agrees with the sklearn model's.
+        Not bit-exact: the forest may have been exported under another
+        sklearn version, which can differ in the last bit.
+        """
+        atol = self.QUANTIZED_ATOL if self.quantized else self.ATOL
+        return proba.shape == reference.shape and np.allclose(proba, reference, rtol=0, atol=atol)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Class probabilities, shape (n_samples, n_classes)."""
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+
+        # (n_samples, n_trees) current node per sample per tree
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        # Summing over the leading tree axis accumulates tree by tree,
+        # in the same order as the forest does, so the floats match exactly.
+        proba = self.value[nodes.T].sum(axis=0)
+        proba /= len(self.roots)
+        return proba
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Predicted class labels."""
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
@@ -0,0 +1,109 @@
+from itertools import combinations
+from typing import Dict, List, Optional
+import threading
+import numpy as np
+from sklearn.neighbors import KDTree
+
+
+class NeighborImputer:
+    """
+    k-nearest-neighbour imputation for the diagnosis features, fitted on
+    senior_walking_data.csv by train_models.py (models/imputer.pkl).
+
+    A missing value becomes the mean of that column over the k training
+    seniors closest on the columns that *are* observed (standardized).
+    There is one KD-tree per observed-column pattern, so imputing a row
+    is a single tree query instead of a scan of the training set. Trees
+    for the sparse patterns requests usually have (e.g. only TUG from a
+    PHR upload) are built at fit time and saved; other patterns are built
+    on first use and kept (up to max_trees).
+    """
+
+    def __init__(self, n_neighbors: int = 5, leaf_size: int = 40, max_trees: int = 64):
+        self.n_neighbors = n_neighbors
+        self.leaf_size = leaf_size
+        self.max_trees = max_trees
+        self._lock = threading.Lock()
+
+    def fit(self, X: np.ndarray, feature_names: List[str], precompute_observed: int = 1) -> "NeighborImputer":
+        """
+        Args:
+            X: Complete training matrix (n_samples, n_features), raw units
+            feature_names: Column names, in the order used by the models
+            precompute_observed: Build trees for every pattern with at most
+                this many observed columns
+        """
+        X = np.asarray(X, dtype=np.float64)
+        self.feature_names = list(feature_names)
+        self.data_ = X
+        self.mean_ = X.mean(axis=0)
+        scale = X.std(axis=0)
+        self.scale_ = np.where(scale > 0, scale, 1.0)
+        self.median_ = np.median(X, axis=0)
+        self.trees_: Dict[int, KDTree] = {}
+
+        for size in range(1, precompute_observed + 1):
+            for columns in combinations(range(X.shape[1]), size):
+                self._tree(sum(1 << j for j in columns))
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def statistic(self, name: str) -> Optional[float]:
+        """Training median of a column (for callers without any other context)."""
+        if name not in self.feature_names:
+            return None
+        return float(self.median_[self.feature_names.index(name)])
+
+    def _columns(self, observed_bits: int) -> np.ndarray:
+        return np.flatnonzero([(observed_bits >> j) & 1 for j in range(self.data_.shape[1])])
+
+    def _tree(self, observed_bits: int) -> KDTree:
+        tree = self.trees_.get(observed_bits)
+        if tree is None:
+            columns = self._columns(observed_bits)
+            standardized = (self.data_[:, columns] - self.mean_[columns]) / self.scale_[columns]
+            tree = KDTree(standardized, leaf_size=self.leaf_size)
+            with self._lock:
+                if len(self.trees_) < self.max_trees:
+                    tree = self.trees_.setdefault(observed_bits, tree)
+        return tree
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """
+        Fill the NaN cells of X (n_samples, n_features) in place and return it.
+        Rows are grouped by missing pattern: one vectorized query per pattern.
+        """
+        missing = np.isnan(X)
+        incomplete = missing.any(axis=1)
+        if not incomplete.any():
+            return X
+
+        weights = 1 << np.arange(X.shape[1])
+        observed_bits = (~missing[incomplete]) @ weights
+        rows = np.flatnonzero(incomplete)
+
+        for bits in np.unique(observed_bits):
+            group = rows[observed_bits == bits]
+            if bits == 0:
+                # Nothing to compare on: training medians
+                X[group] = self.median_
+                continue
+
+            observed = self._columns(int(bits))
+            query = (X[np.ix_(group, observed)] - self.mean_[observed]) / self.scale_[observed]
+            _, neighbors = self._tree(int(bits)).query(query, k=self.n_neighbors)
+
+            # (group, k, n_features) -> mean over neighbours, written only where missing
+            estimates = self.data_[neighbors].mean(axis=1)
+            group_missing = missing[group]
+            X[group] = np.where(group_missing, estimates, X[group])
+
+        return X
@@ -0,0 +1,319 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import math
+import re
+import zlib
+import numpy as np
+from core.catalog import ExerciseCatalog
+
+# Time per unit of an exercises.json "reps" value (e.g. "12회", "20보", "30초", "5분")
+SECONDS_PER_UNIT = {"회": 4, "보": 1, "초": 1, "분": 60}
+REST_BETWEEN_SETS_S = 30
+
+_REPS = re.compile(r"(\d+)\s*(회|보|초|분)")
+_PARENTHESES = re.compile(r"\s*\(.*?\)")
+
+
+def exercise_minutes(sets: int, reps: str) -> int:
+    """Session time of one exercise, sets plus rests, rounded up to whole minutes (at least 1)."""
+    match = _REPS.search(reps or "")
+    per_set = int(match.group(1)) * SECONDS_PER_UNIT[match.group(2)] if match else 60
+    total = sets * per_set + max(0, sets - 1) * REST_BETWEEN_SETS_S
+    return max(1, math.ceil(total / 60))
+
+
+def exercise_family(name: str) -> str:
+    """Movement family: last word of the name without qualifiers ("빠르게 걷기" -> "걷기")."""
+    words = _PARENTHESES.sub("", name).split()
+    return words[-1] if words else name
+
+
+def type_counts(num_exercises: int, ratios: Dict[str, float]) -> Dict[str, int]:
+    """Split num_exercises over types by ratio (largest remainder, ties in preference order)."""
+    total = sum(ratios.values()) or 1.0
+    shares = {ex_type: num_exercises * ratio / total for ex_type, ratio in ratios.items()}
+    counts = {ex_type: int(share) for ex_type, share in shares.items()}
+    by_remainder = sorted(ratios, key=lambda ex_type: -(shares[ex_type] - counts[ex_type]))
+    for ex_type in by_remainder[:num_exercises - sum(counts.values())]:
+        counts[ex_type] += 1
+    return counts
+
+
+class RoutineOptimizer:
+    """
+    Constrained exercise selection over a compiled catalog.
+
+    Picks num_exercises exercises maximizing the summed score (fit to the
+    group's intensity range, plus a per-user variety term) such that:
+    - the number of exercises per type follows the group's type ratios,
+    - at most one exercise per movement family is chosen,
+    - total session time stays within the time budget,
+    - total intensity stays within the intensity cap.
+
+    The catalog is filtered and scored with vectorized numpy, then a few
+    top-scoring candidates per type go into an exact 0/1 knapsack DP over
+    (count, minutes, intensity). Types are solved one after the other, each
+    starting from the previous type's table, so the DP never grows beyond
+    one type's count dimension.
+    """
+
+    # Weight of the per-user variety term relative to intensity fit (0..1)
+    VARIETY_WEIGHT = 0.25
+    # Knapsack candidates per type: best `CANDIDATE_FACTOR * count + CANDIDATE_EXTRA` by score,
+    # plus the `count` shortest of the whole type so a tight time budget stays feasible
+    CANDIDATE_FACTOR = 1
+    CANDIDATE_EXTRA = 3
+
+    def __init__(self, catalog: ExerciseCatalog):
+        rows = catalog.rows
+        self.catalog = catalog
+        self.intensity = np.asarray(rows["intensity"], dtype=np.int64)
+        self.blocked = np.ascontiguousarray(rows["contraindicated"])
+        # Minutes and families are parsed once per distinct value, not per row
+        reps, reps_code = np.unique(np.asarray(rows["reps"]), return_inverse=True)
+        plan, plan_code = np.unique(np.asarray(rows["sets"], dtype=np.int64) * len(reps) + reps_code,
+                                    return_inverse=True)
+        self.minutes = np.array(
+            [exercise_minutes(int(code) // len(reps), str(reps[code % len(reps)])) for code in plan.tolist()],
+            dtype=np.int64
+        )[plan_code]
+        names, name_code = np.unique(np.asarray(rows["name"]), return_inverse=True)
+        _, family_code = np.unique(np.array([exercise_family(str(name)) for name in names], dtype=str),
+                                   return_inverse=True)
+        self.family = family_code[name_code]
+        type_names, self.type_code = np.unique(np.asarray(rows["type"]), return_inverse=True)
+        self.type_index = {str(name): code for code, name in enumerate(type_names)}
+        # Per-row constants of the variety term (see variety())
+        h = np.asarray(rows["id"], dtype=np.uint64)
+        self._variety_offset = self._unit_hash(h)
+        self._variety_rate = self._unit_hash(h ^ np.uint64(0x5851F42D4C957F2D))
+        self._eligible: Dict[Tuple[int, int, int], Dict[int, Tuple[np.ndarray, ...]]] = {}
+
+    @staticmethod
+    def _unit_hash(h: np.ndarray) -> np.ndarray:
+        """splitmix64 of each value, as floats in [0, 1)."""
+        h = h * np.uint64(0x9E3779B97F4A7C15)
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+        return (h >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+    def variety(self, variety_key: Optional[str], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Deterministic per-(key, exercise) values in [0, 1) for `rows` (default: all);
+        zeros without a key. Each exercise moves at its own rate as the key's
+        hash grows, so different keys rank exercises differently.
+        """
+        if rows is None:
+            rows = slice(None)
+        if variety_key is None:
+            return np.zeros_like(self._variety_offset[rows])
+        return self._variety_terms(variety_key, self._variety_offset[rows], self._variety_rate[rows])
+
+    @staticmethod
+    def _variety_terms(variety_key: str, offset: np.ndarray, rate: np.ndarray) -> np.ndarray:
+        key = float(zlib.crc32(variety_key.encode("utf-8")))
+        return (offset + key * rate) % 1.0
+
+    def optimize(
+        self,
+        intensity_range: Tuple[int, int],
+        type_ratios: Dict[str, float],
+        num_exercises: int,
+        session_minutes: int,
+        max_total_intensity: int,
+        conditions: Sequence[str] = (),
+        variety_key: Optional[str] = None
+    ) -> List[int]:
+        """
+        Row indices of the chosen exercises, grouped by type in type_ratios
+        order and best score first. If no routine of num_exercises fits the
+        budgets, the longest routine that does is returned (possibly empty).
+        """
+        low, high = intensity_range
+        eligible = self._eligible_by_type(low, high, session_minutes)
+        blocked_for = np.uint64(self.catalog.condition_mask(conditions))
+
+        # Per type: the safe rows that can make the candidate lists, and their scores.
+        # Rows are sorted by fit and variety adds less than VARIETY_WEIGHT, so
+        # rows whose fit is VARIETY_WEIGHT below the `top`-th safe one cannot
+        # outscore any of the first `top` and are never scored.
+        top = 4 * (self.CANDIDATE_FACTOR * num_exercises + self.CANDIDATE_EXTRA)
+        pools, available = {}, {}
+        empty = (np.empty(0, dtype=np.int64),) * 2 + (np.empty(0),) * 3 + (np.empty(0, dtype=np.uint64),)
+        for ex_type in type_ratios:
+            rows, by_minutes, fit, offset, rate, blocked = eligible.get(self.type_index.get(ex_type), empty)
+            safe = None
+            if blocked_for:
+                is_safe = (blocked & blocked_for) == 0
+                safe = np.flatnonzero(is_safe)
+                by_minutes = by_minutes[is_safe[by_minutes]]
+            available[ex_type] = len(rows) if safe is None else len(safe)
+            if available[ex_type] > top:
+                cutoff = fit[top - 1 if safe is None else safe[top - 1]] - self.VARIETY_WEIGHT
+                end = int(np.searchsorted(-fit, -cutoff, side="right"))
+                keep = slice(end) if safe is None else safe[:np.searchsorted(safe, end)]
+            else:
+                keep = slice(None) if safe is None else safe
+            # Best fit first; without a variety term the scores are the fit, already in order
+            pool = [rows[keep], fit[keep], variety_key is None]
+            # Shortest first (fit order among equals), a few per exercise wanted
+            short = by_minutes[:2 * num_exercises]
+            pool += [rows[short], fit[short]]
+            if variety_key is not None:
+                pool[1] = pool[1] + self.VARIETY_WEIGHT * self._variety_terms(variety_key, offset[keep], rate[keep])
+                pool[4] = pool[4] + self.VARIETY_WEIGHT * self._variety_terms(variety_key, offset[short], rate[short])
+            pools[ex_type] = pool
+
+        for n in range(num_exercises, 0, -1):
+            counts = self._feasible_counts(type_counts(n, type_ratios), available)
+            if sum(counts.values()) < n or n * low > max_total_intensity:
+                continue
+            stages = [
+                (count,) + self._candidates(*pools[ex_type], count)
+                for ex_type, count in counts.items() if count
+            ]
+            # Eligible rows are within the intensity range: a larger cap changes nothing
+            slack = min(max_total_intensity - n * low, n * (high - low))
+            chosen = self._solve(stages, low, session_minutes, slack)
+            if chosen is not None:
+                return chosen
+        return []
+
+    def _eligible_by_type(self, low: int, high: int, session_minutes: int) -> Dict[int, Tuple[np.ndarray, ...]]:
+        """
+        Type code -> (rows within the intensity range that fit the session,
+        best intensity fit first; positions in that order sorted by minutes;
+        their fit, variety constants and contraindication masks). Cached:
+        there are only a few distinct groups and budgets.
+        """
+        key = (low, high, session_minutes)
+        eligible = self._eligible.get(key)
+        if eligible is None:
+            mask = (self.intensity >= low) & (self.intensity <= high) & (self.minutes <= session_minutes)
+            fit = 1.0 - np.abs(self.intensity - (low + high) / 2) / ((high - low) / 2 + 1)
+            eligible = {}
+            for code in self.type_index.values():
+                rows = np.flatnonzero(mask & (self.type_code == code))
+                rows = rows[np.argsort(-fit[rows], kind="stable")]
+                eligible[code] = (
+                    rows, np.argsort(self.minutes[rows], kind="stable"), fit[rows],
+                    self._variety_offset[rows], self._variety_rate[rows], self.blocked[rows]
+                )
+            if len(self._eligible) >= 64:
+                self._eligible.clear()
+            self._eligible[key] = eligible
+        return eligible
+
+    @staticmethod
+    def _feasible_counts(counts: Dict[str, int], available: Dict[str, int]) -> Dict[str, int]:
+        """Cap counts at the available exercises and move the shortfall to types with spare ones."""
+        capped = {ex_type: min(count, available[ex_type]) for ex_type, count in counts.items()}
+        missing = sum(counts.values()) - sum(capped.values())
+        for ex_type in capped:
+            extra = min(missing, available[ex_type] - capped[ex_type])
+            capped[ex_type] += extra
+            missing -= extra
+        return capped
+
+    def _candidates(
+        self,
+        rows: np.ndarray,
+        score: np.ndarray,
+        ranked: bool,
+        short_rows: np.ndarray,
+        short_score: np.ndarray,
+        count: int
+    ) -> Tuple[List[int], List[float]]:
+        """
+        Best-scoring rows of one type plus `count` of the shortest ones, one
+        per family; best first. `ranked`: rows are already sorted by score;
+        short_rows are sorted by minutes.
+        """
+        keep = self.CANDIDATE_FACTOR * count + self.CANDIDATE_EXTRA
+        if not ranked:
+            if len(rows) > 4 * keep:
+                top = np.argpartition(-score, 4 * keep)[:4 * keep]
+                rows, score = rows[top], score[top]
+            order = np.argsort(-score, kind="stable")
+            rows, score = rows[order], score[order]
+        rows, score = rows[:4 * keep], score[:4 * keep]
+
+        # Few rows from here on: plain Python is cheaper than more numpy calls
+        seen, picked = set(), []
+        for row, family, value in zip(rows.tolist(), self.family[rows].tolist(), score.tolist()):
+            if family not in seen:
+                seen.add(family)
+                picked.append((row, value))
+                if len(picked) == keep:
+                    break
+        added = 0
+        for row, family, value in zip(short_rows.tolist(), self.family[short_rows].tolist(), short_score.tolist()):
+            if added == count:
+                break
+            if family not in seen:
+                seen.add(family)
+                picked.append((row, value))
+                added += 1
+        picked.sort(key=lambda item: -item[1])
+        return [row for row, _ in picked], [value for _, value in picked]
+
+    def _solve(
+        self,
+        stages: List[Tuple[int, List[int], List[float]]],
+        low: int,
+        minutes_budget: int,
+        intensity_slack: int
+    ) -> Optional[List[int]]:
+        """
+        Exact DP. State: (exercises taken in this type, minutes used,
+        intensity above `low` used); the layer with all of a type's
+        exercises taken seeds the next type. The table is sized to what the
+        candidates can actually use, whatever the budgets.
+        """
+        minutes_budget = min(minutes_budget, sum(int(self.minutes[candidates].sum()) for _, candidates, _ in stages))
+        shape = (minutes_budget + 1, intensity_slack + 1)
+        base = np.full(shape, -np.inf)
+        base[0, 0] = 0.0
+        history = []
+
+        for count, candidates, scores in stages:
+            table = np.full((count + 1,) + shape, -np.inf)
+            table[0] = base
+            takes = []
+            n_items = len(candidates)
+            for k, (row, score) in enumerate(zip(candidates, scores)):
+                dt, de = int(self.minutes[row]), int(self.intensity[row]) - low
+                # Layers this item can fill: at most k+1 taken so far, and
+                # enough items left to still reach `count`
+                first, last = max(1, count - (n_items - 1 - k)), min(k + 1, count)
+                if dt > minutes_budget or de > intensity_slack or first > last:
+                    takes.append(None)
+                    continue
+                source = table[first - 1:last, :shape[0] - dt, :shape[1] - de] + score
+                target = table[first:last + 1, dt:, de:]
+                take = source > target
+                np.copyto(target, source, where=take)
+                takes.append((first, take))
+            history.append((candidates, takes))
+            base = table[count]
+
+        best = int(np.argmax(base))
+        if base.flat[best] == -np.inf:
+            return None
+
+        # Backtrack from the best final state, last type first
+        t, e = np.unravel_index(best, shape)
+        chosen = []
+        for (count, _, _), (candidates, takes) in zip(reversed(stages), reversed(history)):
+            picked = []
+            for row, taken in zip(reversed(candidates), reversed(takes)):
+                if taken is None or count == 0:
+                    continue
+                first, take = taken
+                dt, de = int(self.minutes[row]), int(self.intensity[row]) - low
+                if (first <= count < first + len(take) and t >= dt and e >= de
+                        and take[count - first, t - dt, e - de]):
+                    picked.append(row)
+                    count, t, e = count - 1, t - dt, e - de
+            chosen.append(picked[::-1])
+        return [row for picked in reversed(chosen) for row in picked]
@@ -0,0 +1,58 @@
+from typing import Any, Callable
+import threading
+
+
+class LazyComponent:
+    """
+    Stand-in for a component that is expensive to build (models, catalog,
+    state stores). The factory runs on first attribute access, or on an
+    explicit resolve() (e.g. from the API's warm-up hook), exactly once
+    even under concurrent first use. Attribute reads and writes are then
+    forwarded to the real object.
+
+    Factories import their modules themselves, so importing the module that
+    declares the component does not pull in numpy/sklearn/joblib.
+    """
+
+    __slots__ = ("_lazy_name", "_lazy_factory", "_lazy_instance", "_lazy_lock")
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        object.__setattr__(self, "_lazy_name", name)
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_instance", None)
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(resolve(self), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(resolve(self), attr, value)
+
+    def __repr__(self) -> str:
+        state = "loaded" if is_loaded(self) else "not loaded"
+        return f"<LazyComponent {object.__getattribute__(self, '_lazy_name')} ({state})>"
+
+
+def resolve(component: Any) -> Any:
+    """The real object behind a LazyComponent (built if needed); other objects are returned as is."""
+    if not isinstance(component, LazyComponent):
+        return component
+    instance = object.__getattribute__(component, "_lazy_instance")
+    if instance is None:
+        with object.__getattribute__(component, "_lazy_lock"):
+            instance = object.__getattribute__(component, "_lazy_instance")
+            if instance is None:
+                instance = object.__getattribute__(component, "_lazy_factory")()
+                object.__setattr__(component, "_lazy_instance", instance)
+    return instance
+
+
+def is_loaded(component: Any) -> bool:
+    """True once the factory has run (always True for plain objects)."""
+    if not isinstance(component, LazyComponent):
+        return True
+    return object.__getattribute__(component, "_lazy_instance") is not None
+
+
+def component_name(component: LazyComponent) -> str:
+    return object.__getattribute__(component, "_lazy_name")
@@ -0,0 +1,203 @@
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import threading
+import time
+
+# Latency buckets in seconds (50us .. 2.5s); the hot path lives in the low end
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = [
+        '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in labels
+    ]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative buckets are derived at render time)."""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class _Timer:
+    """Context manager recording elapsed seconds into a histogram."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics with Prometheus text exposition.
+    Cheap enough to stay on in production: an observation is a bisect
+    and a few integer adds. Values from other components (cache, batcher,
+    executor) are pulled at scrape time through collectors.
+
+    Note: with NORICARE_INFERENCE_MODE=process, stages timed inside pool
+    worker processes are recorded in those processes, not here.
+    """
+
+    def __init__(self):
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def histogram(self, name: str, **labels: Any) -> Histogram:
+        key = _labels(labels)
+        family = self._histograms.get(name)
+        if family is None or key not in family:
+            with self._lock:
+                family = self._histograms.setdefault(name, {})
+                family.setdefault(key, Histogram())
+        return family[key]
+
+    def timer(self, stage: str) -> _Timer:
+        """`with metrics.timer('diagnosis.frail_forest'):` -> noricare_stage_seconds{stage=...}"""
+        return _Timer(self.histogram("noricare_stage_seconds", stage=stage))
+
+    def observe_stage(self, stage: str, seconds: float):
+        self.histogram("noricare_stage_seconds", stage=stage).observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels: Any):
+        key = _labels(labels)
+        with self._lock:
+            family = self._counters.setdefault(name, {})
+            family[key] = family.get(key, 0) + amount
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]):
+        """
+        collector() yields (name, type, help, samples) with samples as
+        (sample_name, labels, value); evaluated on every render().
+        """
+        self._collectors.append(collector)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+
+        def header(name: str, kind: str, help_text: Optional[str]):
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        # Handlers add label sets concurrently: format a snapshot taken under the lock
+        with self._lock:
+            counters = {name: dict(family) for name, family in self._counters.items()}
+            histograms = {name: dict(family) for name, family in self._histograms.items()}
+            collectors = list(self._collectors)
+
+        for name, family in sorted(counters.items()):
+            header(name, "counter", self._help.get(name))
+            for key, value in sorted(family.items()):
+                lines.append(f"{name}{_format_labels(key)} {value:g}")
+
+        for name, family in sorted(histograms.items()):
+            header(name, "histogram", self._help.get(name))
+            for key, hist in sorted(family.items()):
+                with hist._lock:
+                    counts, total, count = list(hist.counts), hist.sum, hist.count
+                cumulative = 0
+                for bound, bucket_count in zip(hist.buckets, counts):
+                    cumulative += bucket_count
+                    labels = key + (("le", f"{bound:g}"),)
+                    lines.append(f"{name}_bucket{_format_labels(labels)} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total:.9g}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        for collector in collectors:
+            for name, kind, help_text, samples in collector():
+                header(name, kind, help_text)
+                for sample_name, labels, value in samples:
+                    lines.append(f"{sample_name}{_format_labels(sorted(labels.items()))} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry used by the engines and the API
+metrics = MetricsRegistry()
+metrics.describe("noricare_stage_seconds", "Time spent in each pipeline stage")
+metrics.describe("noricare_http_request_seconds", "HTTP request latency by route")
+metrics.describe("noricare_http_requests_total", "HTTP requests by route and status")
+metrics.describe("noricare_diagnosis_total", "Diagnoses by model path (models_used)")
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware: request latency/status per route, and the request
+    start time in scope['state'] so handlers can time parsing/validation.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        scope.setdefault("state", {})["request_start"] = start
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            self.registry.histogram("noricare_http_request_seconds", path=path).observe(
+                time.perf_counter() - start
+            )
+            self.registry.inc("noricare_http_requests_total", path=path, status=status["code"])
@@ -0,0 +1,80 @@
+from typing import Any, Dict, List
+import numpy as np
+
+
+class NumpyMLP:
+    """
+    Inference-only multi-layer perceptron (ReLU hidden layers) built from
+    plain weight arrays, so loading and evaluating it needs nothing but
+    numpy. Inputs are standardized with the stored mean/scale, then each
+    layer is one matmul; a batch of any size is a single pass.
+
+    Exported by train_models.py from a fitted sklearn MLPClassifier
+    (models/mlp_optimizer.pkl, used by core/feedback.py).
+    """
+
+    def __init__(
+        self,
+        weights: List[np.ndarray],
+        biases: List[np.ndarray],
+        mean: np.ndarray,
+        scale: np.ndarray,
+        classes: np.ndarray
+    ):
+        self.weights = [np.asarray(w, dtype=np.float64) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float64) for b in biases]
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = self.weights[0].shape[0]
+
+    @classmethod
+    def from_sklearn(cls, model, scaler) -> "NumpyMLP":
+        """From a fitted MLPClassifier (activation='relu') and the StandardScaler of its inputs."""
+        if model.activation != 'relu':
+            raise ValueError(f"Only relu hidden layers are supported, got {model.activation!r}")
+        return cls(model.coefs_, model.intercepts_, scaler.mean_, scaler.scale_, model.classes_)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, Any]) -> "NumpyMLP":
+        """Rebuild from the dict written by to_arrays() (see train_models.py)."""
+        n_layers = int(arrays["n_layers"])
+        return cls(
+            weights=[arrays[f"W{i}"] for i in range(n_layers)],
+            biases=[arrays[f"b{i}"] for i in range(n_layers)],
+            mean=arrays["mean"],
+            scale=arrays["scale"],
+            classes=arrays["classes"]
+        )
+
+    def to_arrays(self) -> Dict[str, Any]:
+        """Plain dict of numpy arrays, suitable for joblib.dump (and mmap on load)."""
+        arrays = {"n_layers": len(self.weights), "mean": self.mean,
+                  "scale": self.scale, "classes": self.classes_}
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            arrays[f"W{i}"] = w
+            arrays[f"b{i}"] = b
+        return arrays
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        """
+        Output-layer activations, shape (n_samples, n_classes), or
+        (n_samples, 1) for two classes (one logistic output, like sklearn).
+        """
+        hidden = (np.asarray(X, dtype=np.float64) - self.mean) / self.scale
+        last = len(self.weights) - 1
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            hidden = hidden @ w + b
+            if i < last:
+                np.maximum(hidden, 0.0, out=hidden)
+        return hidden
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Predicted class per row: argmax of the output layer (softmax is
+        monotonic), or for two classes the logistic output thresholded at 0.
+        """
+        scores = self.decision_function(X)
+        if scores.shape[1] == 1:
+            return self.classes_.take((scores[:, 0] > 0).astype(np.intp))
+        return self.classes_.take(np.argmax(scores, axis=1))
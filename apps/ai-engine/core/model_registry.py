@@ -0,0 +1,240 @@
+from typing import Any, Dict, List, Optional, Set
+import hashlib
+import os
+import threading
+import joblib
+from core.forest import FlatForest
+
+# Models are in ai-engine/models, not core/models
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models')
+
+
+class ModelBundle:
+    """
+    The diagnosis artifacts that are served together under one version.
+    Engines read the current bundle once per call, so a reload never mixes
+    old and new models inside one request.
+    The sklearn FRAIL classifier is not part of it: serving only uses the
+    flattened frail_forest.
+    """
+
+    __slots__ = (
+        "frail_scaler", "fall_model", "fall_scaler",
+        "feature_names", "frail_forest", "imputer", "version"
+    )
+
+    def __init__(
+        self,
+        frail_scaler: Any,
+        fall_model: Any,
+        fall_scaler: Any,
+        feature_names: List[str],
+        frail_forest: FlatForest,
+        version: str,
+        imputer: Optional[Any] = None
+    ):
+        self.frail_scaler = frail_scaler
+        self.fall_model = fall_model
+        self.fall_scaler = fall_scaler
+        self.feature_names = feature_names
+        self.frail_forest = frail_forest
+        self.imputer = imputer      # core.imputation.NeighborImputer, if trained
+        self.version = version
+
+
+class ModelRegistry:
+    """
+    Process-wide store of trained artifacts.
+    Each pickle in models/ is loaded at most once and the same object is
+    handed to every engine that asks for it.
+    """
+
+    # Logical name -> file in models/
+    ARTIFACTS = {
+        "frail_model": "frail_classifier.pkl",
+        "frail_scaler": "frail_scaler.pkl",
+        "fall_model": "fall_risk_model.pkl",
+        "fall_scaler": "fall_scaler.pkl",
+        "feature_names": "feature_names.pkl",
+        "frail_forest": "frail_forest.pkl",   # flattened frail_model (core/forest.py)
+        "imputer": "imputer.pkl",             # optional, core/imputation.py
+        "mlp_optimizer": "mlp_optimizer.pkl", # optional, core/mlp.py weights for core/feedback.py
+    }
+
+    # Only needed to build or validate frail_forest; never kept by the registry
+    REFERENCE_ONLY = {"frail_model"}
+
+    def __init__(self, models_dir: Optional[str] = None, mmap_mode: Optional[str] = None):
+        """
+        Args:
+            models_dir: Directory holding the artifacts (default: ai-engine/models)
+            mmap_mode: Passed to joblib.load, e.g. 'r' to memory-map the numpy
+                arrays so forked workers share the same physical pages.
+        """
+        self.models_dir = models_dir or MODELS_DIR
+        self.mmap_mode = mmap_mode
+        self._artifacts: Dict[str, Any] = {}
+        self._missing: Set[str] = set()
+        self._bundle: Optional[ModelBundle] = None
+        self._version: Optional[str] = None
+        self._lock = threading.RLock()
+
+    def _load_file(self, name: str) -> Any:
+        path = os.path.join(self.models_dir, self.ARTIFACTS[name])
+        return joblib.load(path, mmap_mode=self.mmap_mode)
+
+    def read(self, name: str) -> Any:
+        """
+        Read an artifact straight from disk without caching it
+        (e.g. frail_model as the parity reference of a reload smoke test).
+        Raises FileNotFoundError if the file is missing.
+        """
+        return self._load_file(name)
+
+    def get(self, name: str) -> Any:
+        """
+        Return the artifact registered under `name`, loading it on first use.
+        Raises FileNotFoundError if the file is missing (callers fall back to heuristics).
+        """
+        artifact = self._artifacts.get(name)
+        if artifact is not None:
+            return artifact
+
+        with self._lock:
+            # Another thread may have loaded it while we waited
+            if name not in self._artifacts:
+                self._artifacts[name] = self._load_file(name)
+            return self._artifacts[name]
+
+    def get_optional(self, name: str) -> Optional[Any]:
+        """Like get(), but None for a missing file (remembered until clear()/swap())."""
+        if name in self._missing:
+            return None
+        try:
+            return self.get(name)
+        except FileNotFoundError:
+            self._missing.add(name)
+            return None
+
+    def _fingerprint(self) -> str:
+        digest = hashlib.sha1()
+        for name, filename in sorted(self.ARTIFACTS.items()):
+            try:
+                stat = os.stat(os.path.join(self.models_dir, filename))
+            except OSError:
+                continue
+            digest.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        return digest.hexdigest()[:12]
+
+    @property
+    def version(self) -> str:
+        """Short fingerprint of the artifact files (name, size, mtime) currently served."""
+        if self._version is None:
+            self._version = self._fingerprint()
+        return self._version
+
+    def disk_version(self) -> str:
+        """Fingerprint of the files on disk now (differs from version after retraining)."""
+        return self._fingerprint()
+
+    def load_bundle(self, fresh: bool = False) -> ModelBundle:
+        """
+        The diagnosis bundle.
+        With fresh=True, everything is re-read from disk into a new bundle
+        without touching what is currently served; pass it to swap() to publish.
+        Raises FileNotFoundError if a required artifact is missing.
+        """
+        if not fresh and self._bundle is not None:
+            return self._bundle
+
+        with self._lock:
+            if not fresh and self._bundle is not None:
+                return self._bundle
+
+            version = self._fingerprint()
+            get = self._load_file if fresh else self.get
+            try:
+                frail_forest = FlatForest.from_arrays(get("frail_forest"))
+            except FileNotFoundError:
+                print("[AI Engine] frail_forest.pkl not found, flattening frail_model in memory")
+                # The sklearn forest is dropped once flattened
+                frail_forest = FlatForest.from_sklearn(self._load_file("frail_model"))
+
+            try:
+                imputer = get("imputer")
+            except FileNotFoundError:
+                print("[AI Engine] imputer.pkl not found, missing features use fixed defaults")
+                imputer = None
+
+            bundle = ModelBundle(
+                frail_scaler=get("frail_scaler"),
+                fall_model=get("fall_model"),
+                fall_scaler=get("fall_scaler"),
+                feature_names=get("feature_names"),
+                frail_forest=frail_forest,
+                version=version,
+                imputer=imputer
+            )
+            if not fresh:
+                self._bundle = bundle
+                self._version = version
+            return bundle
+
+    def swap(self, bundle: ModelBundle):
+        """
+        Atomically publish a bundle from load_bundle(fresh=True).
+        Other artifacts already in use (e.g. mlp_optimizer) are re-read
+        from disk first and published with it, so none is dropped.
+        """
+        artifacts = {
+            "frail_scaler": bundle.frail_scaler,
+            "fall_model": bundle.fall_model,
+            "fall_scaler": bundle.fall_scaler,
+            "feature_names": bundle.feature_names,
+            "frail_forest": bundle.frail_forest.to_arrays(),
+        }
+        if bundle.imputer is not None:
+            artifacts["imputer"] = bundle.imputer
+        missing = set()
+        for name in list(self._artifacts):
+            if name not in artifacts and name in self.ARTIFACTS and name not in self.REFERENCE_ONLY:
+                try:
+                    artifacts[name] = self._load_file(name)
+                except FileNotFoundError:
+                    missing.add(name)
+        with self._lock:
+            self._artifacts = artifacts
+            self._missing = missing
+            self._bundle = bundle
+            self._version = bundle.version
+
+    def load_all(self) -> Dict[str, Any]:
+        """Eagerly load every served artifact (e.g. before forking workers)."""
+        return {name: self.get(name) for name in self.ARTIFACTS if name not in self.REFERENCE_ONLY}
+
+    def clear(self):
+        """Drop cached artifacts so the next get() reads them from disk again."""
+        with self._lock:
+            self._artifacts = {}
+            self._missing = set()
+            self._bundle = None
+            self._version = None
+
+
+_default_registry: Optional[ModelRegistry] = None
+_default_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """
+    Shared registry for this process.
+    Set NORICARE_MODEL_MMAP=r to memory-map model arrays instead of copying them.
+    """
+    global _default_registry
+    if _default_registry is None:
+        with _default_lock:
+            if _default_registry is None:
+                _default_registry = ModelRegistry(
+                    mmap_mode=os.environ.get("NORICARE_MODEL_MMAP") or None
+                )
+    return _default_registry
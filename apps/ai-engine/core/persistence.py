@@ -0,0 +1,463 @@
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from core.metrics import metrics
+
+# Prisma tables written by the engine (packages/database/schema.prisma): name -> columns
+TABLES = {
+    "ExercisePrescription": (
+        "id", "seniorId", "createdAt", "validUntil", "category", "exerciseName", "intensity",
+        "setCount", "repCount", "durationMin", "videoUrl", "isContraindicated"
+    ),
+    "FeedbackLog": (
+        "id", "seniorId", "prescriptionId", "loggedAt", "hasPain", "painRegion",
+        "rpeScore", "satisfaction", "completed"
+    ),
+}
+
+# Column types for the local stand-in schema (create_tables); everything else is TEXT
+_COLUMN_TYPES = {
+    "createdAt": "datetime", "validUntil": "datetime", "loggedAt": "datetime",
+    "intensity": "int", "setCount": "int", "repCount": "int", "durationMin": "int",
+    "rpeScore": "int", "satisfaction": "int",
+    "isContraindicated": "bool", "hasPain": "bool", "completed": "bool",
+}
+_NOT_NULL = {"id", "seniorId", "createdAt", "category", "exerciseName", "intensity", "setCount",
+             "repCount", "isContraindicated", "loggedAt", "hasPain", "rpeScore", "satisfaction", "completed"}
+
+# Exercise catalog type (data/exercises.json) -> ExercisePrescription.category
+CATEGORIES = {
+    "유산소": "AEROBIC",
+    "무산소": "STRENGTH",
+    "스트레칭": "FLEXIBILITY",
+    "균형": "BALANCE",
+}
+
+
+class SQLiteBackend:
+    """Local database (dev / tests). DateTime is stored as Unix ms, like Prisma's SQLite connector."""
+
+    placeholder = "?"
+    max_params = 999    # SQLITE_MAX_VARIABLE_NUMBER of older builds
+    types = {"datetime": "DATETIME", "int": "INTEGER", "bool": "BOOLEAN", "text": "TEXT"}
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def insert_ignore(self, table: str, columns: str, values: str) -> str:
+        return f'INSERT OR IGNORE INTO "{table}" ({columns}) VALUES {values}'
+
+    @staticmethod
+    def datetime(value: datetime) -> int:
+        return int(value.timestamp() * 1000)
+
+
+class PostgresBackend:
+    """PostgreSQL through psycopg 3 (optional dependency: pip install psycopg)."""
+
+    placeholder = "%s"
+    max_params = 32767
+    types = {"datetime": "TIMESTAMP(3)", "int": "INTEGER", "bool": "BOOLEAN", "text": "TEXT"}
+
+    def __init__(self, url: str):
+        try:
+            import psycopg
+        except ImportError:
+            raise ImportError("A postgresql:// NORICARE_DB_URL requires psycopg (pip install psycopg)")
+        self._psycopg = psycopg
+        self.url = url
+
+    def connect(self):
+        return self._psycopg.connect(self.url)
+
+    def insert_ignore(self, table: str, columns: str, values: str) -> str:
+        return f'INSERT INTO "{table}" ({columns}) VALUES {values} ON CONFLICT DO NOTHING'
+
+    @staticmethod
+    def datetime(value: datetime) -> datetime:
+        return value
+
+
+def backend_from_url(url: str):
+    """sqlite:///relative.db, sqlite:////abs/path.db, sqlite:///:memory: or postgresql://..."""
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("postgresql://", "postgres://")):
+        return PostgresBackend(url)
+    raise ValueError(f"Unsupported database URL {url!r} (use sqlite:/// or postgresql://)")
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of DB-API connections, opened on first use and reused.
+    connection() hands one out for a single transaction (commit on success,
+    rollback on error) and blocks while all of them are busy. A connection
+    whose rollback fails is closed rather than reused.
+    """
+
+    def __init__(self, backend: Any, size: int = 4):
+        self.backend = backend
+        self.size = size
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = 30.0):
+        conn = self._acquire(timeout)
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                self._discard(conn)
+            else:
+                self._idle.put(conn)
+            raise
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        """Drop a broken connection; a new one is opened on demand."""
+        with self._lock:
+            self._opened -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _acquire(self, timeout: Optional[float]):
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self.backend.connect()
+                except BaseException:
+                    self._opened -= 1
+                    raise
+        return self._idle.get(timeout=timeout)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def create_tables(pool: ConnectionPool):
+    """Create the written tables if missing (local stand-in; production schema comes from Prisma)."""
+    types = pool.backend.types
+    with pool.connection() as conn:
+        for table, columns in TABLES.items():
+            definitions = ", ".join(
+                f'"{column}" {types[_COLUMN_TYPES.get(column, "text")]}'
+                + (" NOT NULL" if column in _NOT_NULL else "")
+                + (" PRIMARY KEY" if column == "id" else "")
+                for column in columns
+            )
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({definitions})')
+
+
+class WriteBehindWriter:
+    """
+    Non-blocking persistence for request handlers.
+    submit() only appends rows to an in-memory queue; a background thread
+    flushes them every flush_interval seconds (or as soon as batch_rows are
+    waiting) in one transaction per flush, with multi-row INSERTs. Inserts
+    skip rows whose id already exists, so re-sent rows are harmless.
+    A flush that fails is retried in halves, so one bad row (e.g. an
+    unknown seniorId) only loses itself.
+    When max_queue rows are waiting, new rows are dropped and counted
+    rather than slowing requests down.
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        flush_interval: float = 0.2,
+        batch_rows: int = 500,
+        max_queue: int = 100000
+    ):
+        """
+        Args:
+            pool: Connections to write with
+            flush_interval: Longest time a row waits before being written (seconds)
+            batch_rows: Flush early once this many rows are waiting
+            max_queue: Rows allowed to wait; beyond that submit() drops rows
+        """
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.batch_rows = batch_rows
+        self.max_queue = max_queue
+        self._rows: Deque[Tuple[str, Tuple]] = deque()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._urgent = False     # flush() is waiting: write without waiting for the interval
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        # Stats
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["WriteBehindWriter"]:
+        """
+        Enabled when NORICARE_DB_URL is set; NORICARE_DB_POOL_SIZE,
+        NORICARE_DB_FLUSH_MS, NORICARE_DB_BATCH_ROWS and NORICARE_DB_QUEUE
+        tune it, NORICARE_DB_CREATE_TABLES=1 creates the tables (stand-ins).
+        Returns None when persistence is disabled.
+        """
+        url = os.environ.get("NORICARE_DB_URL")
+        if not url:
+            return None
+        pool = ConnectionPool(backend_from_url(url), size=int(os.environ.get("NORICARE_DB_POOL_SIZE", 4)))
+        if os.environ.get("NORICARE_DB_CREATE_TABLES") == "1":
+            create_tables(pool)
+        return cls(
+            pool,
+            flush_interval=float(os.environ.get("NORICARE_DB_FLUSH_MS", 200)) / 1000.0,
+            batch_rows=int(os.environ.get("NORICARE_DB_BATCH_ROWS", 500)),
+            max_queue=int(os.environ.get("NORICARE_DB_QUEUE", 100000))
+        )
+
+    # --- Producers (request path) ---
+
+    def submit(self, table: str, rows: Iterable[Sequence[Any]]) -> int:
+        """Queue rows (tuples in TABLES[table] order); returns how many were accepted."""
+        rows = [tuple(row) for row in rows]
+        with self._cond:
+            room = max(0, self.max_queue - len(self._rows))
+            accepted = rows[:room]
+            self._rows.extend((table, row) for row in accepted)
+            self.dropped += len(rows) - len(accepted)
+            if len(self._rows) >= self.batch_rows:
+                self._cond.notify()
+        if self._thread is None:
+            self._start()
+        if len(accepted) < len(rows):
+            print(f"[Persistence] Write queue full, dropped {len(rows) - len(accepted)} {table} rows")
+        return len(accepted)
+
+    def record_prescriptions(self, senior_id: str, exercises: List[Dict[str, Any]],
+                             created_at: Optional[datetime] = None) -> List[str]:
+        """Queue one ExercisePrescription row per exercise; returns the new row ids in order."""
+        created_at = self.pool.backend.datetime(created_at or datetime.now(timezone.utc))
+        ids, rows = [], []
+        for exercise in exercises:
+            row_id = str(uuid.uuid4())
+            rep_count, duration_min = _parse_reps(exercise.get("reps"))
+            rows.append((
+                row_id, senior_id, created_at, None,
+                CATEGORIES.get(exercise.get("type"), "BALANCE"),
+                exercise.get("name", ""), int(exercise.get("intensity", 5)),
+                int(exercise.get("sets", 1)), rep_count, duration_min, exercise.get("videoUrl"),
+                bool(exercise.get("isContraindicated", False))
+            ))
+            ids.append(row_id)
+        self.submit("ExercisePrescription", rows)
+        return ids
+
+    def record_feedback(self, events: List[Dict[str, Any]]) -> int:
+        """
+        Queue FeedbackLog rows (dicts with the Prisma field names; loggedAt
+        datetime or ISO-8601). Events without an id get one derived from
+        (seniorId, prescriptionId, loggedAt), so a re-sent sync is ignored.
+        """
+        to_db = self.pool.backend.datetime
+        rows = []
+        for event in events:
+            logged_at = _as_datetime(event["loggedAt"])
+            rows.append((
+                event.get("id") or feedback_id(event["seniorId"], event.get("prescriptionId"), logged_at),
+                event["seniorId"], event.get("prescriptionId"),
+                to_db(logged_at), bool(event.get("hasPain", False)), event.get("painRegion"),
+                int(event["rpeScore"]), int(event["satisfaction"]), bool(event.get("completed", True))
+            ))
+        return self.submit("FeedbackLog", rows)
+
+    # --- Flusher ---
+
+    def _start(self):
+        with self._cond:
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name="noricare-write-behind", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not (self._stopping or self._urgent) and len(self._rows) < self.batch_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._rows.popleft() for _ in range(min(len(self._rows), self.batch_rows))]
+                self._in_flight = len(batch)
+                if not self._rows:
+                    self._urgent = False
+                stopping = self._stopping and not self._rows
+
+            if batch:
+                self._write(batch)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+            if stopping:
+                return
+
+    def _write(self, batch: List[Tuple[str, Tuple]]):
+        # Tables in TABLES order: FeedbackLog rows may refer to prescriptions in the same batch
+        rank = {table: i for i, table in enumerate(TABLES)}
+        batch = sorted(batch, key=lambda item: rank[item[0]])
+        start = time.perf_counter()
+        self._write_rows(batch)
+        metrics.observe_stage("persistence.flush", time.perf_counter() - start)
+        self.flushes += 1
+
+    def _write_rows(self, batch: List[Tuple[str, Tuple]]):
+        """
+        One transaction for the batch. If it fails once connected (a
+        constraint, a lost connection mid-write), each half is retried on
+        its own until the failing rows are isolated and dropped.
+        """
+        by_table: Dict[str, List[Tuple]] = {}
+        for table, row in batch:
+            by_table.setdefault(table, []).append(row)
+        connected = False
+        try:
+            with self.pool.connection() as conn:
+                connected = True
+                for table, rows in by_table.items():
+                    self._insert(conn, table, rows)
+        except Exception as e:
+            if connected and len(batch) > 1:
+                middle = len(batch) // 2
+                self._write_rows(batch[:middle])
+                self._write_rows(batch[middle:])
+                return
+            self.failed += len(batch)
+            if len(batch) == 1:
+                table, row = batch[0]
+                print(f"[Persistence] Dropped {table} row {row[0]}: {e}")
+            else:
+                print(f"[Persistence] Flush of {len(batch)} rows failed: {e}")
+            return
+        self.written += len(batch)
+
+    def _insert(self, conn, table: str, rows: List[Tuple]):
+        """Multi-row INSERTs, as many rows per statement as the parameter limit allows."""
+        backend = self.pool.backend
+        columns = TABLES[table]
+        per_statement = max(1, backend.max_params // len(columns))
+        row_sql = "(" + ", ".join([backend.placeholder] * len(columns)) + ")"
+        column_sql = ", ".join(f'"{column}"' for column in columns)
+
+        def statement(n_rows):
+            return backend.insert_ignore(table, column_sql, ", ".join([row_sql] * n_rows))
+
+        full = len(rows) // per_statement * per_statement
+        if full:
+            conn.cursor().executemany(statement(per_statement), [
+                [value for row in rows[i:i + per_statement] for value in row]
+                for i in range(0, full, per_statement)
+            ])
+        if full < len(rows):
+            rest = rows[full:]
+            conn.cursor().execute(statement(len(rest)), [value for row in rest for value in row])
+
+    # --- Lifecycle ---
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued row has been written (or failed). False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._rows or self._in_flight:
+                if self._thread is None:
+                    return False
+                self._urgent = True
+                self._cond.notify_all()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            queued = len(self._rows) + self._in_flight
+        return {"queued": queued, "written": self.written, "dropped": self.dropped,
+                "failed": self.failed, "flushes": self.flushes}
+
+    def close(self, timeout: float = 10.0):
+        """Write what is queued, stop the flusher and close the pool."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.pool.close()
+
+
+def feedback_id(senior_id: str, prescription_id: Optional[str], logged_at: datetime) -> str:
+    """Stable FeedbackLog id for an event that came without one."""
+    moment = logged_at.astimezone(timezone.utc).isoformat()
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"noricare:feedback:{senior_id}:{prescription_id or ''}:{moment}"))
+
+
+def _as_datetime(value: Any) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+_REPS = re.compile(r"(\d+)\s*(회|보|분|초)")
+
+
+def _parse_reps(reps: Any) -> Tuple[int, Optional[int]]:
+    """
+    Catalog 'reps' text -> (repCount, durationMin): '12회' / '10보' are
+    repetitions, '5분' a duration; timed holds ('30초') count as 1 rep.
+    """
+    if isinstance(reps, int):
+        return reps, None
+    match = _REPS.search(str(reps or ""))
+    if match is None:
+        return 10, None     # schema default
+    value, unit = int(match.group(1)), match.group(2)
+    if unit == "분":
+        return 1, value
+    if unit == "초":
+        return 1, None
+    return value, None
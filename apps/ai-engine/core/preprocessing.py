@@ -1,50 +1,169 @@
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional, Union
 import numpy as np
+from core.model_registry import ModelRegistry, get_model_registry
+
+Columns = Dict[str, np.ndarray]
 
 class DataPreprocessor:
     """
     Step 1: Data Ingestion & Preprocessing
     Handles missing values and normalization for PHR data.
     """
-    
+
+    # Fallbacks for missing readings
+    IMPUTE_DEFAULTS = {
+        'sppb': 0.0,    # Default conservative score
+        'tug': 30.0     # Slow default (seconds)
+    }
+
+    # Fields the trained imputer knows (PHR field -> training column): left
+    # missing when it is loaded, so diagnosis imputes them with k-NN.
+    # SPPB total score is not in the training data and keeps its default
+    IMPUTER_COLUMNS = {'tug': 'TUG_Time_s'}
+
+    def __init__(self, registry: Optional[ModelRegistry] = None):
+        """Uses the trained imputer (models/imputer.pkl) from the shared registry when present."""
+        self.registry = registry or get_model_registry()
+        self._defaults_for = None
+        self._defaults = self.IMPUTE_DEFAULTS
+
+    def impute_defaults(self) -> Dict[str, float]:
+        """
+        Values used for missing fields: IMPUTE_DEFAULTS, except the fields
+        the trained imputer has a column for. Those stay missing and are
+        filled by HybridDiagnosisEngine.fill_missing_features from the
+        senior's other features.
+        """
+        imputer = self.registry.get_optional('imputer')
+        if imputer is not self._defaults_for:
+            defaults = dict(self.IMPUTE_DEFAULTS)
+            if imputer is not None:
+                for field, column in self.IMPUTER_COLUMNS.items():
+                    if imputer.statistic(column) is not None:
+                        del defaults[field]
+            self._defaults, self._defaults_for = defaults, imputer
+        return self._defaults
+
+    # Min-max ranges: output field <- (input field, min, max)
+    SCALED_FIELDS = {
+        'normalized_sppb': ('sppb', 0, 12),    # SPPB is 0-12
+        'normalized_age': ('age', 60, 100)     # assuming range 60-100 for ecosystem
+    }
+
     def normalize(self, raw_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Main entry point for preprocessing.
-        
+
         Args:
             raw_data: Dictionary containing 'sppb', 'tug', 'age', etc.
-            
+
         Returns:
-            Cleaned and normalized dictionary.
+            Cleaned and normalized dictionary (raw_data is left untouched).
         """
         # 1. Imputation (Handle missing values)
         cleaned = self._impute_missing(raw_data)
-        
+
         # 2. Normalization (Min-Max scaling for specific fields)
-        # SPPB is 0-12
-        if 'sppb' in cleaned and cleaned['sppb'] is not None:
-            cleaned['normalized_sppb'] = self._min_max_scale(cleaned['sppb'], 0, 12)
-            
-        # Age normalization (assuming range 60-100 for ecosystem)
-        if 'age' in cleaned and cleaned['age'] is not None:
-            cleaned['normalized_age'] = self._min_max_scale(cleaned['age'], 60, 100)
-            
+        for target, (field, min_val, max_val) in self.SCALED_FIELDS.items():
+            if not self._is_missing(cleaned.get(field)):
+                cleaned[target] = self._min_max_scale(cleaned[field], min_val, max_val)
+
         return cleaned
 
+    def normalize_batch(self, columns: Union[Columns, np.ndarray]) -> Columns:
+        """
+        Columnar version of normalize() for many records at once.
+
+        Args:
+            columns: Dict of equal-length arrays, or a structured array.
+                Missing values are NaN, None (object arrays) or masked
+                entries (numpy.ma); a missing column counts as all missing.
+
+        Returns:
+            Dict of arrays: the input columns, imputed fields as float64 and
+            the normalized_* fields (NaN where the source value is missing).
+            Each row has the same numbers normalize() gives for that record.
+        """
+        if isinstance(columns, np.ndarray):
+            columns = {name: columns[name] for name in columns.dtype.names}
+        n = len(next(iter(columns.values()))) if columns else 0
+        cleaned = dict(columns)
+
+        # 1. Imputation: one masked assignment per field
+        defaults = self.impute_defaults()
+        for field, default in defaults.items():
+            values, missing = self._as_float(columns.get(field), n)
+            values[missing] = default
+            cleaned[field] = values
+
+        # 2. Normalization
+        for target, (field, min_val, max_val) in self.SCALED_FIELDS.items():
+            if field in defaults:
+                values = cleaned[field]
+            else:
+                values, missing = self._as_float(columns.get(field), n)
+                values[missing] = np.nan
+            cleaned[target] = np.clip((values - min_val) / (max_val - min_val), 0.0, 1.0)
+
+        return cleaned
+
+    def records_to_columns(self, records: Iterable[Dict[str, Any]], fields: Iterable[str]) -> Columns:
+        """Gather `fields` from dict records into float arrays (None -> NaN)."""
+        records = list(records)
+        return {
+            field: np.array(
+                [np.nan if r.get(field) is None else r[field] for r in records], dtype=float
+            )
+            for field in fields
+        }
+
+    def split_batch(self, cleaned: Columns, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Per-record dicts from normalize_batch() output, shaped like normalize()
+        results: each record updated with its imputed and normalized values
+        (normalized_* fields are omitted where the source value is missing).
+        """
+        fields = [field for field in list(self.IMPUTE_DEFAULTS) + list(self.SCALED_FIELDS) if field in cleaned]
+        values = {field: cleaned[field].tolist() for field in fields}
+        rows = []
+        for i, record in enumerate(records):
+            row = dict(record)
+            for field in fields:
+                value = values[field][i]
+                if value == value:   # not NaN
+                    row[field] = value
+            rows.append(row)
+        return rows
+
+    def _as_float(self, values: Any, n: int):
+        """(float64 copy, missing mask) for a column; None -> all missing."""
+        if values is None:
+            return np.full(n, np.nan), np.ones(n, dtype=bool)
+        mask = np.ma.getmaskarray(values) if np.ma.isMaskedArray(values) else np.zeros(n, dtype=bool)
+        values = np.ma.getdata(values)
+        if values.dtype == object:
+            mask = mask | np.equal(values, None)
+            values = np.where(mask, np.nan, values)
+        values = np.array(values, dtype=float)
+        return values, mask | np.isnan(values)
+
     def _impute_missing(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Simple mean/mode imputation logic.
-        In production, this would use a learned imputer (e.g. KNNImputer).
+        Statistical imputation on a copy of `data` (see impute_defaults).
+        Model features still missing after this step are filled by the
+        k-NN imputer in HybridDiagnosisEngine.prepare_feature_matrix.
         """
-        # Example: Set default SPPB if missing
-        if 'sppb' not in data or data['sppb'] is None:
-            data['sppb'] = 0.0 # Default conservative score
-            
-        if 'tug' not in data or data['tug'] is None:
-            data['tug'] = 30.0 # Slow default (seconds)
-            
+        data = dict(data)
+        for field, default in self.impute_defaults().items():
+            if self._is_missing(data.get(field)):
+                data[field] = default
+
         return data
 
+    @staticmethod
+    def _is_missing(value: Any) -> bool:
+        return value is None or value != value   # None or NaN
+
     def _min_max_scale(self, value: float, min_val: float, max_val: float) -> float:
         """Scales value to 0-1 range."""
         return max(0.0, min(1.0, (value - min_val) / (max_val - min_val)))
@@ -1,6 +1,68 @@
-from typing import Dict, List, Any
+from typing import Dict, Iterable, Iterator, List, Any, FrozenSet, NamedTuple, Optional, Sequence, Tuple
+from itertools import combinations
 import json
 import os
+import threading
+import time
+import numpy as np
+from core.catalog import CATALOG_PATH, ExerciseCatalog
+from core.knapsack import RoutineOptimizer
+
+EXERCISES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    '..', '..', 'data', 'exercises.json'
+)
+
+
+class Exercise(NamedTuple):
+    """
+    Immutable catalog record (one entry of exercises.json).
+    Shared by all requests; responses get their own dict via to_dict().
+    """
+    id: int
+    name: str
+    type: str
+    sets: int
+    reps: str
+    intensity: int
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Exercise":
+        return cls(*(data[field] for field in cls._fields))
+    
+    def to_dict(self, **extra) -> Dict[str, Any]:
+        """Fresh response dict, optionally with extra keys (e.g. prescribed_for)."""
+        result = self._asdict()
+        result.update(extra)
+        return result
+
+
+class ExerciseRecords(Sequence):
+    """
+    Exercise view over a compiled catalog's rows: a record is built from
+    its structured row on first access and reused, so loading a catalog
+    never converts the rows that are not prescribed.
+    """
+    
+    def __init__(self, catalog: ExerciseCatalog):
+        self.rows = catalog.rows
+        self._built: Dict[int, Exercise] = {}
+    
+    def __len__(self) -> int:
+        return len(self.rows)
+    
+    def __getitem__(self, row: int) -> Exercise:
+        ex = self._built.get(row)
+        if ex is None:
+            if not -len(self.rows) <= row < len(self.rows):
+                raise IndexError(row)
+            ex = Exercise(*self.rows[row].item()[:len(Exercise._fields)])
+            self._built[row] = ex
+        return ex
+    
+    def __iter__(self) -> Iterator[Exercise]:
+        return (self[row] for row in range(len(self.rows)))
+
 
 class PrescriptionEngine:
     """
@@ -34,19 +96,98 @@ class PrescriptionEngine:
         "Back Pain": ["윗몸 일으키기", "레그 레이즈", "러시안 트위스트", "서서 상체 숙이기"]
     }
     
-    def __init__(self):
-        """Load exercises from JSON file."""
-        self.exercises = self._load_exercises()
+    # Session time budget (minutes) for each group, used by the "optimized" mode
+    GROUP_SESSION_MINUTES = {
+        "Normal": 40,
+        "Pre-frail": 30,
+        "Frail": 20,
+        "Sarcopenic": 30
+    }
+    
+    # Fallback range/preferences/budget for groups not listed above
+    DEFAULT_INTENSITY_RANGE = (3, 6)
+    DEFAULT_TYPE_PREFERENCES = {"스트레칭": 0.33, "무산소": 0.33, "유산소": 0.34}
+    DEFAULT_SESSION_MINUTES = 30
+    
+    # "ranked": nearest-to-mid-intensity exercises from the precomputed index (same routine
+    # for everyone in a group); "optimized": constrained selection (core/knapsack.py)
+    MODES = ("ranked", "optimized")
+    
+    # How often (seconds) generate_prescription checks exercises.json for changes
+    CATALOG_CHECK_INTERVAL = 5.0
+    
+    def __init__(self, exercises_path: Optional[str] = None, catalog_path: Optional[str] = None):
+        """
+        Load the exercise DB and build the prescription index.
+        
+        Args:
+            exercises_path: exercises.json (default: data/exercises.json)
+            catalog_path: Compiled catalog (compile_catalog.py), used instead of
+                parsing exercises.json while it is up to date
+                (default: NORICARE_EXERCISE_CATALOG or models/exercise_catalog.npy)
+        """
+        self.exercises_path = exercises_path or EXERCISES_PATH
+        self.catalog_path = catalog_path or os.environ.get("NORICARE_EXERCISE_CATALOG", CATALOG_PATH)
+        self.mode = os.environ.get("NORICARE_PRESCRIPTION_MODE", "ranked")
+        if self.mode not in self.MODES:
+            raise ValueError(f"NORICARE_PRESCRIPTION_MODE must be one of {', '.join(self.MODES)}, got {self.mode!r}")
+        self._reload_lock = threading.Lock()
+        self.catalog_version = 0
+        self.reload_exercises()
+    
+    def reload_exercises(self):
+        """(Re)load the exercise DB and rebuild the prescription index."""
+        with self._reload_lock:
+            self._catalog_mtime = self._get_catalog_mtime()
+            self._last_catalog_check = time.monotonic()
+            catalog = self._load_catalog()
+            exercises = ExerciseRecords(catalog)
+            ids = np.asarray(catalog.rows["id"])
+            by_id = (ids, np.argsort(ids, kind="stable"))
+            index = self._build_index(catalog)
+            routine = (RoutineOptimizer(catalog), exercises)
+            # Catalog is immutable; a reload only rebinds these attributes
+            self.catalog, self.exercises, self._by_id, self._index = catalog, exercises, by_id, index
+            self._routine = routine
+            self.catalog_version += 1
+    
+    def check_catalog(self):
+        """Throttled refresh_if_changed (at most every CATALOG_CHECK_INTERVAL seconds)."""
+        if time.monotonic() - self._last_catalog_check > self.CATALOG_CHECK_INTERVAL:
+            self.refresh_if_changed()
+    
+    def refresh_if_changed(self) -> bool:
+        """Reload the exercise DB if exercises.json or the compiled catalog changed. Returns True if reloaded."""
+        self._last_catalog_check = time.monotonic()
+        if self._get_catalog_mtime() == self._catalog_mtime:
+            return False
+        self.reload_exercises()
+        return True
+    
+    def _get_catalog_mtime(self) -> Tuple[Optional[int], ...]:
+        mtimes = []
+        for path in (self.exercises_path, self.catalog_path):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+    
+    def _load_catalog(self) -> ExerciseCatalog:
+        """Compiled catalog (mmap) if it matches exercises.json and CONTRAINDICATED, else compile in memory."""
+        catalog = ExerciseCatalog.load(self.catalog_path, self.exercises_path, self.CONTRAINDICATED)
+        if catalog is not None:
+            print(f"[Prescription Engine] Loaded {len(catalog)} exercises from compiled catalog")
+            return catalog
+        if os.path.exists(self.catalog_path):
+            print("[Prescription Engine] Compiled catalog is out of date, "
+                  "reading exercises.json (run compile_catalog.py)")
+        return ExerciseCatalog.compile(self._load_exercises(), self.CONTRAINDICATED)
     
     def _load_exercises(self) -> List[Dict]:
         """Load exercises from JSON database."""
-        exercises_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)), 
-            '..', 'data', 'exercises.json'
-        )
-        
         try:
-            with open(exercises_path, 'r', encoding='utf-8') as f:
+            with open(self.exercises_path, 'r', encoding='utf-8') as f:
                 exercises = json.load(f)
             print(f"[Prescription Engine] Loaded {len(exercises)} exercises from database")
             return exercises
@@ -67,7 +208,11 @@ class PrescriptionEngine:
         self, 
         user_group: str, 
         conditions: List[str] = None,
-        num_exercises: int = 8
+        num_exercises: int = 8,
+        mode: Optional[str] = None,
+        session_minutes: Optional[int] = None,
+        max_total_intensity: Optional[int] = None,
+        variety_key: Optional[str] = None
     ) -> List[Dict]:
         """
         Generate personalized exercise prescription based on user group.
@@ -76,93 +221,165 @@ class PrescriptionEngine:
             user_group: Normal, Pre-frail, Frail, or Sarcopenic
             conditions: List of health conditions
             num_exercises: Number of exercises to prescribe (default 8)
+            mode: "ranked" or "optimized" (default: NORICARE_PRESCRIPTION_MODE)
+            session_minutes: Optimized mode: time budget (default: per group)
+            max_total_intensity: Optimized mode: cap on summed intensity
+                (default: num_exercises x the group's mid intensity)
+            variety_key: Optimized mode: e.g. the user id; different keys get
+                different routines among equally suitable exercises
         
         Returns:
             List of exercise dictionaries
         """
-        conditions = conditions or []
+        self.check_catalog()
         
-        # Get intensity range for group
-        min_intensity, max_intensity = self.GROUP_INTENSITY_RANGES.get(
-            user_group, (3, 6)
-        )
-        
-        # Filter exercises by intensity
-        suitable_exercises = [
-            ex for ex in self.exercises 
-            if min_intensity <= ex['intensity'] <= max_intensity
-        ]
-        
-        # Apply safety filter (remove contraindicated exercises)
-        safe_exercises = self._apply_safety_filter(suitable_exercises, conditions)
+        if (mode or self.mode) == "optimized":
+            return self.optimize_prescription(
+                user_group, conditions, num_exercises, session_minutes, max_total_intensity, variety_key
+            )
         
-        # Group by type
-        by_type = {"스트레칭": [], "무산소": [], "유산소": []}
-        for ex in safe_exercises:
-            if ex['type'] in by_type:
-                by_type[ex['type']].append(ex)
+        # Precomputed safe candidate rows, already bucketed by type and sorted
+        # by distance to the group's mid intensity
+        by_type, safe_rows = self._lookup(user_group, conditions or [])
         
         # Get type preferences for this group
-        preferences = self.GROUP_TYPE_PREFERENCES.get(user_group, {
-            "스트레칭": 0.33, "무산소": 0.33, "유산소": 0.34
-        })
+        preferences = self.GROUP_TYPE_PREFERENCES.get(user_group, self.DEFAULT_TYPE_PREFERENCES)
         
         # Build balanced prescription
         prescription = []
         
         for ex_type, ratio in preferences.items():
             count = max(1, int(num_exercises * ratio))
-            available = by_type.get(ex_type, [])
-            
-            # Sort by intensity (prefer middle of range)
-            target_intensity = (min_intensity + max_intensity) / 2
-            available.sort(key=lambda x: abs(x['intensity'] - target_intensity))
-            
-            prescription.extend(available[:count])
+            if ex_type in by_type:
+                prescription.extend(by_type[ex_type][:count].tolist())
         
         # Ensure we have enough exercises
         if len(prescription) < num_exercises:
-            remaining = [ex for ex in safe_exercises if ex not in prescription]
-            prescription.extend(remaining[:num_exercises - len(prescription)])
+            remaining = safe_rows[~np.isin(safe_rows, prescription)]
+            prescription.extend(remaining[:num_exercises - len(prescription)].tolist())
         
         # Limit to requested number
         prescription = prescription[:num_exercises]
         
-        # Add prescription metadata
-        for ex in prescription:
-            ex['prescribed_for'] = user_group
-            ex['safety_checked'] = True
+        # Per-response copies with prescription metadata (catalog stays untouched)
+        exercises = self.exercises
+        return [
+            exercises[row].to_dict(prescribed_for=user_group, safety_checked=True)
+            for row in prescription
+        ]
+    
+    def optimize_prescription(
+        self,
+        user_group: str,
+        conditions: List[str] = None,
+        num_exercises: int = 8,
+        session_minutes: Optional[int] = None,
+        max_total_intensity: Optional[int] = None,
+        variety_key: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Constrained prescription: best intensity fit and variety under the
+        group's type ratios, a session time budget and a total-intensity cap.
+        May return fewer than num_exercises if the budgets do not allow more.
+        """
+        min_intensity, max_intensity = self.GROUP_INTENSITY_RANGES.get(user_group, self.DEFAULT_INTENSITY_RANGE)
+        if session_minutes is None:
+            session_minutes = self.GROUP_SESSION_MINUTES.get(user_group, self.DEFAULT_SESSION_MINUTES)
+        if max_total_intensity is None:
+            max_total_intensity = int(num_exercises * (min_intensity + max_intensity) / 2)
+        if session_minutes < 1 or max_total_intensity < 1:
+            raise ValueError(f"Budgets must be positive, got {session_minutes} min / intensity {max_total_intensity}")
         
-        return prescription
+        # Optimizer and the exercises its rows refer to, from the same catalog load
+        routine_optimizer, exercises = self._routine
+        rows = routine_optimizer.optimize(
+            (min_intensity, max_intensity),
+            self.GROUP_TYPE_PREFERENCES.get(user_group, self.DEFAULT_TYPE_PREFERENCES),
+            num_exercises,
+            session_minutes,
+            max_total_intensity,
+            conditions or [],
+            variety_key
+        )
+        return [
+            exercises[row].to_dict(prescribed_for=user_group, safety_checked=True)
+            for row in rows
+        ]
     
-    def _apply_safety_filter(
-        self, 
-        exercises: List[Dict], 
+    def _lookup(
+        self,
+        user_group: str,
         conditions: List[str]
-    ) -> List[Dict]:
-        """Remove exercises contraindicated for user's conditions."""
-        contraindicated_names = set()
+    ) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        """Index lookup: (sorted candidate rows per type, all safe rows in DB order)."""
+        group_key = user_group if user_group in self.GROUP_INTENSITY_RANGES else None
+        condition_key = frozenset(c for c in conditions if c in self.CONTRAINDICATED)
+        return self._index[(group_key, condition_key)]
+    
+    def _build_index(
+        self,
+        catalog: ExerciseCatalog
+    ) -> Dict[Tuple[Optional[str], FrozenSet[str]], Tuple[Dict[str, np.ndarray], np.ndarray]]:
+        """
+        Precompute safe, sorted per-type candidate rows for every
+        (group, set of known conditions) combination.
+        Unknown groups share the None key with the default intensity range.
+        Safety is one AND of the catalog's contraindication bitmasks per combination.
+        """
+        intensity = np.asarray(catalog.rows["intensity"])
+        types = np.asarray(catalog.rows["type"])
+        blocked = np.asarray(catalog.rows["contraindicated"])
+        
+        condition_sets = [
+            frozenset(combo)
+            for size in range(len(catalog.conditions) + 1)
+            for combo in combinations(catalog.conditions, size)
+        ]
         
-        for condition in conditions:
-            contraindicated_names.update(
-                self.CONTRAINDICATED.get(condition, [])
+        index = {}
+        for group_key in list(self.GROUP_INTENSITY_RANGES) + [None]:
+            min_intensity, max_intensity = self.GROUP_INTENSITY_RANGES.get(
+                group_key, self.DEFAULT_INTENSITY_RANGE
             )
+            target_intensity = (min_intensity + max_intensity) / 2
+            
+            # Filter exercises by intensity (DB order)
+            suitable = np.flatnonzero((intensity >= min_intensity) & (intensity <= max_intensity))
+            # Stable sort by distance to mid intensity; filtering later keeps this order
+            ranked = suitable[np.argsort(np.abs(intensity[suitable] - target_intensity), kind="stable")]
+            ranked_by_type = {
+                ex_type: ranked[types[ranked] == ex_type]
+                for ex_type in ("스트레칭", "무산소", "유산소")
+            }
+            
+            for condition_key in condition_sets:
+                mask = np.uint64(catalog.condition_mask(condition_key))
+                safe = suitable[(blocked[suitable] & mask) == 0]
+                by_type = {
+                    ex_type: rows[(blocked[rows] & mask) == 0]
+                    for ex_type, rows in ranked_by_type.items()
+                }
+                index[(group_key, condition_key)] = (by_type, safe)
         
-        return [
-            ex for ex in exercises 
-            if not any(contra in ex['name'] for contra in contraindicated_names)
-        ]
+        return index
+    
+    def safe_mask(self, conditions: Iterable[str]) -> np.ndarray:
+        """Boolean array over self.exercises: True where none of the conditions contraindicates it."""
+        return self.catalog.safe(conditions)
     
     def get_exercise_by_id(self, exercise_id: int) -> Dict:
         """Get exercise details by ID."""
-        for ex in self.exercises:
-            if ex['id'] == exercise_id:
-                return ex
-        return None
+        ids, order = self._by_id
+        # Last row with this id, like a dict built in DB order
+        position = int(np.searchsorted(ids, exercise_id, side="right", sorter=order)) - 1
+        if position < 0 or ids[order[position]] != exercise_id:
+            return None
+        return self.exercises[int(order[position])].to_dict()
     
     def get_exercises_by_type(self, exercise_type: str) -> List[Dict]:
         """Get all exercises of a specific type."""
-        return [ex for ex in self.exercises if ex['type'] == exercise_type]
+        rows = np.flatnonzero(np.asarray(self.catalog.rows["type"]) == exercise_type)
+        return [self.exercises[row].to_dict() for row in rows.tolist()]
     
     def get_exercises_by_intensity(
         self, 
@@ -170,7 +387,6 @@ class PrescriptionEngine:
         max_intensity: int = 10
     ) -> List[Dict]:
         """Get exercises within intensity range."""
-        return [
-            ex for ex in self.exercises 
-            if min_intensity <= ex['intensity'] <= max_intensity
-        ]
+        intensity = np.asarray(self.catalog.rows["intensity"])
+        rows = np.flatnonzero((intensity >= min_intensity) & (intensity <= max_intensity))
+        return [self.exercises[row].to_dict() for row in rows.tolist()]
@@ -0,0 +1,215 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import os
+import sqlite3
+import threading
+
+# Trend state lives next to the engine, outside of models/
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.state', 'trends.db')
+
+# EWMA weight of the newest point
+DEFAULT_ALPHA = 0.3
+
+
+class TrendState:
+    """
+    Rolling statistics of one senior's assessment series, O(1) in size:
+    the last three values, an EWMA and the sums for an online
+    least-squares slope (value against assessment index 0, 1, 2, ...).
+    """
+
+    __slots__ = ("count", "recent", "ewma", "sum_t", "sum_y", "sum_tt", "sum_ty")
+
+    RECENT = 3
+
+    def __init__(
+        self,
+        count: int = 0,
+        recent: Tuple[float, ...] = (),
+        ewma: Optional[float] = None,
+        sum_t: float = 0.0,
+        sum_y: float = 0.0,
+        sum_tt: float = 0.0,
+        sum_ty: float = 0.0
+    ):
+        self.count = count
+        self.recent = tuple(recent)
+        self.ewma = ewma
+        self.sum_t = sum_t
+        self.sum_y = sum_y
+        self.sum_tt = sum_tt
+        self.sum_ty = sum_ty
+
+    @classmethod
+    def from_values(cls, values: Iterable[float], alpha: float) -> "TrendState":
+        """Fold a full history (legacy requests that still send `history`)."""
+        state = cls()
+        for value in values:
+            state = state.update(value, alpha)
+        return state
+
+    def update(self, value: float, alpha: float) -> "TrendState":
+        """New state with one more assessment appended (self is unchanged)."""
+        value = float(value)
+        t = float(self.count)
+        return TrendState(
+            count=self.count + 1,
+            recent=(self.recent + (value,))[-self.RECENT:],
+            ewma=value if self.ewma is None else alpha * value + (1.0 - alpha) * self.ewma,
+            sum_t=self.sum_t + t,
+            sum_y=self.sum_y + value,
+            sum_tt=self.sum_tt + t * t,
+            sum_ty=self.sum_ty + t * value
+        )
+
+    @property
+    def recent_mean(self) -> float:
+        """Mean of the last three values (the diagnosis trend_score)."""
+        return sum(self.recent) / len(self.recent) if self.recent else 0.5
+
+    @property
+    def slope(self) -> float:
+        """Least-squares slope per assessment; 0.0 until there are two points."""
+        denominator = self.count * self.sum_tt - self.sum_t * self.sum_t
+        if self.count < 2 or denominator == 0:
+            return 0.0
+        return (self.count * self.sum_ty - self.sum_t * self.sum_y) / denominator
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "score": self.recent_mean,
+            "ewma": self.ewma,
+            "slope": self.slope,
+            "points": self.count
+        }
+
+    def _row(self) -> Tuple:
+        recent = list(self.recent) + [None] * (self.RECENT - len(self.recent))
+        return (self.count, *recent, self.ewma, self.sum_t, self.sum_y, self.sum_tt, self.sum_ty)
+
+    @classmethod
+    def _from_row(cls, row: Tuple) -> "TrendState":
+        count, r0, r1, r2, ewma, sum_t, sum_y, sum_tt, sum_ty = row
+        return cls(count, tuple(v for v in (r0, r1, r2) if v is not None),
+                   ewma, sum_t, sum_y, sum_tt, sum_ty)
+
+
+class TrendStore:
+    """
+    Per-senior trend state keyed by user_id, persisted in SQLite so it
+    survives restarts. Clients send only the new assessment point; the
+    state is updated in O(1) and written through in the same call.
+
+    Each update is a read-modify-write inside one write transaction and
+    nothing is cached in memory, so worker processes sharing the file
+    never overwrite each other's points. Points sent with their
+    measurement time are applied once: a retried request, or a point
+    older than the last one applied, leaves the state unchanged.
+    """
+
+    _COLUMNS = "count, r0, r1, r2, ewma, sum_t, sum_y, sum_tt, sum_ty"
+
+    def __init__(self, path: Optional[str] = None, alpha: float = DEFAULT_ALPHA):
+        """
+        Args:
+            path: SQLite file (created if missing); ':memory:' for tests
+            alpha: EWMA weight of the newest point
+        """
+        self.path = path or DEFAULT_DB_PATH
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS senior_trend ("
+            " user_id TEXT PRIMARY KEY, count INTEGER NOT NULL,"
+            " r0 REAL, r1 REAL, r2 REAL, ewma REAL,"
+            " sum_t REAL NOT NULL, sum_y REAL NOT NULL, sum_tt REAL NOT NULL, sum_ty REAL NOT NULL,"
+            " last_measured_at TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(senior_trend)")}
+        if "last_measured_at" not in columns:
+            self._conn.execute("ALTER TABLE senior_trend ADD COLUMN last_measured_at TEXT")
+
+    @classmethod
+    def from_env(cls) -> "TrendStore":
+        """Configured by NORICARE_TREND_DB and NORICARE_TREND_ALPHA."""
+        return cls(
+            path=os.environ.get("NORICARE_TREND_DB") or None,
+            alpha=float(os.environ.get("NORICARE_TREND_ALPHA", DEFAULT_ALPHA))
+        )
+
+    def _load(self, user_id: str) -> Tuple[Optional[TrendState], Optional[str]]:
+        """(state, measurement time of the last point applied) as stored."""
+        row = self._conn.execute(
+            f"SELECT {self._COLUMNS}, last_measured_at FROM senior_trend WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None, None
+        return TrendState._from_row(row[:-1]), row[-1]
+
+    def get(self, user_id: str) -> Optional[TrendState]:
+        with self._lock:
+            return self._load(user_id)[0]
+
+    def update(self, user_id: str, value: float, measured_at: Optional[str] = None) -> TrendState:
+        """Append one assessment for user_id; returns the new state."""
+        return self.update_many([(user_id, value, measured_at)])[0]
+
+    def update_many(self, points: List[Tuple[str, float, Optional[str]]]) -> List[TrendState]:
+        """
+        Append several (user_id, value, measured_at) points in one
+        transaction; states in input order. measured_at is a sortable
+        UTC ISO string, or None to always append. A point measured at or
+        before the senior's last applied point is skipped.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                states, changed = self._fold(points)
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO senior_trend (user_id, {self._COLUMNS}, last_measured_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(user_id, *state._row(), last_at) for user_id, (state, last_at) in changed.items()]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return states
+
+    def preview_many(self, points: List[Tuple[str, float, Optional[str]]]) -> List[TrendState]:
+        """The states update_many(points) would return, without storing anything."""
+        with self._lock:
+            return self._fold(points)[0]
+
+    def _fold(self, points: List[Tuple[str, float, Optional[str]]]) -> Tuple[List[TrendState], Dict]:
+        """(states in input order, {user_id: (state, last_measured_at)} of the seniors that changed)."""
+        states, changed = [], {}
+        for user_id, value, measured_at in points:
+            if user_id in changed:
+                previous, last_at = changed[user_id]
+            else:
+                previous, last_at = self._load(user_id)
+            previous = previous or TrendState()
+            if measured_at is not None and last_at is not None and measured_at <= last_at:
+                state = previous
+            else:
+                state = previous.update(value, self.alpha)
+                if measured_at is not None:
+                    last_at = measured_at
+                changed[user_id] = (state, last_at)
+            states.append(state)
+        return states, changed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM senior_trend").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,248 @@
+"""
+Noricare AI Engine - Bulk Cohort Scoring
+
+Streams a cohort file (CSV, or Parquet when pyarrow is installed) in
+fixed-size chunks, scores every row with the trained diagnosis models
+and assigns the user group and soft membership scores (all vectorized
+per chunk), and appends the results to the output file chunk by chunk.
+Memory stays flat regardless of input size.
+
+Feature columns are the ones listed in models/feature_names.pkl; missing
+columns or cells are filled by the trained k-NN imputer (models/imputer.pkl),
+or the diagnosis engine's defaults without one.
+
+Usage:
+    python score_cohort.py cohort.csv scores.csv
+    python score_cohort.py cohort.parquet scores.jsonl --chunk-size 50000
+    python score_cohort.py cohort.csv scores.csv --workers 4 --id-column senior_id
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from core.diagnosis import HybridDiagnosisEngine
+from core.clustering import UserClustering
+
+GROUPS = UserClustering.GROUPS
+
+OUTPUT_COLUMNS = (
+    ["id", "group", "frail_category", "frail_prob_normal", "frail_prob_prefrail",
+     "frail_prob_frail", "fall_risk", "fall_probability", "functional_score",
+     "disease_risk_score"]
+    + [f"membership_{group}" for group in GROUPS]
+)
+
+# Engines are created once per process (main process or pool worker)
+_engine = None
+_clustering = None
+
+
+def _get_engines():
+    global _engine, _clustering
+    if _engine is None:
+        _engine = HybridDiagnosisEngine()
+        _clustering = UserClustering()
+    return _engine, _clustering
+
+
+# ---------------------------------------------------------------------------
+# Readers: yield (ids, raw feature matrix with NaN for missing cells)
+# ---------------------------------------------------------------------------
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def iter_csv_chunks(path, feature_names, chunk_size, id_column=None):
+    """Stream a CSV with the csv module; only one chunk of rows is held at a time."""
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        position = {name: i for i, name in enumerate(header)}
+        _warn_missing(feature_names, position)
+        if id_column is not None and id_column not in position:
+            raise SystemExit(f"Error: id column '{id_column}' not found in {path}")
+
+        columns = [position.get(name) for name in feature_names]
+        id_index = position.get(id_column) if id_column else None
+        offset = 0
+        ids, rows = [], []
+
+        for record in reader:
+            rows.append([
+                _to_float(record[i]) if i is not None and i < len(record) else np.nan
+                for i in columns
+            ])
+            ids.append(record[id_index] if id_index is not None else offset + len(rows) - 1)
+            if len(rows) == chunk_size:
+                yield ids, np.array(rows, dtype=float)
+                offset += len(rows)
+                ids, rows = [], []
+
+        if rows:
+            yield ids, np.array(rows, dtype=float)
+
+
+def iter_parquet_chunks(path, feature_names, chunk_size, id_column=None):
+    """Stream a Parquet file by record batches (requires pyarrow)."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Error: reading Parquet requires pyarrow (pip install pyarrow)")
+
+    parquet = pq.ParquetFile(path)
+    available = set(parquet.schema_arrow.names)
+    _warn_missing(feature_names, available)
+    if id_column is not None and id_column not in available:
+        raise SystemExit(f"Error: id column '{id_column}' not found in {path}")
+
+    present = [name for name in feature_names if name in available]
+    read_columns = present + ([id_column] if id_column else [])
+    offset = 0
+
+    for batch in parquet.iter_batches(batch_size=chunk_size, columns=read_columns):
+        n = batch.num_rows
+        features = np.full((n, len(feature_names)), np.nan)
+        for j, name in enumerate(feature_names):
+            if name in available:
+                column = batch.column(name).cast("float64")
+                features[:, j] = column.to_numpy(zero_copy_only=False)
+        if id_column:
+            ids = batch.column(id_column).to_pylist()
+        else:
+            ids = list(range(offset, offset + n))
+        offset += n
+        yield ids, features
+
+
+def _warn_missing(feature_names, available):
+    missing = [name for name in feature_names if name not in available]
+    if missing:
+        print(f"[Cohort] Columns not in input, imputing: {', '.join(missing)}",
+              file=sys.stderr)
+
+
+# ---------------------------------------------------------------------------
+# Scoring
+# ---------------------------------------------------------------------------
+
+def score_chunk(ids, features):
+    """Vectorized diagnosis, group and membership scores for one chunk."""
+    engine, clustering = _get_engines()
+    engine.fill_missing_features(features)
+    scores = engine.predict_feature_matrix(features)
+
+    frail_proba = scores["frail_proba"]
+    functional, disease = scores["functional_score"], scores["disease_risk_score"]
+    groups = clustering.segment_users(functional, disease, scores["frail_category"])
+    membership = clustering.membership_matrix(functional, disease, frail_proba)
+
+    # One list per output column, then transposed into rows
+    columns = (
+        [list(ids), groups.tolist(), scores["frail_category"].astype(int).tolist(),
+         frail_proba[:, 0].tolist(), frail_proba[:, 1].tolist(), frail_proba[:, 2].tolist(),
+         scores["fall_risk"].astype(int).tolist(), scores["fall_proba"][:, 1].tolist(),
+         np.asarray(functional, dtype=float).tolist(), np.asarray(disease, dtype=float).tolist()]
+        + [membership[:, j].tolist() for j in range(len(GROUPS))]
+    )
+    return [list(row) for row in zip(*columns)]
+
+
+# ---------------------------------------------------------------------------
+# Writers
+# ---------------------------------------------------------------------------
+
+class CsvWriter:
+    def __init__(self, f):
+        self.writer = csv.writer(f)
+        self.writer.writerow(OUTPUT_COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+
+class JsonlWriter:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, rows):
+        self.f.writelines(json.dumps(dict(zip(OUTPUT_COLUMNS, row))) + "\n" for row in rows)
+
+
+def score_file(input_path, output_path, chunk_size=10000, workers=1, id_column=None):
+    """
+    Score input_path into output_path; returns the number of rows written.
+    With workers > 1, chunks are scored in a process pool; at most
+    2 * workers chunks are in flight and results are written in input order.
+    """
+    engine, _ = _get_engines()
+    if not engine.models_loaded:
+        raise SystemExit("Error: trained models not found, run train_models.py first")
+
+    if input_path.endswith(".parquet"):
+        chunks = iter_parquet_chunks(input_path, engine.feature_names, chunk_size, id_column)
+    else:
+        chunks = iter_csv_chunks(input_path, engine.feature_names, chunk_size, id_column)
+
+    writer_cls = JsonlWriter if output_path.endswith((".jsonl", ".ndjson")) else CsvWriter
+    total = 0
+    start = time.perf_counter()
+
+    with open(output_path, "w", newline='', encoding='utf-8') as f:
+        writer = writer_cls(f)
+
+        def emit(rows):
+            nonlocal total
+            writer.write(rows)
+            total += len(rows)
+            print(f"[Cohort] {total} rows scored", file=sys.stderr)
+
+        if workers <= 1:
+            for ids, features in chunks:
+                emit(score_chunk(ids, features))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for ids, features in chunks:
+                    pending.append(pool.submit(score_chunk, ids, features))
+                    if len(pending) >= 2 * workers:
+                        emit(pending.popleft().result())
+                while pending:
+                    emit(pending.popleft().result())
+
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"[OK] {total} rows -> {output_path} in {elapsed:.2f}s ({rate:,.0f} rows/s, "
+          f"model_version={engine.model_version})")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a senior cohort file with the Noricare models")
+    parser.add_argument('input', help="Cohort file (.csv, or .parquet with pyarrow installed)")
+    parser.add_argument('output', help="Results file (.csv, or .jsonl)")
+    parser.add_argument('--chunk-size', type=int, default=10000, help="Rows per chunk")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes for scoring")
+    parser.add_argument('--id-column', help="Input column copied to the output 'id' (default: row number)")
+    args = parser.parse_args()
+
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be >= 1")
+
+    score_file(args.input, args.output, args.chunk_size, args.workers, args.id_column)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,9 +6,34 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+from core.preprocessing import DataPreprocessor
 from core.diagnosis import HybridDiagnosisEngine
 from core.clustering import UserClustering
 from core.prescription import PrescriptionEngine
+from core.forest import FlatForest
+from core.model_registry import get_model_registry
+
+def _api():
+    """The API module, its state stores in a temp directory and without warm-up (TestClient skips the lifespan)."""
+    import tempfile
+    if "NORICARE_FEEDBACK_SNAPSHOT" not in os.environ:
+        state_dir = tempfile.mkdtemp()
+        os.environ["NORICARE_FEEDBACK_SNAPSHOT"] = os.path.join(state_dir, "feedback_state.json")
+        os.environ["NORICARE_TREND_DB"] = os.path.join(state_dir, "trends.db")
+    import api
+    return api
+
+
+def _same_result(a, b):
+    """Equal results, except floats: one row vs a matrix through BLAS may differ in the last bit."""
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(_same_result(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)):
+        return isinstance(b, (list, tuple)) and len(a) == len(b) and all(_same_result(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) and isinstance(b, float):
+        return abs(a - b) <= 1e-12
+    return a == b
+
 
 def test_ai_engine():
     """Test the AI engine with sample data."""
@@ -119,5 +144,1171 @@ def test_ai_engine():
     print("=" * 60)
 
 
+def test_flat_forest_parity():
+    """Flattened FRAIL forest must reproduce sklearn probabilities (bit for bit in-process)."""
+    import numpy as np
+    
+    frail_model = get_model_registry().get('frail_model')
+    forest = FlatForest.from_sklearn(frail_model)
+    
+    rng = np.random.RandomState(42)
+    for n_rows in (1, 7, 256):
+        X = rng.normal(scale=1.5, size=(n_rows, frail_model.n_features_in_))
+        assert np.array_equal(forest.predict_proba(X), frail_model.predict_proba(X))
+        assert np.array_equal(forest.predict(X), frail_model.predict(X))
+    
+    # The exported artifact must match the pickled model as well (it may
+    # have been exported under another sklearn version: last-bit tolerance)
+    exported = FlatForest.from_arrays(get_model_registry().get('frail_forest'))
+    assert exported.n_features_in_ == frail_model.n_features_in_
+    X = rng.normal(size=(64, frail_model.n_features_in_))
+    assert exported.matches(exported.predict_proba(X), frail_model.predict_proba(X))
+    
+    # n_features_in_ comes from the model, even if its last feature never splits
+    from sklearn.ensemble import RandomForestClassifier
+    X = np.hstack([rng.normal(size=(200, 3)), np.ones((200, 1))])
+    small = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, X[:, 0] > 0)
+    flat = FlatForest.from_sklearn(small)
+    assert int(flat.feature.max()) < 3
+    assert flat.n_features_in_ == FlatForest.from_arrays(flat.to_arrays()).n_features_in_ == 4
+    assert flat.quantize().n_features_in_ == 4
+    
+    # Quantized copy (--compact): same routing, float32 probabilities.
+    # Inputs sitting exactly on split thresholds exercise the rounding.
+    quantized = forest.quantize()
+    X = rng.normal(scale=1.5, size=(256, frail_model.n_features_in_))
+    internal = np.flatnonzero(forest.left != np.arange(len(forest.left)))[:256]
+    X[np.arange(256), forest.feature[internal]] = forest.threshold[internal]
+    assert np.allclose(quantized.predict_proba(X), frail_model.predict_proba(X), rtol=0, atol=1e-6)
+
+
+
+def test_model_registry_swap_keeps_artifacts():
+    """A hot swap republishes every artifact in use, not only the diagnosis bundle (minus the sklearn forest)."""
+    from core.model_registry import ModelRegistry
+    
+    registry = ModelRegistry()
+    registry.load_bundle()
+    mlp = registry.get_optional("mlp_optimizer")
+    assert mlp is not None
+    registry.get("frail_forest")
+    
+    # The sklearn forest is only read for the smoke test, never served
+    engine = HybridDiagnosisEngine(registry)
+    engine.smoke_test(registry.load_bundle(fresh=True))
+    registry.swap(registry.load_bundle(fresh=True))
+    swapped = registry.get_optional("mlp_optimizer")
+    assert swapped is not None and swapped is not mlp   # re-read with the new version
+    assert "frail_forest" in registry._artifacts and "imputer" in registry._artifacts
+    assert "frail_model" not in registry._artifacts and "frail_model" not in registry.load_all()
+    assert not hasattr(registry.load_bundle(), "frail_model")
+    assert registry.load_bundle().version == registry.version
+
+
+def test_preprocessing_batch_parity():
+    """normalize_batch must give the same numbers as normalize, record by record."""
+    import numpy as np
+    
+    preprocessor = DataPreprocessor()
+    rng = np.random.RandomState(7)
+    records = []
+    for i in range(500):
+        record = {
+            "age": int(rng.randint(50, 110)),
+            "gender": "F",
+            "sppb": float(rng.uniform(-2, 14)),
+            "tug": float(rng.uniform(5, 40)),
+            "conditions": []
+        }
+        if i % 5 == 0:
+            record["sppb"] = None
+        if i % 7 == 0:
+            del record["tug"]
+        if i % 11 == 0:
+            record["age"] = None
+        if i % 13 == 0:
+            record["sppb"] = float("nan")
+        records.append(record)
+    originals = [dict(record) for record in records]
+    
+    single = [preprocessor.normalize(record) for record in records]
+    assert records == originals  # caller's dicts are left untouched
+    assert all("normalized_sppb" not in record for record in records)
+    
+    columns = preprocessor.records_to_columns(records, ["age", "sppb", "tug"])
+    batch = preprocessor.split_batch(preprocessor.normalize_batch(columns), records)
+    assert batch == single
+
+
+def test_missing_tug_knn_imputed():
+    """A missing TUG reaches diagnosis as missing and is imputed by k-NN from the other features."""
+    import numpy as np
+    
+    preprocessor = DataPreprocessor()
+    engine = HybridDiagnosisEngine()
+    assert engine.models is not None and engine.models.imputer is not None
+    column = engine.models.feature_names.index("TUG_Time_s")
+    
+    weak = {"age": 84, "gender": "F", "sppb": 3, "grip_strength": 12.0, "gait_speed": 0.4,
+            "sppb_walk": 8.0, "sppb_chair": 25.0}
+    strong = {"age": 70, "gender": "M", "sppb": 11, "grip_strength": 32.0, "gait_speed": 1.3,
+              "sppb_walk": 3.0, "sppb_chair": 10.0}
+    records = [{**weak, "tug": None}, strong]   # None or absent
+    
+    single = [preprocessor.normalize(record) for record in records]
+    columns = preprocessor.records_to_columns(records, ["age", "sppb", "tug"])
+    assert preprocessor.split_batch(preprocessor.normalize_batch(columns), records) == single
+    assert single[0]["tug"] is None and "tug" not in single[1]
+    
+    features = engine.prepare_feature_matrix([{"conditions": []}] * 2, single)
+    tug = features[:, column]
+    assert np.all(np.isfinite(tug)) and tug[0] > tug[1]   # not one fixed default
+    assert tug[0] != engine.models.imputer.statistic("TUG_Time_s")
+
+
+def test_clustering_batch_parity():
+    """segment_users / membership_matrix must match the per-user scalar path exactly."""
+    import numpy as np
+    
+    clustering = UserClustering()
+    rng = np.random.RandomState(11)
+    n = 2000
+    proba = rng.dirichlet([1.0, 1.0, 1.0], n)
+    category = proba.argmax(axis=1)
+    category[:20] = 7                                   # unknown code -> Pre-frail
+    f_score = rng.uniform(-0.1, 1.1, n)
+    d_score = rng.uniform(-0.1, 1.1, n)
+    # Boundaries and the Sarcopenic override (low function, low disease risk, not Frail)
+    f_score[20:40], d_score[20:40] = 0.5, 0.3
+    f_score[40:200], d_score[40:200] = rng.uniform(0, 0.5, 160), rng.uniform(0, 0.3, 160)
+    f_score[200:220] = np.array([0.4, 0.8] * 10)
+    
+    groups = clustering.segment_users(f_score, d_score, category)
+    membership = clustering.membership_matrix(f_score, d_score, proba)
+    fallback_groups = clustering.segment_users(f_score, d_score)
+    fallback_membership = clustering.membership_matrix(f_score, d_score)
+    assert "Sarcopenic" in set(groups) and "Frail" in set(groups)
+    
+    analyses = []
+    for i in range(n):
+        analysis = {
+            "frail_category": int(category[i]),
+            "frail_probabilities": {"Normal": proba[i, 0], "Pre-frail": proba[i, 1], "Frail": proba[i, 2]},
+            "functional_score": float(f_score[i]),
+            "disease_risk_score": float(d_score[i])
+        }
+        analyses.append(analysis)
+        assert groups[i] == clustering.segment_user(analysis)
+        expected = clustering.get_membership_scores(analysis)
+        assert membership[i].tolist() == [expected[g] for g in UserClustering.GROUPS]
+        
+        heuristic = {"functional_score": analysis["functional_score"],
+                     "disease_risk_score": analysis["disease_risk_score"]}
+        assert fallback_groups[i] == clustering.segment_user(heuristic)
+        expected = clustering.get_membership_scores(heuristic)
+        assert fallback_membership[i].tolist() == [expected[g] for g in UserClustering.GROUPS]
+    
+    assert clustering.segment_analyses(analyses) == groups.tolist()
+
+
+def test_result_cache_versions():
+    """A result computed before a reload finished is not cached under the new versions."""
+    from core.cache import ResultCache
+    
+    cache = ResultCache(max_entries=10, ttl_seconds=300)
+    cache.bind_versions(("v1", 1))
+    cache.put("a", {"model_version": "v1"}, ("v1", 1))
+    assert cache.get("a") is not None
+    
+    cache.bind_versions(("v2", 1))   # hot reload while a v1 request was in flight
+    cache.put("b", {"model_version": "v1"}, ("v1", 1))
+    assert cache.get("a") is None and cache.get("b") is None
+    cache.put("b", {"model_version": "v2"}, ("v2", 1))
+    assert cache.get("b") == {"model_version": "v2"}
+
+
+def test_trend_store_idempotent():
+    """Trend updates: retried points apply once, and two stores on one file never lose points."""
+    import os
+    import tempfile
+    from core.trends import TrendState, TrendStore
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "trends.db")
+        first, second = TrendStore(path), TrendStore(path)   # e.g. two worker processes
+        values = [0.4, 0.5, 0.55, 0.7]
+        for day, value in enumerate(values):
+            store = first if day % 2 == 0 else second
+            measured_at = f"2026-01-0{day + 1}T09:00:00"
+            state = store.update("senior-1", value, measured_at)
+            assert store.update("senior-1", value, measured_at).summary() == state.summary()   # retry
+        # Older than the last applied point: ignored
+        assert first.update("senior-1", 0.1, "2026-01-02T09:00:00").count == len(values)
+        expected = TrendState.from_values(values, first.alpha).summary()
+        assert first.get("senior-1").summary() == expected == second.get("senior-1").summary()
+        # Without measured_at every point is appended
+        assert second.update_many([("senior-2", 0.5, None), ("senior-2", 0.5, None)])[-1].count == 2
+        first.close()
+        second.close()
+
+
+def test_cohort_analytics_sqlite():
+    """Vectorized cohort analytics vs a per-senior loop, on a SQLite HealthAssessment stand-in."""
+    import sqlite3
+    import numpy as np
+    from core.analytics import AssessmentStore, SECONDS_PER_YEAR
+    
+    rng = np.random.RandomState(5)
+    conn = sqlite3.connect(":memory:")
+    conn.execute('CREATE TABLE "HealthAssessment" ("id" TEXT PRIMARY KEY, "seniorId" TEXT NOT NULL, '
+                 '"measuredAt" DATETIME NOT NULL, "sppbScore" REAL, "gaitSpeed" REAL, "tugSeconds" REAL)')
+    rows, series = [], {}
+    for s in range(300):
+        senior = f"senior-{s}"
+        t = 1_672_531_200_000 + int(rng.randint(0, 10**9))
+        for j in range(int(rng.randint(1, 9))):
+            t += int(rng.randint(1, 200)) * 86_400_000
+            sppb = None if rng.rand() < 0.15 else float(rng.randint(0, 13))
+            tug = None if rng.rand() < 0.15 else float(rng.uniform(6, 30))
+            # Prisma's integer ms and ISO text encodings, mixed
+            measured = t if j % 2 else np.datetime_as_string(np.datetime64(t, 'ms')) + "Z"
+            rows.append((f"a{len(rows)}", senior, measured, sppb, float(rng.uniform(0.3, 1.5)), tug))
+            series.setdefault(senior, []).append((t / 1000.0, sppb, tug))
+    rng.shuffle(rows)
+    conn.executemany('INSERT INTO "HealthAssessment" VALUES (?, ?, ?, ?, ?, ?)', rows)
+    
+    store = AssessmentStore.from_sqlite(conn)
+    assert len(store) == len(rows) and store.n_seniors == len(series)
+    trends = store.trends("sppb")
+    transitions = store.transitions()
+    
+    def group(sppb, tug):
+        if sppb is not None:
+            return 2 if sppb <= 6 else 1 if sppb <= 9 else 0
+        if tug is not None:
+            return 2 if tug >= 20 else 1 if tug >= 12 else 0
+        return -1
+    
+    matrix = np.zeros((3, 3), dtype=int)
+    latest_sppb = []
+    for senior, points in series.items():
+        i = store.senior_index(senior)
+        t = np.array([p[0] for p in points if p[1] is not None])
+        y = np.array([p[1] for p in points if p[1] is not None])
+        assert trends["points"][i] == len(y)
+        if len(y):
+            assert trends["first"][i] == y[0] and trends["last"][i] == y[-1]
+            latest_sppb.append(y[-1])
+        if len(y) >= 2:
+            expected = np.polyfit((t - points[0][0]) / SECONDS_PER_YEAR, y, 1)[0]
+            assert np.isclose(trends["slope_per_year"][i], expected, rtol=1e-6, atol=1e-9)
+        else:
+            assert np.isnan(trends["slope_per_year"][i])
+        
+        groups = [g for g in (group(p[1], p[2]) for p in points) if g >= 0]
+        for a, b in zip(groups, groups[1:]):
+            matrix[a, b] += 1
+        assert transitions["latest"][i] == (groups[-1] if groups else -1)
+    
+    assert np.array_equal(transitions["matrix"], matrix)
+    assert store.percentiles("sppb", (50,))["p50"] == float(np.percentile(latest_sppb, 50))
+    
+    report = store.senior_report("senior-7")
+    assert report["assessments"] == len(series["senior-7"])
+    assert report["trends"]["sppb"]["points"] == trends["points"][store.senior_index("senior-7")]
+    assert store.cohort_summary()["seniors"] == 300
+
+
+def test_optimizer_mlp_parity():
+    """NumPy MLP: single-row and batched calls agree and follow the distilled rule, with or without a group."""
+    import numpy as np
+    from core.feedback import OptimizationLoop
+    from core.mlp import NumpyMLP
+    
+    optimizer = OptimizationLoop()
+    assert optimizer.mlp is not None
+    assert NumpyMLP.from_arrays(optimizer.mlp.to_arrays()).predict(np.zeros((1, len(OptimizationLoop.FEATURES)))).shape == (1,)
+    
+    rng = np.random.RandomState(3)
+    n = 400
+    rpe = rng.randint(1, 11, n)
+    pain = rng.rand(n) < 0.2
+    satisfaction = rng.randint(1, 6, n)
+    intensity = rng.randint(1, 11, n)
+    group = rng.choice(UserClustering.GROUPS, n).astype(object)
+    
+    batched = optimizer.intensity_deltas(rpe, pain, satisfaction, intensity, group)
+    assert np.array_equal(batched, OptimizationLoop.rule_deltas(rpe, pain, satisfaction))
+    
+    for i in range(0, n, 20):
+        adjusted = optimizer.fine_tune_prescription(
+            {"intensity": int(intensity[i]), "group": group[i]},
+            {"rpe": int(rpe[i]), "has_pain": bool(pain[i]), "satisfaction": int(satisfaction[i])}
+        )
+        expected = min(10, max(1, intensity[i] + batched[i]))
+        assert adjusted["intensity"] == expected
+    
+    # No group (/optimize/feedback without `group`, feedback state without groups): whole grid
+    rpe, pain, satisfaction, intensity = (g.ravel() for g in np.meshgrid(
+        np.arange(1, 11), [False, True], np.arange(1, 6), np.arange(1, 11), indexing='ij'
+    ))
+    assert np.array_equal(
+        optimizer.intensity_deltas(rpe, pain, satisfaction, intensity),
+        OptimizationLoop.rule_deltas(rpe, pain, satisfaction)
+    )
+    adjusted = optimizer.fine_tune_prescription({"intensity": 2}, {"rpe": 2, "has_pain": False, "satisfaction": 3})
+    assert adjusted["intensity"] == 2
+    
+    # Two distinct deltas (e.g. a --feedback-history with only -1/0): one logistic output unit
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.preprocessing import StandardScaler
+    X = OptimizationLoop.feature_matrix(rpe, pain, satisfaction, intensity)
+    y = np.where(pain | (rpe > 7), -1, 0)
+    scaler = StandardScaler().fit(X)
+    model = MLPClassifier(hidden_layer_sizes=(16,), max_iter=500, random_state=0).fit(scaler.transform(X), y)
+    assert model.coefs_[-1].shape[1] == 1
+    binary = NumpyMLP.from_arrays(NumpyMLP.from_sklearn(model, scaler).to_arrays())
+    predicted = binary.predict(X)
+    assert np.array_equal(predicted, model.predict(scaler.transform(X))) and set(predicted) == {-1, 0}
+
+
+def test_feedback_state_store():
+    """FeedbackLog ingestion: batched rounds == one event at a time, re-sends skipped by id, late events applied, snapshots restored."""
+    import json
+    import random
+    import tempfile
+    from fastapi.testclient import TestClient
+    from core.feedback import FeedbackStateStore, OptimizationLoop
+    
+    optimizer = OptimizationLoop()
+    rng = random.Random(4)
+    events = []
+    for senior in range(3):
+        for exercise in range(4):
+            for day in range(rng.randint(1, 6)):
+                events.append({
+                    "id": f"log-{len(events)}", "seniorId": f"senior-{senior}", "prescriptionId": f"rx-{senior}-{exercise}",
+                    "loggedAt": f"2026-03-{day + 1:02d}T18:00:00", "hasPain": rng.random() < 0.15,
+                    "rpeScore": rng.randint(1, 10), "satisfaction": rng.randint(1, 5)
+                })
+    events.append({**events[0], "id": None, "prescriptionId": None})   # not tied to an exercise
+    groups = {"senior-0": "Frail"}
+    intensities = {"rx-1-0": 8}
+    
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "feedback_state.json")
+    batched = FeedbackStateStore(optimizer, snapshot_path=path, snapshot_interval=3600)
+    one_by_one = FeedbackStateStore(optimizer)
+    shuffled = events[:]
+    rng.shuffle(shuffled)
+    result = batched.ingest(shuffled, intensities, groups)
+    assert result["applied"] == len(events) - 1 and result["skipped"] == 1 and result["late"] == 0
+    for event in sorted(events[:-1], key=lambda e: e["loggedAt"]):
+        one_by_one.ingest([event], intensities, groups)
+    for senior in range(3):
+        assert batched.senior_state(f"senior-{senior}") == one_by_one.senior_state(f"senior-{senior}")
+    painful = {(e["seniorId"], e["prescriptionId"]) for e in events[:-1] if e["hasPain"]}
+    assert painful and all(batched.get(*key)["needsReview"] for key in painful)
+    assert all("appliedIds" not in state for state in result["updated"])
+    
+    # Re-sending the sync changes nothing
+    before = batched.senior_state("senior-0")
+    again = batched.ingest(shuffled, intensities, groups)
+    assert again["applied"] == 0 and again["skipped"] == len(events)
+    assert batched.senior_state("senior-0") == before
+    
+    # An older event from a second tablet is still applied, once
+    late = {"id": "log-tablet-2", "seniorId": "senior-0", "prescriptionId": "rx-0-0",
+            "loggedAt": "2026-02-28T09:00:00", "hasPain": True, "rpeScore": 9, "satisfaction": 2}
+    state = batched.get("senior-0", "rx-0-0")
+    result = batched.ingest([late, late])
+    assert result["applied"] == 1 and result["late"] == 1 and result["skipped"] == 1
+    updated = batched.get("senior-0", "rx-0-0")
+    assert updated["needsReview"] and updated["events"] == state["events"] + 1
+    assert updated["lastLoggedAt"] == state["lastLoggedAt"]
+    
+    # Snapshot round trip keeps intensities and the applied ids
+    batched.close()
+    restored = FeedbackStateStore(optimizer, snapshot_path=path)
+    for senior in range(3):
+        assert restored.senior_state(f"senior-{senior}") == batched.senior_state(f"senior-{senior}")
+    assert restored.ingest(shuffled + [late])["applied"] == 0
+    
+    # Truncated file: moved aside, start empty; malformed entries: skipped
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text[:len(text) // 2])
+    assert len(FeedbackStateStore(optimizer, snapshot_path=path)) == 0
+    assert os.path.exists(path + ".corrupt")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "states": [updated, {"seniorId": "senior-9"}]}, f)
+    partial = FeedbackStateStore(optimizer, snapshot_path=path)
+    assert len(partial) == 1 and partial.get("senior-0", "rx-0-0")["intensity"] == updated["intensity"]
+    
+    # Endpoint: same semantics over HTTP
+    client = TestClient(_api().app)
+    body = {"events": [{**e, "loggedAt": e["loggedAt"] + "Z"} for e in events[:6]], "groups": groups}
+    first = client.post("/optimize/feedback/batch", json=body).json()
+    assert first["applied"] == 6
+    assert client.post("/optimize/feedback/batch", json=body).json()["applied"] == 0
+    exercises = client.get("/optimize/state/senior-0").json()["exercises"]
+    assert {state["prescriptionId"] for state in exercises} == {e["prescriptionId"] for e in events[:6]}
+
+
+def _phr_request(user_id, **phr):
+    """PrescriptionRequest body for the API tests."""
+    phr_data = {"age": 78, "gender": "F", "sppb": 7, "tug": 14.0, "conditions": ["Arthritis"]}
+    phr_data.update(phr)
+    return {"user_id": user_id, "phr_data": phr_data}
+
+
+def test_api_backpressure_503():
+    """A full inference pool (1 worker, no queue) answers 503 + Retry-After instead of queueing."""
+    import asyncio
+    import threading
+    from fastapi.testclient import TestClient
+    from core.executor import InferenceExecutor
+    
+    api = _api()
+    client = TestClient(api.app)
+    pool, release = InferenceExecutor(max_workers=1, max_queue=0), threading.Event()
+    occupant = threading.Thread(target=asyncio.run, args=(pool.run(release.wait),))
+    saved, api.inference_pool = api.inference_pool, pool
+    try:
+        occupant.start()
+        while pool.in_flight == 0:
+            release.wait(0.001)
+        response = client.post("/diagnose/prescription", json=_phr_request("backpressure", sppb=4.5))
+        assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+        response = client.post("/optimize/feedback", json={
+            "current_prescription": {"intensity": 5},
+            "feedback": {"prescription_id": "rx-1", "rpe": 9, "has_pain": False, "satisfaction": 2}
+        })
+        assert response.status_code == 503
+        assert pool.stats()["rejected"] == 2
+        
+        release.set()
+        occupant.join()
+        response = client.post("/diagnose/prescription", json=_phr_request("backpressure", sppb=4.5))
+        assert response.status_code == 200 and response.json()["prescription"]
+    finally:
+        release.set()
+        api.inference_pool = saved
+        pool.shutdown()
+
+
+def test_api_batch_matches_single():
+    """/diagnose/prescription/batch == /diagnose/prescription per user (bar prescriptionId), cache hits and misses mixed."""
+    from fastapi.testclient import TestClient
+    
+    api = _api()
+    client = TestClient(api.app)
+    reqs = []
+    for i in range(12):
+        req = _phr_request(f"batch-{i}", age=66 + i, sppb=2.5 + i * 0.75, tug=None if i % 4 == 0 else 9.0 + i,
+                           conditions=[["Arthritis"], [], ["Diabetes", "Hypertension"]][i % 3])
+        if i % 5 == 0:
+            req.update(mode="optimized", session_minutes=30)
+        reqs.append(req)
+    
+    def without_ids(response):
+        return {**response, "prescription": [{k: v for k, v in ex.items() if k != "prescriptionId"}
+                                             for ex in response["prescription"]]}
+    
+    
+    api.result_cache.clear()
+    expected = [without_ids(client.post("/diagnose/prescription", json=req).json()) for req in reqs]
+    api.result_cache.clear()
+    for req in reqs[::2]:
+        client.post("/diagnose/prescription", json=req)   # half the batch is cached
+    hits, misses = api.result_cache.hits, api.result_cache.misses
+    
+    response = client.post("/diagnose/prescription/batch", json=reqs)
+    assert response.status_code == 200
+    assert _same_result([without_ids(result) for result in response.json()], expected)
+    assert api.result_cache.hits - hits == 6 and api.result_cache.misses - misses == 6
+
+
+def test_api_trend_recorded_after_success():
+    """A failed request leaves the stored trend unchanged, so its retry (no measured_at) adds the point once."""
+    from fastapi.testclient import TestClient
+    
+    api = _api()
+    client = TestClient(api.app)
+    run_analysis_batch = api._run_analysis_batch
+    
+    async def crashed(profiles, health_metrics):
+        raise RuntimeError("inference worker crashed")
+    
+    for path, wrap in (("/diagnose/prescription", dict), ("/diagnose/prescription/batch", lambda req: [req])):
+        user_id = "trend-retry" + path
+        api.result_cache.clear()
+        api._run_analysis_batch = crashed
+        try:
+            assert client.post(path, json=wrap(_phr_request(user_id, new_point=0.6))).status_code == 500
+        finally:
+            api._run_analysis_batch = run_analysis_batch
+        assert api.trend_store.get(user_id) is None
+        
+        response = client.post(path, json=wrap(_phr_request(user_id, new_point=0.6)))   # the retry
+        assert response.status_code == 200
+        result = response.json()[0] if path.endswith("/batch") else response.json()
+        assert result["analysis"]["trend"]["points"] == 1 == api.trend_store.get(user_id).count
+        
+        client.post(path, json=wrap(_phr_request(user_id, new_point=0.8)))   # next assessment
+        assert api.trend_store.get(user_id).count == 2
+
+
+def test_api_fine_tune_model_version():
+    """/optimize/feedback reports its model_version; a pool worker behind the parent reloads before answering."""
+    from types import SimpleNamespace
+    from fastapi.testclient import TestClient
+    
+    api = _api()
+    client = TestClient(api.app)
+    feedback = {"prescription_id": "rx-1", "rpe": 9, "has_pain": False, "satisfaction": 2}
+    response = client.post("/optimize/feedback", json={"current_prescription": {"id": 31, "intensity": 6}, "feedback": feedback})
+    assert response.status_code == 200
+    adjusted = response.json()
+    assert adjusted["id"] == 31 and adjusted["model_version"] == api.diagnosis_engine.model_version
+    
+    # A worker process still on the old models (the parent hot-reloaded)
+    reloads = []
+    def refresh(version):
+        reloads.append(version)
+        worker.model_version = version
+    worker = SimpleNamespace(model_version="old", refresh_models=refresh)
+    engine, api.diagnosis_engine = api.diagnosis_engine, worker
+    try:
+        adjusted = api._fine_tune({"intensity": 6}, {"rpe": 9, "has_pain": False, "satisfaction": 2}, "new")
+    finally:
+        api.diagnosis_engine = engine
+    assert reloads == ["new"] and adjusted["model_version"] == "new"
+
+
+def test_diagnosis_batcher_coalesces():
+    """Concurrent single-user calls become one engine call; every caller gets its own result, or the batch's error."""
+    import asyncio
+    from core.batching import DiagnosisBatcher
+    
+    engine = HybridDiagnosisEngine()
+    calls = []
+    
+    async def run_batch(profiles, health_metrics):
+        calls.append(len(profiles))
+        if any(m.get("fail") for m in health_metrics):
+            raise RuntimeError("pool saturated")
+        return engine.analyze_risk_factors_batch(profiles, health_metrics)
+    
+    users = [({"conditions": [], "gds_score": 2 + i, "eq_vas": 90 - 8 * i},
+              {"grip_strength": 30.0 - 3 * i, "gait_speed": 1.3 - 0.12 * i, "tug": 9.0 + 2.5 * i, "sppb": 11 - i})
+             for i in range(6)]
+    
+    async def concurrent(batcher, users):
+        return await asyncio.gather(
+            *(batcher.analyze(profile, metrics) for profile, metrics in users), return_exceptions=True
+        )
+    
+    batcher = DiagnosisBatcher(run_batch, max_batch=64, max_wait_ms=20)
+    results = asyncio.run(concurrent(batcher, users))
+    assert calls == [6] and batcher.stats()["batches"] == 1
+    for (profile, metrics), result in zip(users, results):
+        assert _same_result(result, engine.analyze_risk_factors(profile, metrics))
+    assert len({result["frail_category"] for result in results}) > 1
+    
+    # max_batch splits the waiters; a failing batch fails all of its callers and only them
+    calls.clear()
+    batcher = DiagnosisBatcher(run_batch, max_batch=3, max_wait_ms=20)
+    users[4][1]["fail"] = True
+    results = asyncio.run(concurrent(batcher, users))
+    assert calls == [3, 3]
+    assert all(isinstance(result, dict) for result in results[:3])
+    assert all(isinstance(result, RuntimeError) and str(result) == "pool saturated" for result in results[3:])
+
+
+def test_lazy_startup_and_ready():
+    """LazyComponent builds once under concurrent first use; /ready is 503 until the warm-up finished."""
+    import threading
+    import time
+    from fastapi.testclient import TestClient
+    from core.lazy import LazyComponent, is_loaded, resolve
+    
+    built = []
+    def factory():
+        built.append(threading.get_ident())
+        time.sleep(0.05)   # slow enough for every thread to arrive while building
+        return PrescriptionEngine
+    
+    component = LazyComponent("slow", factory)
+    assert not is_loaded(component) and not built
+    start, seen = threading.Barrier(8), []
+    def first_use(i):
+        start.wait()
+        seen.append(resolve(component) if i % 2 else component.CONTRAINDICATED)
+    threads = [threading.Thread(target=first_use, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(built) == 1 and is_loaded(component)
+    assert seen.count(PrescriptionEngine) == 4 and seen.count(PrescriptionEngine.CONTRAINDICATED) == 4
+    
+    api = _api()
+    client = TestClient(api.app)
+    api._warmup_done.clear()   # as right after startup, whatever other tests loaded
+    api._warmup_error = None
+    response = client.get("/ready")
+    assert response.status_code == 503 and response.json()["ready"] is False
+    assert client.get("/").status_code == 200   # liveness does not wait
+    
+    api.warm_up()
+    response = client.get("/ready")
+    assert response.status_code == 200 and response.json()["ready"] is True
+    assert all(response.json()["components"].values())
+
+
+def test_api_reload_rejects_bad_artifacts():
+    """/admin/models/reload: a bundle failing validation is reported and the previous version keeps serving."""
+    import shutil
+    import tempfile
+    import joblib
+    from fastapi.testclient import TestClient
+    from core.model_registry import MODELS_DIR, ModelRegistry
+    
+    models_dir = os.path.join(tempfile.mkdtemp(), "models")
+    shutil.copytree(MODELS_DIR, models_dir)
+    engine = HybridDiagnosisEngine(ModelRegistry(models_dir=models_dir))
+    api = _api()
+    client = TestClient(api.app)
+    saved, api.diagnosis_engine = api.diagnosis_engine, engine
+    try:
+        served = engine.model_version
+        response = client.post("/admin/models/reload")
+        assert response.status_code == 200 and response.json()["reloaded"] is False
+        
+        # A frail_forest.pkl that no longer matches frail_classifier.pkl (stale export)
+        forest_path = os.path.join(models_dir, "frail_forest.pkl")
+        arrays = joblib.load(forest_path)
+        joblib.dump({**arrays, "value": arrays["value"][..., ::-1].copy()}, forest_path)
+        response = client.post("/admin/models/reload")
+        assert response.status_code == 500 and "does not match" in response.json()["detail"]
+        assert f"still serving {served}" in response.json()["detail"]
+        assert engine.model_version == served and engine.registry.version == served
+        assert client.get("/").json()["model_version"] == served
+        
+        # A truncated pickle fails to load at all
+        with open(os.path.join(models_dir, "fall_risk_model.pkl"), "wb") as f:
+            f.write(b"\x80\x04truncated")
+        response = client.post("/admin/models/reload")
+        assert response.status_code == 500 and engine.model_version == served
+        
+        response = client.post("/diagnose/prescription", json=_phr_request("reload-check", sppb=5.5))
+        assert response.status_code == 200 and response.json()["model_version"] == served
+    finally:
+        api.diagnosis_engine = saved
+
+
+def test_ready_answers_during_warmup():
+    """A request arriving while the warm-up still builds a component waits off the event loop: /ready keeps answering."""
+    import asyncio
+    import threading
+    import httpx
+    from core.lazy import LazyComponent, resolve
+    
+    api = _api()
+    real_rx_engine, building = resolve(api.rx_engine), threading.Event()
+    def slow_factory():
+        building.wait()
+        return real_rx_engine
+    
+    saved, api.rx_engine = api.rx_engine, LazyComponent("rx_engine", slow_factory)
+    was_ready, api._warmup_done = api._warmup_done, threading.Event()
+    warm_up = threading.Thread(target=resolve, args=(api.rx_engine,))   # holds the build lock
+    
+    async def scenario():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            pending = asyncio.ensure_future(client.post("/diagnose/prescription", json=_phr_request("warming", sppb=6.5)))
+            await asyncio.sleep(0.05)
+            ready = await asyncio.wait_for(client.get("/ready"), 5)
+            live = await asyncio.wait_for(client.get("/"), 5)
+            # Answered while the build was still running (a blocked loop only
+            # gets here once the safety timer released it)
+            assert not building.is_set() and not pending.done()
+            building.set()
+            return ready, live, await pending
+    
+    release = threading.Timer(3, building.set)
+    try:
+        warm_up.start()
+        release.start()
+        ready, live, response = asyncio.run(scenario())
+        assert ready.status_code == 503 and live.status_code == 200
+        assert response.status_code == 200
+    finally:
+        release.cancel()
+        building.set()
+        warm_up.join()
+        api.rx_engine, api._warmup_done = saved, was_ready
+
+
+def test_api_metrics_exposition():
+    """/metrics after real traffic: stage histograms, both model paths, cache and batcher stats, valid text format."""
+    import re
+    import tempfile
+    from fastapi.testclient import TestClient
+    from core.batching import DiagnosisBatcher
+    from core.model_registry import ModelRegistry
+    
+    api = _api()
+    client = TestClient(api.app)
+    saved, api.diagnosis_batcher = api.diagnosis_batcher, DiagnosisBatcher(api._run_analysis_batch, max_wait_ms=1)
+    try:
+        req = _phr_request("metrics", sppb=8.5)
+        assert client.post("/diagnose/prescription", json=req).status_code == 200
+        assert client.post("/diagnose/prescription", json=req).status_code == 200   # cache hit
+        # No artifacts: the heuristic path
+        heuristic = HybridDiagnosisEngine(ModelRegistry(models_dir=tempfile.mkdtemp()))
+        heuristic.analyze_risk_factors_batch([{"conditions": []}], [{"sppb": 6, "tug": 14.0}])
+        response = client.get("/metrics")
+    finally:
+        api.diagnosis_batcher = saved
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    
+    sample = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{([a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*",?)*\})? '
+                        r'(-?[0-9.]+(?:e[+-]?[0-9]+)?|[+-]Inf|NaN)$')
+    typed, values = {}, {}
+    for line in text.strip().split("\n"):
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert kind in ("counter", "gauge", "histogram") and name not in typed
+            typed[name] = kind
+            continue
+        if line.startswith("# HELP "):
+            continue
+        match = sample.match(line)
+        assert match, line
+        family = re.sub(r"_(bucket|sum|count)$", "", match.group(1))
+        assert match.group(1) in typed or typed.get(family) == "histogram", line
+        values[match.group(1) + (match.group(2) or "")] = float(match.group(4))
+    
+    stage = 'stage="prescription.generate_prescription"'
+    buckets = [v for k, v in values.items() if k.startswith("noricare_stage_seconds_bucket{") and stage in k]
+    assert buckets == sorted(buckets) and buckets[-1] == values["noricare_stage_seconds_count{%s}" % stage] >= 1
+    assert "noricare_stage_seconds_count{stage=\"api.inference\"}" in values
+    assert values['noricare_diagnosis_total{models_used="trained_ml"}'] >= 1
+    assert values['noricare_diagnosis_total{models_used="heuristic"}'] >= 1
+    assert values['noricare_cache_requests_total{result="hit"}'] >= 1
+    assert values['noricare_cache_requests_total{result="miss"}'] >= 1
+    assert values["noricare_batcher_batches_total"] == 1 and values["noricare_batcher_items_total"] == 1
+    assert values['noricare_http_requests_total{path="/diagnose/prescription",status="200"}'] >= 2
+
+
+def test_score_cohort_chunks():
+    """Bulk scoring: chunked CSV (missing column, blank cells, id column) == analyze_risk_factors_batch, 1 or 2 workers."""
+    import csv
+    import tempfile
+    import numpy as np
+    import score_cohort
+    
+    engine = HybridDiagnosisEngine()
+    feature_names = engine.feature_names
+    dropped = "EQ5D_Pain_Discomfort"
+    columns = [name for name in feature_names if name != dropped]
+    rng = np.random.RandomState(12)
+    rows, profiles, health_metrics = [], [], []
+    for i in range(11):
+        values = {name: round(float(rng.uniform(0.5, 1.5)) * engine.FEATURE_DEFAULTS[name], 3) for name in columns}
+        if i % 3 == 0:
+            values["TUG_Time_s"] = ""
+        if i % 4 == 1:
+            values["Grip_Strength_kg"] = ""
+        rows.append({"senior_id": f"s-{i:02d}", **values})
+        profile, measured = {"conditions": []}, {}
+        for name in columns:
+            if values[name] != "":
+                source, key = engine.FEATURE_SOURCES[name]
+                (profile if source == "profile" else measured)[key] = values[name]
+        profiles.append(profile)
+        health_metrics.append(measured)
+    
+    workdir = tempfile.mkdtemp()
+    cohort = os.path.join(workdir, "cohort.csv")
+    with open(cohort, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["senior_id"] + columns[::-1])
+        writer.writeheader()
+        writer.writerows(rows)
+    
+    outputs = {}
+    for workers in (1, 2):
+        output = os.path.join(workdir, f"scores-{workers}.csv")
+        assert score_cohort.score_file(cohort, output, chunk_size=4, workers=workers, id_column="senior_id") == 11
+        with open(output, encoding="utf-8") as f:
+            outputs[workers] = f.read()
+    assert outputs[1] == outputs[2]
+    
+    scored = list(csv.DictReader(outputs[1].splitlines()))
+    expected = engine.analyze_risk_factors_batch(profiles, health_metrics)
+    groups = UserClustering().segment_analyses(expected)
+    assert [row["id"] for row in scored] == [row["senior_id"] for row in rows]
+    for row, analysis, group in zip(scored, expected, groups):
+        assert row["group"] == group and int(row["frail_category"]) == analysis["frail_category"]
+        assert int(row["fall_risk"]) == analysis["fall_risk"]
+        probabilities = [float(row[c]) for c in ("frail_prob_normal", "frail_prob_prefrail", "frail_prob_frail")]
+        assert np.allclose(probabilities, list(analysis["frail_probabilities"].values()), rtol=0, atol=1e-12)
+        for column in ("fall_probability", "functional_score", "disease_risk_score"):
+            assert abs(float(row[column]) - analysis[column]) <= 1e-12
+
+
+def test_training_cache_and_search_budget():
+    """train_models: the feature cache follows the CSV's hash; the search stops within its time budget."""
+    import contextlib
+    import io
+    import tempfile
+    import types
+    import numpy as np
+    import pytest
+    pd = pytest.importorskip("pandas")
+    import train_models
+    
+    workdir = tempfile.mkdtemp()
+    data_path = os.path.join(workdir, "senior_walking_data.csv")
+    rng = np.random.RandomState(8)
+    names = HybridDiagnosisEngine.DEFAULT_FEATURE_NAMES
+    frame = pd.DataFrame({name: rng.uniform(1, 30, 120) for name in names})
+    frame.loc[::7, "TUG_Time_s"] = np.nan
+    frame["FRAIL_Score"] = rng.randint(0, 5, 120)
+    frame["Falls_Last_Year_Count"] = rng.randint(0, 3, 120)
+    frame.to_csv(data_path, index=False)
+    
+    def load(**kwargs):
+        """load_and_preprocess_data() and whether it parsed the CSV (vs. the feature cache)."""
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            loaded = train_models.load_and_preprocess_data(**kwargs)
+        return loaded, "Loading data..." in out.getvalue()
+    
+    saved = train_models.DATA_PATH, train_models.CACHE_DIR
+    train_models.DATA_PATH, train_models.CACHE_DIR = data_path, os.path.join(workdir, ".cache")
+    try:
+        first_key = train_models._feature_cache_path()
+        assert os.path.basename(first_key) == f"features-v{train_models.CACHE_FORMAT}-{train_models._file_hash(data_path)}.npz"
+        (X, y_frail, _, _), parsed = load()
+        assert parsed and os.path.exists(first_key)
+        (cached, cached_frail, _, _), parsed = load()
+        assert not parsed and cached.equals(X) and np.array_equal(cached_frail, y_frail)
+        
+        frame.loc[0, "Grip_Strength_kg"] = 99.0   # a new data drop
+        frame.to_csv(data_path, index=False)
+        assert train_models._feature_cache_path() != first_key
+        (X, _, _, _), parsed = load()
+        assert parsed and X.loc[0, "Grip_Strength_kg"] == 99.0
+        assert load(use_cache=False)[1]
+    finally:
+        train_models.DATA_PATH, train_models.CACHE_DIR = saved
+    
+    # Every perf_counter() call advances a fake clock by 1s: each candidate "takes" 1s
+    built = []
+    def make_model(**params):
+        built.append(params)
+        return train_models.make_fall_model(**params)
+    ticks = iter(range(10**6))
+    real_time = train_models.time
+    train_models.time = types.SimpleNamespace(perf_counter=lambda: float(next(ticks)))
+    try:
+        params, score = train_models.search_hyperparameters(
+            X, y_frail, make_model, train_models.FALL_PARAMS, train_models.FALL_SEARCH_SPACE, 10.0, log=lambda *a: None
+        )
+        assert len(built) == 3 and 0.0 <= score <= 1.0   # candidates ending at t=3, 6, 9; the 4th would end at 12
+        assert params in built and set(params) == {"C"}
+    finally:
+        train_models.time = real_time
+    
+    # Budget smaller than one candidate: only the defaults are scored
+    built.clear()
+    params, score = train_models.search_hyperparameters(
+        X, y_frail, make_model, train_models.FALL_PARAMS, train_models.FALL_SEARCH_SPACE, 1e-6, log=lambda *a: None
+    )
+    assert built == [train_models.FALL_PARAMS] and params == train_models.FALL_PARAMS and np.isfinite(score)
+
+
+def _baseline_prescription(exercises, user_group, conditions, num_exercises=8):
+    """The original per-request filter of PrescriptionEngine (before the index), as exercise ids."""
+    engine = PrescriptionEngine
+    min_intensity, max_intensity = engine.GROUP_INTENSITY_RANGES.get(user_group, (3, 6))
+    suitable = [ex for ex in exercises if min_intensity <= ex["intensity"] <= max_intensity]
+    banned = {name for condition in conditions for name in engine.CONTRAINDICATED.get(condition, [])}
+    safe = [ex for ex in suitable if not any(contra in ex["name"] for contra in banned)]
+    by_type = {"스트레칭": [], "무산소": [], "유산소": []}
+    for ex in safe:
+        if ex["type"] in by_type:
+            by_type[ex["type"]].append(ex)
+    preferences = engine.GROUP_TYPE_PREFERENCES.get(user_group, {"스트레칭": 0.33, "무산소": 0.33, "유산소": 0.34})
+    target = (min_intensity + max_intensity) / 2
+    prescription = []
+    for ex_type, ratio in preferences.items():
+        available = sorted(by_type.get(ex_type, []), key=lambda ex: abs(ex["intensity"] - target))
+        prescription.extend(available[:max(1, int(num_exercises * ratio))])
+    if len(prescription) < num_exercises:
+        remaining = [ex for ex in safe if ex not in prescription]
+        prescription.extend(remaining[:num_exercises - len(prescription)])
+    return [ex["id"] for ex in prescription[:num_exercises]]
+
+
+def test_prescription_index_matches_filter():
+    """Indexed (group, condition set) lookups == the original filter for every group x condition subset, and follow exercises.json edits."""
+    import json
+    import tempfile
+    from itertools import combinations
+    
+    workdir = tempfile.mkdtemp()
+    source = os.path.join(workdir, "exercises.json")
+    with open(PrescriptionEngine().exercises_path, encoding="utf-8") as f:
+        exercises = json.load(f)
+    with open(source, "w", encoding="utf-8") as f:
+        json.dump(exercises, f, ensure_ascii=False)
+    engine = PrescriptionEngine(exercises_path=source, catalog_path=os.path.join(workdir, "none.npy"))
+    
+    groups = list(PrescriptionEngine.GROUP_INTENSITY_RANGES) + ["Unknown group"]
+    known = sorted(PrescriptionEngine.CONTRAINDICATED)
+    def check(exercises):
+        for group in groups:
+            for size in range(len(known) + 1):
+                for conditions in combinations(known, size):
+                    conditions = list(conditions) + (["Asthma"] if size % 2 else [])   # unknown conditions ignored
+                    rx = engine.generate_prescription(group, conditions, mode="ranked")
+                    assert [ex["id"] for ex in rx] == _baseline_prescription(exercises, group, conditions)
+                    assert all(ex["prescribed_for"] == group and ex["safety_checked"] for ex in rx)
+    check(exercises)
+    
+    # Edit exercises.json: the next check_catalog() rebuilds the index
+    edited = [dict(ex, intensity=11 - ex["intensity"]) if ex["type"] == "무산소" else ex for ex in exercises]
+    edited.append({"id": 999, "name": "의자 잡고 까치발", "type": "무산소", "sets": 2, "reps": "10회", "intensity": 7})
+    with open(source, "w", encoding="utf-8") as f:
+        json.dump(edited, f, ensure_ascii=False)
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    version = engine.catalog_version
+    engine._last_catalog_check = float("-inf")
+    engine.check_catalog()
+    assert engine.catalog_version == version + 1
+    assert _baseline_prescription(edited, "Normal", []) != _baseline_prescription(exercises, "Normal", [])
+    check(edited)
+
+
+def test_prescriptions_are_copies():
+    """Each response is a fresh copy: editing one leaves the catalog records and other users' responses untouched."""
+    import copy
+    from core.prescription import Exercise
+    
+    engine = PrescriptionEngine()
+    fields = set(Exercise._fields)
+    for mode in ("ranked", "optimized"):
+        first = engine.generate_prescription("Sarcopenic", [], mode=mode, variety_key="senior-1")
+        snapshot = copy.deepcopy(first)
+        for ex in first:   # e.g. client code editing its response in place
+            ex["intensity"], ex["prescribed_for"], ex["note"] = 99, "tampered", "edited"
+            del ex["safety_checked"]
+        
+        again = engine.generate_prescription("Sarcopenic", [], mode=mode, variety_key="senior-1")
+        other = engine.generate_prescription("Normal", [], mode=mode, variety_key="senior-2")
+        assert again == snapshot
+        for ex in again + other:
+            assert ex["safety_checked"] is True and ex["intensity"] != 99 and "note" not in ex
+        assert all(ex["prescribed_for"] == "Normal" for ex in other)
+        
+        for ex in snapshot:
+            record = engine.get_exercise_by_id(ex["id"])
+            assert set(record) == fields and record["intensity"] == ex["intensity"]
+            record["intensity"] = 99   # lookups are copies too
+            assert engine.get_exercise_by_id(ex["id"])["intensity"] == ex["intensity"]
+    
+    assert all(isinstance(record, Exercise) and record.intensity != 99 for record in engine.exercises)
+    try:
+        engine.exercises[0].intensity = 99
+        assert False, "catalog records must be immutable"
+    except AttributeError:
+        pass
+    
+    missing = max(record.id for record in engine.exercises) + 1
+    assert engine.get_exercise_by_id(missing) is None
+    assert engine.get_exercise_by_id(-1) is None
+
+
+def test_write_behind_persistence():
+    """Write-behind queue: every submitted row lands once, from many threads, in batched transactions; bad rows are isolated."""
+    import sqlite3
+    import tempfile
+    import threading
+    from core.persistence import ConnectionPool, SQLiteBackend, WriteBehindWriter, create_tables
+    
+    path = os.path.join(tempfile.mkdtemp(), "noricare.db")
+    pool = ConnectionPool(SQLiteBackend(path), size=2)
+    create_tables(pool)
+    writer = WriteBehindWriter(pool, flush_interval=0.01, batch_rows=64)
+    exercises = [
+        {"id": 1, "name": "벽 밀기", "type": "무산소", "sets": 2, "reps": "10회", "intensity": 3},
+        {"id": 2, "name": "제자리 걷기", "type": "유산소", "sets": 1, "reps": "5분", "intensity": 2},
+    ]
+    
+    ids = []
+    def produce(worker):
+        for i in range(100):
+            ids.extend(writer.record_prescriptions(f"senior-{worker}-{i}", exercises))
+    threads = [threading.Thread(target=produce, args=(w,)) for w in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    event = {"id": "log-1", "seniorId": "senior-0-0", "prescriptionId": ids[0],
+             "loggedAt": "2026-01-05T09:30:00", "rpeScore": 7, "satisfaction": 4}
+    writer.record_feedback([event, event])   # re-sent rows are ignored
+    anonymous = {**event, "id": None, "loggedAt": "2026-01-05T18:30:00+09:00"}
+    writer.record_feedback([anonymous])
+    writer.record_feedback([{**anonymous, "loggedAt": "2026-01-05T09:30:00Z"}])   # same event, re-synced
+    writer.flush()
+    
+    # One bad row (a value the driver cannot bind) only loses itself
+    bad = ("log-bad", "senior-1-0", None, 0, False, object(), 5, 3, True)
+    good = [(f"log-ok-{i}", "senior-1-0", None, 0, False, None, 5, 3, True) for i in range(10)]
+    writer.submit("FeedbackLog", good[:5] + [bad] + good[5:])
+    writer.close()
+    
+    stats = writer.stats()
+    assert stats["written"] == 814 and stats["dropped"] == 0 and stats["failed"] == 1
+    assert stats["flushes"] < 815
+    conn = sqlite3.connect(path)
+    assert conn.execute('SELECT COUNT(DISTINCT "id") FROM "ExercisePrescription"').fetchone()[0] == 800
+    assert conn.execute(
+        'SELECT "category", "repCount", "durationMin" FROM "ExercisePrescription" WHERE "id" = ?', (ids[1],)
+    ).fetchone() == ("AEROBIC", 1, 5)
+    assert conn.execute('SELECT COUNT(*) FROM "FeedbackLog"').fetchone()[0] == 12
+
+
+def test_compiled_catalog_bitmasks():
+    """Compiled catalog: mmap load without row conversion, bitmask filter == substring rules, stale catalogs rejected."""
+    import json
+    import tempfile
+    from itertools import combinations
+    import numpy as np
+    from core.catalog import ExerciseCatalog
+    
+    rules = PrescriptionEngine.CONTRAINDICATED
+    workdir = tempfile.mkdtemp()
+    source = os.path.join(workdir, "exercises.json")
+    output = os.path.join(workdir, "exercise_catalog.npy")
+    with open(PrescriptionEngine().exercises_path, encoding="utf-8") as f:
+        exercises = json.load(f)
+    with open(source, "w", encoding="utf-8") as f:
+        json.dump(exercises, f, ensure_ascii=False)
+    ExerciseCatalog.compile(exercises, rules).save(output, source_path=source, contraindicated=rules)
+    
+    catalog = ExerciseCatalog.load(output, source, rules)
+    assert isinstance(catalog.rows, np.memmap) and len(catalog) == len(exercises)
+    assert catalog.rows["name"].tolist() == [ex["name"] for ex in exercises]
+    
+    for size in range(3):
+        for conditions in combinations(sorted(rules) + ["Unknown"], size):
+            banned = [name for condition in conditions for name in rules.get(condition, [])]
+            expected = [not any(contra in ex["name"] for contra in banned) for ex in exercises]
+            assert catalog.safe(conditions).tolist() == expected
+    
+    engine = PrescriptionEngine(exercises_path=source, catalog_path=output)
+    assert isinstance(engine.catalog.rows, np.memmap)
+    assert engine.safe_mask(["Arthritis"]).tolist() == catalog.safe(["Arthritis"]).tolist()
+    # Loading converts no rows; only prescribed exercises become records
+    assert len(engine.exercises._built) == 0
+    rx = engine.generate_prescription("Frail", ["Arthritis"])
+    assert len(engine.exercises._built) == len(rx)
+    assert [ex.id for ex in engine.exercises] == [ex["id"] for ex in exercises]
+    assert engine.get_exercise_by_id(exercises[3]["id"])["name"] == exercises[3]["name"]
+    
+    # Editing the source or the rules invalidates the compiled file
+    assert ExerciseCatalog.load(output, source, {**rules, "Diabetes": ["걷기"]}) is None
+    with open(source, "w", encoding="utf-8") as f:
+        json.dump(exercises[:-1], f, ensure_ascii=False)
+    assert ExerciseCatalog.load(output, source, rules) is None
+    assert len(PrescriptionEngine(exercises_path=source, catalog_path=output).exercises) == len(exercises) - 1
+
+
+def test_routine_optimizer_constraints():
+    """Optimized prescriptions: budgets and type ratios hold, DP matches brute force, keys vary routines."""
+    import random
+    from itertools import combinations
+    import numpy as np
+    from core.catalog import ExerciseCatalog
+    from core.knapsack import RoutineOptimizer, exercise_minutes, type_counts
+    
+    engine = PrescriptionEngine()
+    for group in UserClustering.GROUPS:
+        low, high = engine.GROUP_INTENSITY_RANGES[group]
+        routines = set()
+        for user in range(5):
+            rx = engine.generate_prescription(group, ["Arthritis"], mode="optimized", variety_key=f"user-{user}")
+            assert len(rx) == 8
+            assert sum(exercise_minutes(ex["sets"], ex["reps"]) for ex in rx) <= engine.GROUP_SESSION_MINUTES[group]
+            assert sum(ex["intensity"] for ex in rx) <= int(8 * (low + high) / 2)
+            assert all(low <= ex["intensity"] <= high for ex in rx)
+            assert not any(contra in ex["name"] for ex in rx for contra in engine.CONTRAINDICATED["Arthritis"])
+            counts = type_counts(8, engine.GROUP_TYPE_PREFERENCES[group])
+            assert all(sum(ex["type"] == t for ex in rx) == n for t, n in counts.items())
+            routines.add(tuple(ex["id"] for ex in rx))
+        assert len(routines) > 1
+    tight = engine.generate_prescription("Normal", [], mode="optimized", session_minutes=10)
+    assert 0 < len(tight) < 8 and sum(exercise_minutes(ex["sets"], ex["reps"]) for ex in tight) <= 10
+    # Oversized budgets are clamped to what the candidates can use: same routine, no huge table
+    loose = engine.generate_prescription("Normal", [], mode="optimized", session_minutes=2000, max_total_intensity=2000)
+    assert loose == engine.generate_prescription("Normal", [], mode="optimized", session_minutes=400, max_total_intensity=80)
+    try:
+        engine.generate_prescription("Normal", [], mode="optimized", session_minutes=0)
+        assert False, "non-positive budget accepted"
+    except ValueError:
+        pass
+    
+    # Exactness: same objective as exhaustive search over the same candidates
+    types = ["스트레칭", "무산소", "유산소"]
+    ratios = {"스트레칭": 0.4, "무산소": 0.3, "유산소": 0.3}
+    for seed in range(20):
+        rng = random.Random(seed)
+        exercises = [
+            {"id": i + 1, "name": f"w{rng.randint(0, 6)} w{rng.randint(0, 6)}", "type": rng.choice(types),
+             "sets": rng.randint(1, 3), "reps": rng.choice(["10회", "20보", "30초", "2분", "1분"]),
+             "intensity": rng.randint(1, 10)}
+            for i in range(16)
+        ]
+        optimizer = RoutineOptimizer(ExerciseCatalog.compile(exercises, {"A": ["w1"]}))
+        optimizer.CANDIDATE_FACTOR = 100   # no pruning: compare the DP alone
+        budget, cap, key = rng.randint(6, 20), rng.randint(12, 26), str(seed)
+        chosen = optimizer.optimize((3, 8), ratios, 4, budget, cap, ["A"], key)
+        
+        score = 1.0 - np.abs(optimizer.intensity - 5.5) / 3.5 + optimizer.VARIETY_WEIGHT * optimizer.variety(key)
+        safe = optimizer.catalog.safe(["A"])
+        eligible = [i for i in range(16) if safe[i] and 3 <= exercises[i]["intensity"] <= 8
+                    and optimizer.minutes[i] <= budget]
+        best_of_family = {}
+        for i in sorted(eligible, key=lambda i: (-score[i], i)):
+            best_of_family.setdefault((exercises[i]["type"], optimizer.family[i]), i)
+        available = {t: sum(exercises[i]["type"] == t for i in eligible) for t in types}
+        best = None
+        for n in range(4, 0, -1):
+            wanted = optimizer._feasible_counts(type_counts(n, ratios), available)
+            for combo in combinations(sorted(best_of_family.values()), n):
+                if (all(sum(exercises[i]["type"] == t for i in combo) == c for t, c in wanted.items())
+                        and sum(optimizer.minutes[i] for i in combo) <= budget
+                        and sum(exercises[i]["intensity"] for i in combo) <= cap):
+                    value = sum(score[i] for i in combo)
+                    if best is None or value > best[0] + 1e-12:
+                        best = (value, combo)
+            if best is not None:
+                break
+        if best is None:
+            assert chosen == []
+        else:
+            assert len(chosen) == len(best[1]) and abs(sum(score[i] for i in chosen) - best[0]) < 1e-9
+
+
 if __name__ == "__main__":
     test_ai_engine()
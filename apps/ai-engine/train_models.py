@@ -5,20 +5,98 @@ Train FRAIL classification and Fall Risk prediction models
 
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import ParameterGrid, StratifiedKFold, cross_val_score, train_test_split
+from sklearn.pipeline import make_pipeline
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
 from sklearn.linear_model import LogisticRegression
+from sklearn.neural_network import MLPClassifier
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.metrics import classification_report, accuracy_score, confusion_matrix
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import hashlib
+import io
 import joblib
 import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from core.forest import FlatForest
+from core.imputation import NeighborImputer
+from core.mlp import NumpyMLP
+from core.feedback import OptimizationLoop
+from core.clustering import UserClustering
 
 # Paths
 DATA_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'senior_walking_data.csv')
 MODELS_DIR = os.path.join(os.path.dirname(__file__), 'models')
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '.cache')
+
+# Bump when the preprocessing below changes so old feature caches are ignored
+CACHE_FORMAT = 1
+
+# Default hyperparameters (overridden by --search)
+FRAIL_PARAMS = {'n_estimators': 100, 'max_depth': 10, 'min_samples_split': 5}
+FALL_PARAMS = {'C': 1.0}
+OPTIMIZER_PARAMS = {'hidden_layer_sizes': (16, 16), 'alpha': 1e-4, 'max_iter': 3000}
+
+# Search spaces for --search
+FRAIL_SEARCH_SPACE = {
+    'n_estimators': [50, 100, 200],
+    'max_depth': [6, 8, 10, 14, None],
+    'min_samples_split': [2, 5, 10],
+}
+FALL_SEARCH_SPACE = {
+    'C': [0.01, 0.03, 0.1, 0.3, 1.0, 3.0, 10.0],
+}
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def _feature_cache_path():
+    return os.path.join(CACHE_DIR, f"features-v{CACHE_FORMAT}-{_file_hash(DATA_PATH)}.npz")
+
+
+def _load_feature_cache(path):
+    """Columns, targets and feature names from a cache written by _save_feature_cache."""
+    with np.load(path, allow_pickle=False) as cached:
+        feature_names = [str(name) for name in cached['feature_names']]
+        X = pd.DataFrame({name: cached[f'col:{name}'] for name in feature_names})
+        y_frail = pd.Series(cached['y_frail'], name='FRAIL_Score')
+        y_fall = pd.Series(cached['y_fall'], name='Falls_Last_Year_Count')
+    return X, y_frail, y_fall, feature_names
+
+
+def _save_feature_cache(path, X, y_frail, y_fall, feature_names):
+    """One array per column, so a reload is a few memcpys instead of a CSV parse."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    arrays = {f'col:{name}': X[name].to_numpy() for name in feature_names}
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, feature_names=np.array(feature_names), y_frail=y_frail.to_numpy(),
+             y_fall=y_fall.to_numpy(), **arrays)
+    os.replace(tmp_path, path)
 
-def load_and_preprocess_data():
-    """Load and preprocess the senior walking data."""
+
+def load_and_preprocess_data(use_cache=True):
+    """
+    Load and preprocess the senior walking data.
+    The parsed feature matrix is cached in .cache/ under the CSV's hash,
+    so it is only re-parsed when the data file changes.
+    """
+    cache_path = _feature_cache_path() if use_cache else None
+    if cache_path and os.path.exists(cache_path):
+        X, y_frail, y_fall, feature_names = _load_feature_cache(cache_path)
+        print(f"Loaded {len(X)} rows from feature cache {os.path.basename(cache_path)}")
+        return X, y_frail, y_fall, feature_names
+    
     print("Loading data...")
     df = pd.read_csv(DATA_PATH)
     print(f"Loaded {len(df)} rows, {len(df.columns)} columns")
@@ -53,64 +131,84 @@ def load_and_preprocess_data():
     # Create fall risk target (binary: 0=no falls, 1=has falls)
     y_fall = (df['Falls_Last_Year_Count'] > 0).astype(int)
     
+    if cache_path:
+        _save_feature_cache(cache_path, X, y_frail, y_fall, numeric_features)
+    
     return X, y_frail, y_fall, numeric_features
 
 
-def train_frail_classifier(X, y):
+def _split(X, y):
+    """The train/test split shared by training and the hyperparameter search."""
+    return train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+
+
+def make_frail_classifier(n_jobs=None, **params):
+    return RandomForestClassifier(
+        **{**FRAIL_PARAMS, **params},
+        random_state=42,
+        class_weight='balanced',
+        n_jobs=n_jobs
+    )
+
+
+def make_fall_model(**params):
+    return LogisticRegression(
+        **{**FALL_PARAMS, **params},
+        max_iter=1000,
+        class_weight='balanced',
+        random_state=42
+    )
+
+
+def train_frail_classifier(X, y, params=None, log=print):
     """Train FRAIL classification model using Random Forest."""
-    print("\n" + "="*50)
-    print("Training FRAIL Classification Model")
-    print("="*50)
+    log("\n" + "="*50)
+    log("Training FRAIL Classification Model")
+    log("="*50)
     
     # Split data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
+    X_train, X_test, y_train, y_test = _split(X, y)
     
     # Scale features
     scaler = StandardScaler()
     X_train_scaled = scaler.fit_transform(X_train)
     X_test_scaled = scaler.transform(X_test)
     
-    # Train Random Forest
-    model = RandomForestClassifier(
-        n_estimators=100,
-        max_depth=10,
-        min_samples_split=5,
-        random_state=42,
-        class_weight='balanced'
-    )
+    # Train Random Forest (trees are built on all cores)
+    model = make_frail_classifier(n_jobs=-1, **(params or {}))
     model.fit(X_train_scaled, y_train)
+    # Serving scores one row at a time; a parallel predict would only add overhead
+    model.n_jobs = None
     
     # Evaluate
     y_pred = model.predict(X_test_scaled)
     accuracy = accuracy_score(y_test, y_pred)
     
-    print(f"\nAccuracy: {accuracy:.4f}")
-    print("\nClassification Report:")
-    print(classification_report(y_test, y_pred, 
+    log(f"\nParameters: {model.n_estimators} trees, "
+        f"max_depth={model.max_depth}, min_samples_split={model.min_samples_split}")
+    log(f"\nAccuracy: {accuracy:.4f}")
+    log("\nClassification Report:")
+    log(classification_report(y_test, y_pred, 
         target_names=['Normal', 'Pre-frail', 'Frail']))
     
-    print("\nFeature Importances:")
+    log("\nFeature Importances:")
     for name, importance in sorted(
         zip(X.columns, model.feature_importances_), 
         key=lambda x: x[1], reverse=True
     )[:5]:
-        print(f"  {name}: {importance:.4f}")
+        log(f"  {name}: {importance:.4f}")
     
     return model, scaler
 
 
-def train_fall_risk_model(X, y):
+def train_fall_risk_model(X, y, params=None, log=print):
     """Train Fall Risk prediction model using Logistic Regression."""
-    print("\n" + "="*50)
-    print("Training Fall Risk Prediction Model")
-    print("="*50)
+    log("\n" + "="*50)
+    log("Training Fall Risk Prediction Model")
+    log("="*50)
     
     # Split data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
+    X_train, X_test, y_train, y_test = _split(X, y)
     
     # Scale features
     scaler = StandardScaler()
@@ -118,26 +216,112 @@ def train_fall_risk_model(X, y):
     X_test_scaled = scaler.transform(X_test)
     
     # Train Logistic Regression
-    model = LogisticRegression(
-        max_iter=1000,
-        class_weight='balanced',
-        random_state=42
-    )
+    model = make_fall_model(**(params or {}))
     model.fit(X_train_scaled, y_train)
     
     # Evaluate
     y_pred = model.predict(X_test_scaled)
     accuracy = accuracy_score(y_test, y_pred)
     
-    print(f"\nAccuracy: {accuracy:.4f}")
-    print("\nClassification Report:")
-    print(classification_report(y_test, y_pred,
+    log(f"\nParameters: C={model.C}")
+    log(f"\nAccuracy: {accuracy:.4f}")
+    log("\nClassification Report:")
+    log(classification_report(y_test, y_pred,
         target_names=['No Falls', 'Has Falls']))
     
     return model, scaler
 
 
-def save_models(frail_model, frail_scaler, fall_model, fall_scaler, feature_names):
+def search_hyperparameters(X, y, make_model, defaults, space, time_budget, log=print):
+    """
+    Randomized, cross-validated search over `space` on the training split.
+    The defaults are scored first, then the remaining grid points in random
+    order until the next candidate would exceed `time_budget` seconds.
+    Folds run in parallel; features are scaled inside each fold.
+    Returns (best_params, best_score).
+    """
+    X_train, _, y_train, _ = _split(X, y)
+    cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
+    
+    candidates = [dict(params) for params in ParameterGrid(space) if params != defaults]
+    random.Random(42).shuffle(candidates)
+    candidates.insert(0, dict(defaults))
+    
+    start = time.perf_counter()
+    best_params, best_score = defaults, -np.inf
+    slowest = 0.0
+    tried = 0
+    
+    for params in candidates:
+        elapsed = time.perf_counter() - start
+        if tried and elapsed + slowest > time_budget:
+            break
+        
+        t0 = time.perf_counter()
+        scores = cross_val_score(
+            make_pipeline(StandardScaler(), make_model(**params)),
+            X_train, y_train, cv=cv, scoring='balanced_accuracy', n_jobs=-1
+        )
+        slowest = max(slowest, time.perf_counter() - t0)
+        tried += 1
+        
+        if scores.mean() > best_score:
+            best_params, best_score = params, scores.mean()
+    
+    log(f"  {tried}/{len(candidates)} candidates in {time.perf_counter() - start:.1f}s, "
+        f"best balanced accuracy {best_score:.4f}: {best_params}")
+    return best_params, best_score
+
+
+def _buffered():
+    """A log function that collects lines, so concurrent jobs don't interleave output."""
+    lines = []
+    return lines, lambda text="": lines.append(str(text))
+
+
+def train_all(X, y_frail, y_fall, search=False, time_budget=60.0, frail_params=None):
+    """
+    Fit the FRAIL and fall models concurrently (scikit-learn releases the GIL
+    in the heavy loops). With search=True, each model first gets a CV
+    hyperparameter search; both searches share the same wall-clock budget.
+    Explicit frail_params (a --compact candidate) are used as given, never searched.
+    """
+    search_frail = search and frail_params is None
+    frail_params, fall_params = {**FRAIL_PARAMS, **(frail_params or {})}, FALL_PARAMS
+    
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        if search:
+            print(f"\nSearching hyperparameters (budget {time_budget:.0f}s)...")
+            frail_lines, frail_log = _buffered()
+            fall_lines, fall_log = _buffered()
+            if search_frail:
+                frail_search = pool.submit(
+                    search_hyperparameters, X, y_frail, make_frail_classifier,
+                    FRAIL_PARAMS, FRAIL_SEARCH_SPACE, time_budget, frail_log
+                )
+            fall_search = pool.submit(
+                search_hyperparameters, X, y_fall, make_fall_model,
+                FALL_PARAMS, FALL_SEARCH_SPACE, time_budget, fall_log
+            )
+            if search_frail:
+                frail_params, _ = frail_search.result()
+                print("\n".join(["FRAIL classifier:"] + frail_lines))
+            fall_params, _ = fall_search.result()
+            print("\n".join(["Fall risk model:"] + fall_lines))
+        
+        frail_lines, frail_log = _buffered()
+        fall_lines, fall_log = _buffered()
+        frail_job = pool.submit(train_frail_classifier, X, y_frail, frail_params, frail_log)
+        fall_job = pool.submit(train_fall_risk_model, X, y_fall, fall_params, fall_log)
+        frail_model, frail_scaler = frail_job.result()
+        fall_model, fall_scaler = fall_job.result()
+    
+    print("\n".join(frail_lines + fall_lines))
+    return frail_model, frail_scaler, fall_model, fall_scaler
+
+
+def save_models(frail_model, frail_scaler, fall_model, fall_scaler, feature_names,
+                quantize=False, imputer=None, optimizer=None):
     """Save trained models to disk."""
     os.makedirs(MODELS_DIR, exist_ok=True)
     
@@ -147,18 +331,257 @@ def save_models(frail_model, frail_scaler, fall_model, fall_scaler, feature_name
     joblib.dump(fall_model, os.path.join(MODELS_DIR, 'fall_risk_model.pkl'))
     joblib.dump(fall_scaler, os.path.join(MODELS_DIR, 'fall_scaler.pkl'))
     joblib.dump(feature_names, os.path.join(MODELS_DIR, 'feature_names.pkl'))
+    export_flat_forest(frail_model, quantize=quantize)
+    if imputer is not None:
+        export_imputer(imputer)
+    if optimizer is not None:
+        export_optimizer(optimizer)
     
     print(f"\n[OK] Models saved to {MODELS_DIR}")
 
 
+def export_flat_forest(frail_model=None, quantize=False):
+    """
+    Flatten the FRAIL RandomForest into contiguous node arrays (core/forest.py)
+    and verify the flat evaluator reproduces predict_proba (FlatForest.matches:
+    to the last bits, or float32 precision with quantize=True).
+    """
+    if frail_model is None:
+        frail_model = joblib.load(os.path.join(MODELS_DIR, 'frail_classifier.pkl'))
+    
+    forest = FlatForest.from_sklearn(frail_model)
+    if quantize:
+        forest = forest.quantize()
+    
+    # Parity check on random standardized inputs
+    X_check = np.random.RandomState(0).normal(size=(512, frail_model.n_features_in_))
+    if not forest.matches(forest.predict_proba(X_check), frail_model.predict_proba(X_check)):
+        raise RuntimeError("Flat forest does not match RandomForestClassifier.predict_proba")
+    
+    path = os.path.join(MODELS_DIR, 'frail_forest.pkl')
+    joblib.dump(forest.to_arrays(), path)
+    print(f"[OK] Flat forest exported: {len(forest.feature)} nodes, "
+          f"{len(forest.roots)} trees, max_depth={forest.max_depth} -> {path}")
+
+
+def fit_imputer(X, feature_names):
+    """k-NN imputer for features missing at inference time (core/imputation.py)."""
+    imputer = NeighborImputer(n_neighbors=5).fit(X[feature_names].to_numpy(), feature_names)
+    
+    # Sanity check on the precomputed patterns: keep one column per row, impute the rest
+    X_check = X[feature_names].to_numpy()[:200].copy()
+    keep = np.eye(len(feature_names), dtype=bool)[np.arange(200) % len(feature_names)]
+    X_check[~keep] = np.nan
+    imputed = imputer.transform(X_check)
+    if np.isnan(imputed).any():
+        raise RuntimeError("Imputer left missing values")
+    return imputer
+
+
+def export_imputer(imputer):
+    path = os.path.join(MODELS_DIR, 'imputer.pkl')
+    joblib.dump(imputer, path)
+    print(f"[OK] Imputer exported: k={imputer.n_neighbors}, {len(imputer.data_)} reference rows, "
+          f"{len(imputer.trees_)} precomputed KD-trees -> {path}")
+
+
+def load_feedback_history(path):
+    """
+    Feedback history for the intensity optimizer: a CSV export of FeedbackLog
+    rows joined with the prescription's intensity at that time. Columns:
+    rpeScore, hasPain, satisfaction, intensity, delta (intensity change the
+    coach/next session applied) and, optionally, group (user group).
+    """
+    df = pd.read_csv(path)
+    required = ['rpeScore', 'hasPain', 'satisfaction', 'intensity', 'delta']
+    missing = [column for column in required if column not in df.columns]
+    if missing:
+        raise SystemExit(f"Error: {path} is missing columns: {', '.join(missing)}")
+    has_pain = df['hasPain'].astype(str).str.lower().isin(['1', 'true', 'yes'])
+    group = df['group'].to_numpy(dtype=object) if 'group' in df.columns else None
+    X = OptimizationLoop.feature_matrix(df['rpeScore'], has_pain, df['satisfaction'], df['intensity'], group)
+    return X, df['delta'].to_numpy(dtype=int)
+
+
+def bootstrap_feedback_history():
+    """
+    Without recorded history: every (rpe, pain, satisfaction, intensity, group)
+    combination labelled by OptimizationLoop.rule_deltas, so the MLP starts
+    out reproducing the hand-written rule. Group None (all-zero one-hot) is
+    included: /optimize/feedback and FeedbackStateStore may not know it.
+    """
+    rpe, pain, satisfaction, intensity, group = (g.ravel() for g in np.meshgrid(
+        np.arange(1, 11), [False, True], np.arange(1, 6),
+        np.arange(OptimizationLoop.MIN_INTENSITY, OptimizationLoop.MAX_INTENSITY + 1),
+        np.array(list(UserClustering.GROUPS) + [None], dtype=object), indexing='ij'
+    ))
+    X = OptimizationLoop.feature_matrix(rpe, pain, satisfaction, intensity, group)
+    return X, OptimizationLoop.rule_deltas(rpe, pain, satisfaction)
+
+
+def train_optimizer(history_path=None):
+    """
+    Small MLP mapping feedback + current intensity + group to an intensity
+    delta, exported as plain weight arrays (core/mlp.py) for numpy-only inference.
+    """
+    if history_path:
+        X, y = load_feedback_history(history_path)
+        source = history_path
+    else:
+        X, y = bootstrap_feedback_history()
+        source = "rule bootstrap"
+    
+    scaler = StandardScaler().fit(X)
+    model = MLPClassifier(activation='relu', random_state=42, **OPTIMIZER_PARAMS)
+    model.fit(scaler.transform(X), y)
+    mlp = NumpyMLP.from_sklearn(model, scaler)
+    
+    # The numpy forward pass must give the same labels as sklearn
+    if not np.array_equal(mlp.predict(X), model.predict(scaler.transform(X))):
+        raise RuntimeError("NumPy MLP does not match MLPClassifier.predict")
+    
+    accuracy = accuracy_score(y, mlp.predict(X))
+    print(f"\n[Optimizer] {len(X)} samples ({source}), layers "
+          f"{[w.shape[1] for w in mlp.weights]}, training accuracy {accuracy:.4f}")
+    return mlp
+
+
+def export_optimizer(mlp):
+    path = os.path.join(MODELS_DIR, 'mlp_optimizer.pkl')
+    joblib.dump(mlp.to_arrays(), path)
+    print(f"[OK] Optimizer MLP exported: {sum(w.size + b.size for w, b in zip(mlp.weights, mlp.biases))} "
+          f"weights -> {path}")
+
+
+# --compact candidates: name -> RandomForest overrides. Each is reported
+# with float64 and quantized (float32, narrow index) flat forests.
+COMPACT_CANDIDATES = {
+    'baseline': {},
+    '50-trees': {'n_estimators': 50},
+    '25-trees': {'n_estimators': 25},
+    '100-trees-128-leaves': {'max_leaf_nodes': 128},
+    '50-trees-64-leaves': {'n_estimators': 50, 'max_leaf_nodes': 64},
+    '50-trees-depth-6': {'n_estimators': 50, 'max_depth': 6},
+}
+
+
+def _dumped_size(obj):
+    buffer = io.BytesIO()
+    joblib.dump(obj, buffer)
+    return buffer.tell()
+
+
+def _single_row_latency(predict, X, calls=300):
+    """Median seconds for one-row predict_proba calls."""
+    samples = []
+    for i in range(calls):
+        row = X[i % len(X)][np.newaxis, :]
+        t0 = time.perf_counter()
+        predict(row)
+        samples.append(time.perf_counter() - t0)
+    return float(np.median(samples))
+
+
+def compare_compaction(X, y):
+    """
+    Fit every COMPACT_CANDIDATES forest on the usual split and print test
+    accuracy (and delta vs. baseline), artifact sizes and single-row latency
+    side by side. Returns the rows of the table.
+    """
+    X_train, X_test, y_train, y_test = _split(X, y)
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+    y_test = np.asarray(y_test)
+    
+    rows = []
+    for name, params in COMPACT_CANDIDATES.items():
+        model = make_frail_classifier(n_jobs=-1, **params)
+        model.fit(X_train_scaled, y_train)
+        model.n_jobs = None
+        classifier_size = _dumped_size(model)
+        sklearn_latency = _single_row_latency(model.predict_proba, X_test_scaled, calls=50)
+        
+        flat = FlatForest.from_sklearn(model)
+        for quantize in (False, True):
+            forest = flat.quantize() if quantize else flat
+            rows.append({
+                'name': name + ('+f32' if quantize else ''),
+                'accuracy': accuracy_score(y_test, forest.predict(X_test_scaled)),
+                'nodes': len(forest.feature),
+                'classifier_kb': classifier_size / 1024,
+                'forest_kb': _dumped_size(forest.to_arrays()) / 1024,
+                'flat_us': _single_row_latency(forest.predict_proba, X_test_scaled) * 1e6,
+                'sklearn_us': sklearn_latency * 1e6,
+            })
+    
+    baseline = rows[0]['accuracy']
+    print("\n" + "="*50)
+    print("FRAIL Classifier Compaction")
+    print("="*50)
+    print(f"\n{'candidate':<26}{'accuracy':>9}{'delta':>8}{'nodes':>8}"
+          f"{'classifier.pkl':>16}{'forest.pkl':>12}{'flat p50':>10}{'sklearn p50':>13}")
+    for row in rows:
+        print(f"{row['name']:<26}{row['accuracy']:>9.4f}{row['accuracy'] - baseline:>+8.4f}"
+              f"{row['nodes']:>8}{row['classifier_kb']:>13.0f} KB{row['forest_kb']:>9.0f} KB"
+              f"{row['flat_us']:>8.0f}us{row['sklearn_us']:>11.0f}us")
+    print("\nSave one with: python train_models.py --compact --pick <candidate>")
+    return rows
+
+
 def main():
     """Main training pipeline."""
+    parser = argparse.ArgumentParser(description="Train Noricare AI models")
+    parser.add_argument('--export-flat', action='store_true',
+                        help="Only re-export frail_forest.pkl from the saved frail_classifier.pkl")
+    parser.add_argument('--export-imputer', action='store_true',
+                        help="Only refit and save imputer.pkl from the training data")
+    parser.add_argument('--export-optimizer', action='store_true',
+                        help="Only retrain and save the intensity optimizer (mlp_optimizer.pkl)")
+    parser.add_argument('--feedback-history', metavar='CSV',
+                        help="Feedback history for the optimizer (default: distill the built-in rule)")
+    parser.add_argument('--search', action='store_true',
+                        help="Cross-validated hyperparameter search before the final fit")
+    parser.add_argument('--time-budget', type=float, default=60.0,
+                        help="Wall-clock seconds allowed for --search (default 60)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Re-parse the CSV even if a cached feature matrix exists")
+    parser.add_argument('--compact', action='store_true',
+                        help="Compare smaller FRAIL forests (accuracy, size, latency) instead of training")
+    parser.add_argument('--pick', metavar='CANDIDATE',
+                        help="With --compact: train and save this candidate (suffix +f32 to quantize)")
+    args = parser.parse_args()
+    
+    if args.export_flat:
+        export_flat_forest()
+        return
+    
+    if args.export_optimizer:
+        export_optimizer(train_optimizer(args.feedback_history))
+        return
+    
+    frail_params, quantize = None, False
+    if args.pick:
+        if not args.compact:
+            parser.error("--pick requires --compact")
+        if args.search:
+            parser.error("--pick trains the chosen candidate as is; drop --search")
+        name = args.pick[:-len('+f32')] if args.pick.endswith('+f32') else args.pick
+        if name not in COMPACT_CANDIDATES:
+            parser.error(f"unknown candidate {args.pick!r}, choose from: {', '.join(COMPACT_CANDIDATES)}")
+        frail_params, quantize = COMPACT_CANDIDATES[name], args.pick.endswith('+f32')
+    
     print("="*60)
     print("  Noricare AI Engine - Model Training")
     print("="*60)
     
     # Load data
-    X, y_frail, y_fall, feature_names = load_and_preprocess_data()
+    start = time.perf_counter()
+    X, y_frail, y_fall, feature_names = load_and_preprocess_data(use_cache=not args.no_cache)
+    
+    if args.export_imputer:
+        export_imputer(fit_imputer(X, feature_names))
+        return
     
     print(f"\nTarget Distribution (FRAIL):")
     print(f"  Normal (0): {(y_frail == 0).sum()}")
@@ -169,15 +592,25 @@ def main():
     print(f"  No Falls: {(y_fall == 0).sum()}")
     print(f"  Has Falls: {(y_fall == 1).sum()}")
     
-    # Train models
-    frail_model, frail_scaler = train_frail_classifier(X, y_frail)
-    fall_model, fall_scaler = train_fall_risk_model(X, y_fall)
+    if args.compact and not args.pick:
+        compare_compaction(X, y_frail)
+        return
+    
+    # Train models (concurrently)
+    frail_model, frail_scaler, fall_model, fall_scaler = train_all(
+        X, y_frail, y_fall, search=args.search, time_budget=args.time_budget,
+        frail_params=frail_params
+    )
+    
+    imputer = fit_imputer(X, feature_names)
+    optimizer = train_optimizer(args.feedback_history)
     
     # Save models
-    save_models(frail_model, frail_scaler, fall_model, fall_scaler, feature_names)
+    save_models(frail_model, frail_scaler, fall_model, fall_scaler, feature_names,
+                quantize=quantize, imputer=imputer, optimizer=optimizer)
     
     print("\n" + "="*60)
-    print("  Training Complete!")
+    print(f"  Training Complete! ({time.perf_counter() - start:.1f}s)")
     print("="*60)
 
 